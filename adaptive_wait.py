@@ -0,0 +1,147 @@
+"""
+Adaptive element waits.
+
+Drop-in for `WebDriverWait(driver, N).until(cond)` that learns, per device
+and per step, how long the element takes to appear. Once enough samples
+exist the timeout becomes a high percentile plus a margin (never above the
+old constant), and polling is dense around the expected arrival time and
+sparse elsewhere. Models are saved per device under WAIT_MODEL_DIR so they
+survive restarts.
+
+A wait that times out on a learned timeout records the timeout as a
+(censored) sample, so one slow appearance raises the percentile instead
+of going unseen, and the step's next WIDEN_AFTER_TIMEOUT waits use the
+fixed timeout again, which also measures how long the slow case takes.
+"""
+import json
+import math
+import os
+import time
+
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
+
+# --- Configuration ---
+WAIT_MODEL_DIR = "wait_models"
+MAX_SAMPLES = 200               # most recent latencies kept per step
+MIN_SAMPLES = 10                # below this the fixed timeout is used
+TIMEOUT_PERCENTILE = 99
+TIMEOUT_FACTOR = 1.5
+TIMEOUT_MARGIN = 1.0            # seconds added on top of factor * percentile
+MIN_TIMEOUT = 2.0
+FAST_POLL = 0.05                # inside the expected arrival window
+SLOW_POLL = 0.25                # before/after it
+BASELINE_POLL = 0.5             # WebDriverWait default, used for the savings estimate
+WIDEN_AFTER_TIMEOUT = 5         # waits on the fixed timeout after a learned one ran out
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class LatencyModel:
+    """
+    Recent element-appearance latencies for one device, keyed by step name.
+    """
+
+    def __init__(self, udid, model_dir=WAIT_MODEL_DIR):
+        self.udid = udid
+        self.path = os.path.join(model_dir, f"{udid}.json")
+        self.steps = {}
+        self.saved_seconds = 0.0
+        self.timeouts = 0
+        self.widened = {}           # step -> waits left on the fixed timeout
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                self.steps = data.get("steps", {})
+                self.saved_seconds = data.get("saved_seconds", 0.0)
+                self.timeouts = data.get("timeouts", 0)
+            except (OSError, ValueError) as e:
+                print(f"[{udid}] WARNING: ignoring unreadable wait model {self.path}: {e}")
+
+    def record(self, step, latency):
+        samples = self.steps.setdefault(step, [])
+        samples.append(round(latency, 4))
+        del samples[:-MAX_SAMPLES]
+
+    def plan(self, step, fallback_timeout):
+        """
+        Returns (timeout, window_start, window_end) for a step. Without enough
+        samples the timeout is the fixed fallback and the whole wait is polled
+        densely, which also gives accurate first samples.
+        """
+        samples = sorted(self.steps.get(step, []))
+        if len(samples) < MIN_SAMPLES or self.widened.get(step):
+            return fallback_timeout, 0.0, fallback_timeout
+        high = percentile(samples, TIMEOUT_PERCENTILE)
+        timeout = min(fallback_timeout, max(MIN_TIMEOUT, high * TIMEOUT_FACTOR + TIMEOUT_MARGIN))
+        return timeout, percentile(samples, 5), high
+
+    def timed_out(self, step, timeout, fallback_timeout):
+        """
+        A wait gave up after `timeout`; the element took at least that long.
+        """
+        self.timeouts += 1
+        if timeout < fallback_timeout:
+            self.record(step, timeout)
+            self.widened[step] = WIDEN_AFTER_TIMEOUT
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"steps": self.steps, "saved_seconds": self.saved_seconds,
+                       "timeouts": self.timeouts}, f)
+        os.replace(tmp, self.path)
+
+    def report(self):
+        lines = [f"[{self.udid}] Adaptive waits: ~{self.saved_seconds:.1f}s saved, {self.timeouts} timeout(s)"]
+        for step, samples in sorted(self.steps.items()):
+            s = sorted(samples)
+            lines.append(f"[{self.udid}]   {step:<20} n={len(s):<4} "
+                         f"p50={percentile(s, 50):.2f}s p99={percentile(s, 99):.2f}s")
+        return "\n".join(lines)
+
+
+class AdaptiveWait:
+    """
+    Per-device wait helper. until() mirrors WebDriverWait.until() but takes
+    the step name and the fixed timeout it replaces.
+    """
+    ignored_exceptions = (NoSuchElementException, StaleElementReferenceException)
+
+    def __init__(self, driver, model):
+        self.driver = driver
+        self.model = model
+
+    def until(self, step, condition, fallback_timeout, message=""):
+        timeout, window_start, window_end = self.model.plan(step, fallback_timeout)
+        if self.model.widened.get(step):
+            self.model.widened[step] -= 1
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            try:
+                value = condition(self.driver)
+                if value:
+                    elapsed = time.monotonic() - start
+                    self.model.record(step, elapsed)
+                    # WebDriverWait would only have noticed at the next 0.5s tick
+                    baseline = math.ceil(elapsed / BASELINE_POLL) * BASELINE_POLL
+                    self.model.saved_seconds += max(0.0, baseline - elapsed)
+                    return value
+            except self.ignored_exceptions:
+                pass
+            now = time.monotonic()
+            if now >= deadline:
+                self.model.timed_out(step, timeout, fallback_timeout)
+                raise TimeoutException(message or f"{step}: not ready after {timeout:.1f}s "
+                                                  f"(fixed timeout was {fallback_timeout}s)")
+            t = now - start
+            poll = FAST_POLL if window_start - SLOW_POLL <= t <= window_end else SLOW_POLL
+            time.sleep(max(0.0, min(poll, deadline - now)))
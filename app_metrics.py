@@ -0,0 +1,123 @@
+"""
+Frame-jank and memory sampling of the game under test.
+
+`dumpsys gfxinfo <pkg> reset` is issued when a Play session starts and the
+counters are read back when it ends; `dumpsys meminfo <pkg>` is sampled at
+every iteration boundary on a background thread. Rows go to METRICS_LOG
+(CSV, one row per device/iteration/kind) so long runs can be plotted for
+leaks and rendering regressions.
+"""
+import csv
+import re
+import subprocess
+import threading
+import time
+
+# --- Configuration ---
+METRICS_LOG = "app_metrics.csv"
+METRICS_FIELDS = ["ts", "udid", "iteration", "kind",
+                  "frames", "janky_frames", "p50_ms", "p90_ms", "p95_ms", "p99_ms",
+                  "pss_kb", "java_heap_kb", "native_heap_kb", "graphics_kb"]
+
+_GFX_PATTERNS = {
+    "frames": re.compile(r"Total frames rendered:\s*(\d+)"),
+    "janky_frames": re.compile(r"Janky frames:\s*(\d+)"),
+    "p50_ms": re.compile(r"50th percentile:\s*(\d+)ms"),
+    "p90_ms": re.compile(r"90th percentile:\s*(\d+)ms"),
+    "p95_ms": re.compile(r"95th percentile:\s*(\d+)ms"),
+    "p99_ms": re.compile(r"99th percentile:\s*(\d+)ms"),
+}
+_MEM_PATTERNS = {
+    "pss_kb": re.compile(r"TOTAL PSS:\s*(\d+)|^\s*TOTAL\s+(\d+)", re.M),
+    "java_heap_kb": re.compile(r"Java Heap:\s*(\d+)"),
+    "native_heap_kb": re.compile(r"Native Heap:\s*(\d+)"),
+    "graphics_kb": re.compile(r"Graphics:\s*(\d+)"),
+}
+
+
+def adb_shell(udid, command, timeout=60):
+    return subprocess.run(
+        ["adb", "-s", udid, "shell", command],
+        capture_output=True, text=True, timeout=timeout
+    ).stdout
+
+
+def _first_match(patterns, text):
+    out = {}
+    for key, pattern in patterns.items():
+        m = pattern.search(text)
+        if m:
+            out[key] = int(next(g for g in m.groups() if g is not None))
+    return out
+
+
+def parse_gfxinfo(text):
+    """
+    Frame counts and frame-time percentiles. Only the first (summary) block
+    is used; per-window stats that follow repeat the same labels.
+    """
+    return _first_match(_GFX_PATTERNS, text)
+
+
+def parse_meminfo(text):
+    """
+    PSS total plus the App Summary heaps, in KB.
+    """
+    return _first_match(_MEM_PATTERNS, text)
+
+
+class AppMetrics:
+    """
+    One per device. Call session_start() right before Play, session_end()
+    after Quit, and iteration_boundary() once per loop.
+    """
+
+    def __init__(self, udid, package, log_path=METRICS_LOG):
+        self.udid = udid
+        self.package = package
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._mem_thread = None
+
+    def session_start(self):
+        adb_shell(self.udid, f"dumpsys gfxinfo {self.package} reset")
+
+    def session_end(self, iteration):
+        stats = parse_gfxinfo(adb_shell(self.udid, f"dumpsys gfxinfo {self.package}"))
+        self._append(iteration, "gfx", stats)
+        if stats.get("frames"):
+            pct = 100.0 * stats.get("janky_frames", 0) / stats["frames"]
+            print(f"[{self.udid}] → Session frames={stats['frames']} janky={pct:.1f}% "
+                  f"p90={stats.get('p90_ms', '?')}ms p99={stats.get('p99_ms', '?')}ms")
+        return stats
+
+    def iteration_boundary(self, iteration):
+        """
+        Samples meminfo without blocking the loop; a sample still running
+        from the previous boundary is not doubled up.
+        """
+        if self._mem_thread is not None and self._mem_thread.is_alive():
+            return
+        self._mem_thread = threading.Thread(target=self._sample_memory, args=(iteration,), daemon=True)
+        self._mem_thread.start()
+
+    def _sample_memory(self, iteration):
+        try:
+            stats = parse_meminfo(adb_shell(self.udid, f"dumpsys meminfo {self.package}"))
+            if stats:
+                self._append(iteration, "mem", stats)
+        except Exception as e:
+            print(f"[{self.udid}] WARNING: meminfo sample failed: {e}")
+
+    def _append(self, iteration, kind, stats):
+        row = {"ts": round(time.time(), 3), "udid": self.udid, "iteration": iteration, "kind": kind}
+        row.update(stats)
+        with self._lock:
+            # exclusive create, so only one worker process writes the header
+            try:
+                with open(self.log_path, "x", newline="") as f:
+                    csv.DictWriter(f, fieldnames=METRICS_FIELDS).writeheader()
+            except FileExistsError:
+                pass
+            with open(self.log_path, "a", newline="") as f:
+                csv.DictWriter(f, fieldnames=METRICS_FIELDS).writerow(row)
@@ -0,0 +1,167 @@
+"""
+Instrumented app relaunch: measures start-up latency on every iteration.
+
+    "am"      force-stop + `am start -W`, parse TotalTime / WaitTime / LaunchState
+    "logcat"  relaunch through the driver, then read ActivityTaskManager's
+              `Displayed ...: +1s234ms` line (no WaitTime in this mode)
+
+Each launch is appended to STARTUP_LOG as CSV; `python app_startup.py`
+summarises the file as percentiles per device model and app version.
+"""
+import csv
+import re
+import subprocess
+import sys
+import time
+
+# --- Configuration ---
+STARTUP_LOG = "startup_times.csv"
+STARTUP_FIELDS = ["ts", "udid", "model", "app_version", "iteration", "mode",
+                  "launch_state", "total_ms", "wait_ms"]
+
+DISPLAYED_RE = re.compile(r"Displayed (\S+): \+(?:(\d+)s)?(\d+)ms")
+
+
+def adb_shell(udid, command, timeout=60):
+    return subprocess.run(
+        ["adb", "-s", udid, "shell", command],
+        capture_output=True, text=True, timeout=timeout
+    ).stdout
+
+
+def device_info(udid, package):
+    """
+    (model, app versionName) for labelling the samples.
+    """
+    model = adb_shell(udid, "getprop ro.product.model").strip() or "unknown"
+    m = re.search(r"versionName=(\S+)", adb_shell(udid, f"dumpsys package {package}"))
+    return model, m.group(1) if m else "unknown"
+
+
+def parse_am_start(output):
+    """
+    Fields of interest from `am start -W` output, as a dict.
+    """
+    result = {}
+    for line in output.splitlines():
+        key, _, value = line.partition(":")
+        key, value = key.strip(), value.strip()
+        if key in ("TotalTime", "WaitTime") and value.isdigit():
+            result[key] = int(value)
+        elif key in ("LaunchState", "Status"):
+            result[key] = value
+    return result
+
+
+def _full_component(component):
+    package, _, activity = component.partition("/")
+    return f"{package}/{package + activity if activity.startswith('.') else activity}"
+
+
+def parse_displayed(logcat, component):
+    """
+    Milliseconds from the last `Displayed <component>` line, or None. The
+    short (`pkg/.Activity`) and full forms are treated as equal.
+    """
+    found = None
+    component = _full_component(component)
+    for m in DISPLAYED_RE.finditer(logcat):
+        if _full_component(m.group(1)) == component:
+            found = int(m.group(2) or 0) * 1000 + int(m.group(3))
+    return found
+
+
+class StartupRecorder:
+    """
+    One per device. relaunch() replaces terminate_app + activate_app.
+    """
+
+    def __init__(self, udid, package, activity, mode="am", log_path=STARTUP_LOG):
+        self.udid = udid
+        self.package = package
+        self.activity = activity
+        self.mode = mode
+        self.log_path = log_path
+        self.model, self.app_version = device_info(udid, package)
+
+    @property
+    def component(self):
+        return f"{self.package}/{self.activity}"
+
+    def relaunch(self, driver, iteration, warm=False, pause=1):
+        """
+        Restarts the app, `pause` seconds after stopping it, and records how
+        long it took. A cold start kills the process first; a warm start
+        only sends it to the background. Returns the recorded row; raises
+        RuntimeError when `am start` does not report success.
+        """
+        if warm:
+            adb_shell(self.udid, "input keyevent KEYCODE_HOME")
+        else:
+            driver.terminate_app(self.package)
+        time.sleep(pause)
+
+        row = {"ts": round(time.time(), 3), "udid": self.udid, "model": self.model,
+               "app_version": self.app_version, "iteration": iteration, "mode": self.mode,
+               "launch_state": "WARM" if warm else "COLD", "total_ms": "", "wait_ms": ""}
+        if self.mode == "am":
+            output = adb_shell(self.udid, f"am start -W -n {self.component}")
+            out = parse_am_start(output)
+            if out.get("Status") != "ok":
+                raise RuntimeError(f"am start failed: {output.strip() or 'no output'}")
+            row["total_ms"] = out.get("TotalTime", "")
+            row["wait_ms"] = out.get("WaitTime", "")
+            row["launch_state"] = out.get("LaunchState", row["launch_state"])
+        else:
+            subprocess.run(["adb", "-s", self.udid, "logcat", "-c"], timeout=30)
+            driver.activate_app(self.package)
+            logcat = ""
+            for _ in range(20):
+                logcat = subprocess.run(
+                    ["adb", "-s", self.udid, "logcat", "-d", "-s", "ActivityTaskManager:I", "ActivityManager:I"],
+                    capture_output=True, text=True, timeout=30
+                ).stdout
+                if "Displayed" in logcat:
+                    break
+                time.sleep(0.5)
+            displayed = parse_displayed(logcat, self.component)
+            row["total_ms"] = "" if displayed is None else displayed
+        self._append(row)
+        print(f"[{self.udid}] → Relaunched app ({row['launch_state']}): "
+              f"TotalTime={row['total_ms']}ms WaitTime={row['wait_ms'] or '-'}ms")
+        return row
+
+    def _append(self, row):
+        # exclusive create, so only one worker process writes the header
+        try:
+            with open(self.log_path, "x", newline="") as f:
+                csv.DictWriter(f, fieldnames=STARTUP_FIELDS).writeheader()
+        except FileExistsError:
+            pass
+        with open(self.log_path, "a", newline="") as f:
+            csv.DictWriter(f, fieldnames=STARTUP_FIELDS).writerow(row)
+
+
+def summarise(log_path=STARTUP_LOG):
+    """
+    Percentiles of TotalTime per (model, app version, launch state).
+    """
+    groups = {}
+    with open(log_path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["total_ms"]:
+                key = (row["model"], row["app_version"], row["launch_state"])
+                groups.setdefault(key, []).append(int(row["total_ms"]))
+
+    def pct(values, p):
+        return values[min(len(values) - 1, int(round((len(values) - 1) * p / 100)))]
+
+    print(f"{'model':<20} {'version':<12} {'state':<6} {'n':>6} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}")
+    for (model, version, state), values in sorted(groups.items()):
+        values.sort()
+        print(f"{model:<20} {version:<12} {state:<6} {len(values):>6} "
+              f"{pct(values, 50):>7} {pct(values, 90):>7} {pct(values, 99):>7} {values[-1]:>7}")
+
+
+if __name__ == "__main__":
+    summarise(sys.argv[1] if len(sys.argv) > 1 else STARTUP_LOG)
@@ -1,22 +1,22 @@
 import subprocess
-import multiprocessing
 import time
-import random
 import signal
 import sys
-from appium import webdriver
-from appium.webdriver.common.appiumby import AppiumBy
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
-from appium.options.android import UiAutomator2Options
+from scenario_engine import run_scenario
+from run_ledger import RunLedger
+from thread_workers import spawn_workers, respawn_dead
+from worker_factory import worker_context, warm
+from watchdog import terminate_stalled
+import live_config
+import session_state
+import webdriver_trace
 
 # --- Configuration ---
-BASKETBALL_SHOTS_PACKAGE  = "com.basketballshots.app"
-BASKETBALL_SHOTS_ACTIVITY = ".MainActivity"
-APPIUM_BASE_PORT          = 4723
-PARALLEL_OFFSET           = 2
-SYSTEM_PORT_BASE          = 8200
+SCENARIO                  = "banner"  # scenarios/banner.yaml: steps, locators, timeouts
+WORKER_MODE               = "process"  # "process" (one per device) or "thread"
+DEVICES_PER_PROCESS       = 8      # thread mode only
+START_METHOD              = "forkserver"  # "forkserver" (preloaded template), "fork", "spawn" or None
+RECORD_TRACES             = False  # record WebDriver traffic per device (see webdriver_trace.py)
 
 
 def get_connected_devices():
@@ -32,92 +32,13 @@ def start_appium_server(port):
         cmd,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
-        shell=(sys.platform == "win32")
+        shell=(sys.platform == "win32"),
+        start_new_session=(sys.platform != "win32"),  # outlives a detached orchestrator
     )
 
 
-def run_loop_on(udid, server_port, system_port):
-    server_url = f"http://localhost:{server_port}"
-    opts = UiAutomator2Options()
-    opts.udid         = udid
-    opts.app_package  = BASKETBALL_SHOTS_PACKAGE
-    opts.app_activity = BASKETBALL_SHOTS_ACTIVITY
-    opts.language     = "en"
-    opts.locale       = "US"
-    opts.set_capability("systemPort", system_port)
-
-    print(f"[{udid}] → Starting Appium session at {server_url}")
-    try:
-        driver = webdriver.Remote(server_url, options=opts)
-    except WebDriverException as e:
-        print(f"[{udid}] ERROR starting session: {e}")
-        return
-
-    try:
-        time.sleep(1)  # let the app stabilize
-        iteration = 1
-        while True:
-            print(f"[{udid}] === Iteration #{iteration} ===")
-
-            # 1) Tap Change Teams
-            try:
-                WebDriverWait(driver, 20).until(
-                    EC.element_to_be_clickable(
-                        (AppiumBy.XPATH, '//android.widget.Button[@text="Change Teams"]')
-                    )
-                ).click()
-                print(f"[{udid}] → Clicked 'Change Teams'")
-            except TimeoutException:
-                print(f"[{udid}] ERROR: 'Change Teams' not found")
-
-            # 2) Scroll to bottom
-            try:
-                driver.find_element(
-                    AppiumBy.ANDROID_UIAUTOMATOR,
-                    'new UiScrollable(new UiSelector().scrollable(true).instance(0))'
-                    '.scrollToEnd(5);'
-                )
-                print(f"[{udid}] → Scrolled to bottom")
-            except Exception as e:
-                print(f"[{udid}] WARNING: scroll failed: {e}")
-
-            # 3) Tap at center-X, 20px up from bottom via W3C tap
-            # 3) Tap banner area
-            try:
-                size = driver.get_window_size()
-                x = int(size['width'] * 0.5)
-                y = int(size['height'] - 20)
-                driver.execute_script("mobile: clickGesture", {"x": x, "y": y})
-                print(f"[{udid}] → clickGesture at ({x},{y})")
-            except Exception as e:
-                print(f"[{udid}] ERROR: clickGesture failed: {e}")
-
-            # 4) Wait
-            time.sleep(2)
-
-            # 5) Quit & relaunch
-            try:
-                driver.terminate_app(BASKETBALL_SHOTS_PACKAGE)
-                time.sleep(1)
-                driver.activate_app(BASKETBALL_SHOTS_PACKAGE)
-                print(f"[{udid}] → Relaunched app")
-            except Exception as e:
-                print(f"[{udid}] ERROR relaunching app: {e}")
-
-            # 6) Small random pause
-            wait_time = random.randint(1,4)
-            print(f"[{udid}] → Sleeping {wait_time}s before next loop\n")
-            time.sleep(wait_time)
-            iteration += 1
-
-    except Exception as e:
-        print(f"[{udid}] UNEXPECTED ERROR: {e}")
-    finally:
-        print(f"[{udid}] ← Quitting session")
-        try:
-            driver.quit()
-        except:
-            pass
+def run_loop_on(udid, server_port, system_port, ledger=None, device_index=None):
+    run_scenario(SCENARIO, udid, server_port, system_port, ledger, device_index)
 
 
 if __name__ == "__main__":
@@ -126,35 +47,72 @@ if __name__ == "__main__":
         print("No devices connected.")
         sys.exit(1)
 
-    # Launch Appium servers
-    servers = []
-    for i, udid in enumerate(devices):
-        port = APPIUM_BASE_PORT + i * PARALLEL_OFFSET
-        p = start_appium_server(port)
-        servers.append(p)
-        print(f"Started Appium on port {port} for {udid}")
-    time.sleep(5)
+    # Port bases, packages and per-device tuning (config.yaml)
+    try:
+        config = live_config.LiveConfig()
+    except ValueError as e:
+        print(f"Bad configuration: {e}")
+        sys.exit(1)
 
-    # Spawn workers
-    workers = []
-    for i, udid in enumerate(devices):
-        port       = APPIUM_BASE_PORT + i * PARALLEL_OFFSET
-        systemPort = SYSTEM_PORT_BASE + i
-        p = multiprocessing.Process(
-            target=run_loop_on,
-            args=(udid, port, systemPort),
-            daemon=True
-        )
-        p.start()
-        workers.append(p)
+    # Launch Appium servers, or adopt the ones a detached run left up
+    state = session_state.load()
+    ports = session_state.assign_ports(devices, state, *config.ports())
+    servers = {}
+    for udid in devices:
+        port = ports[udid][0]
+        if session_state.server_alive(port):
+            pid = state["devices"].get(udid, {}).get("server_pid")
+            servers[udid] = session_state.AdoptedServer(pid, port)
+            print(f"Reusing Appium on port {port} for {udid}")
+        else:
+            servers[udid] = start_appium_server(port)
+            print(f"Started Appium on port {port} for {udid}")
+    if any(not isinstance(s, session_state.AdoptedServer) for s in servers.values()):
+        time.sleep(5)
 
-    # Graceful shutdown
+    # Spawn workers
+    context = worker_context(START_METHOD)
+    print(f"Worker template ({context.get_start_method()}) ready in {warm(context):.2f}s")
+    ledger = RunLedger(context=context)
+    ledger.begin_run("banerClicking_3")
+    jobs = []
+    tracers = []
+    for index, udid in enumerate(devices):
+        port, systemPort = ports[udid]
+        if RECORD_TRACES:
+            # the recording proxy takes the free port next to the server
+            tracers.append(webdriver_trace.start_recorder(port + 1, port, webdriver_trace.trace_path(udid)))
+            port += 1
+        jobs.append((udid, (udid, port, systemPort, ledger.client(udid), index)))
+    workers = spawn_workers(run_loop_on, jobs, WORKER_MODE, DEVICES_PER_PROCESS, context)
+
+    # Graceful shutdown; SIGHUP detaches and leaves servers and sessions up for the next start
     def shutdown(sig, frame):
-        print("Shutting down…")
+        detach = sig == getattr(signal, "SIGHUP", None)
+        print("Detaching…" if detach else "Shutting down…")
         for w in workers: w.terminate()
-        for s in servers: s.terminate()
+        if detach:
+            session_state.save(session_state.entries(ledger.sessions, servers, state))
+        else:
+            for s in servers.values(): s.terminate()
+            session_state.clear()
+        for server, writer in tracers:
+            server.shutdown()
+            writer.close()
+        ledger.end_run()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, shutdown)
-    for w in workers:
-        w.join()
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, shutdown)
+    saved, reported = {}, False
+    while any(w.is_alive() for w in workers):
+        time.sleep(5)
+        terminate_stalled(workers, ledger.last_progress)
+        workers = respawn_dead(run_loop_on, workers, WORKER_MODE, context)
+        if ledger.sessions != saved:
+            saved = dict(ledger.sessions)
+            session_state.save(session_state.entries(saved, servers, state))
+        if not reported and len(saved) == len(devices):
+            print(session_state.report(saved, state))
+            reported = True
@@ -1,22 +1,22 @@
 import subprocess
-import multiprocessing
 import time
-import random
 import signal
 import sys
-from appium import webdriver
-from appium.webdriver.common.appiumby import AppiumBy
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
-from appium.options.android import UiAutomator2Options
+from scenario_engine import run_scenario
+from run_ledger import RunLedger
+from thread_workers import spawn_workers, respawn_dead
+from worker_factory import worker_context, warm
+from watchdog import terminate_stalled
+import live_config
+import session_state
+import webdriver_trace
 
 # --- Configuration ---
-BASKETBALL_SHOTS_PACKAGE = "com.basketballshots.app"
-BASKETBALL_SHOTS_ACTIVITY = ".MainActivity"
-APPIUM_BASE_PORT = 4723         # First Appium server port
-PARALLEL_OFFSET = 2             # Port increment per device
-SYSTEM_PORT_BASE = 8200         # Base for systemPort capability
+SCENARIO = "play"               # scenarios/play.yaml: steps, locators, timeouts
+WORKER_MODE = "process"         # "process" (one per device) or "thread"
+DEVICES_PER_PROCESS = 8         # thread mode only
+START_METHOD = "forkserver"     # "forkserver" (preloaded template), "fork", "spawn" or None
+RECORD_TRACES = False           # record WebDriver traffic per device (see webdriver_trace.py)
 
 
 def get_connected_devices():
@@ -36,6 +36,7 @@ def get_connected_devices():
 def start_appium_server(port):
     """
     Spawn an Appium server on the given port (daemon) and return the Popen.
+    It runs in its own process group, so it outlives a detached orchestrator.
     """
     cmd = [
         "appium",
@@ -46,102 +47,19 @@ def start_appium_server(port):
         cmd,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
-        shell=(sys.platform == "win32")
+        shell=(sys.platform == "win32"),
+        start_new_session=(sys.platform != "win32")
     )
 
 
-def run_loop_on(udid, server_port, system_port):
+def run_loop_on(udid, server_port, system_port, ledger=None, device_index=None):
     """
-    Connects to Appium at localhost:server_port,
-    drives device udid in a play-and-restart loop using systemPort.
+    Connects to Appium at localhost:server_port and drives device udid
+    through the play-and-restart scenario using systemPort.
+    With a ledger client, iteration numbers and learned tap points carry
+    over from earlier runs and every iteration outcome is recorded.
     """
-    server_url = f"http://localhost:{server_port}"
-    opts = UiAutomator2Options()
-    opts.udid = udid
-    opts.app_package = BASKETBALL_SHOTS_PACKAGE
-    opts.app_activity = BASKETBALL_SHOTS_ACTIVITY
-    opts.language = "en"
-    opts.locale = "US"
-    opts.set_capability("systemPort", system_port)
-
-    print(f"[{udid}] → Starting Appium session at {server_url} (systemPort={system_port})")
-    try:
-        driver = webdriver.Remote(server_url, options=opts)
-    except WebDriverException as e:
-        print(f"[{udid}] ERROR starting session: {e}")
-        return
-
-    try:
-        time.sleep(1)  # initial wait
-        iteration = 1
-        while True:
-            print(f"[{udid}] Iteration #{iteration}")
-
-            # 1) Click Play
-            try:
-                play_btn = WebDriverWait(driver, 30).until(
-                    EC.element_to_be_clickable((AppiumBy.XPATH, '//android.widget.Button[@text="Play"]'))
-                )
-                play_btn.click()
-            except TimeoutException:
-                print(f"[{udid}] ERROR: 'Play' button not found. Skipping iteration.")
-                iteration += 1
-                continue
-            time.sleep(5)
-
-            # 2) Click the last button (Quit)
-            buttons = driver.find_elements(AppiumBy.CLASS_NAME, "android.widget.Button")
-            if buttons:
-                buttons[-1].click()
-            else:
-                print(f"[{udid}] WARNING: No buttons found after Play.")
-            time.sleep(2)
-
-            # 3) Scroll and click 'Return to Menu'
-            ui_scroll = (
-                'new UiScrollable(new UiSelector().scrollable(true).instance(0))'
-                '.scrollIntoView(new UiSelector().text("Return to Menu").instance(0));'
-            )
-            try:
-                return_btn = WebDriverWait(driver, 20).until(
-                    EC.element_to_be_clickable((AppiumBy.ANDROID_UIAUTOMATOR, ui_scroll))
-                )
-                return_btn.click()
-            except (TimeoutException, NoSuchElementException):
-                # Fallback: search by text without scrolling
-                elems = driver.find_elements(AppiumBy.XPATH, '//*[@text="Return to Menu"]')
-                if elems:
-                    elems[0].click()
-                else:
-                    print(f"[{udid}] ERROR: 'Return to Menu' not found. Skipping iteration.")
-                    iteration += 1
-                    continue
-            time.sleep(2)
-
-            # 4) Wait for ad playback
-            time.sleep(30)
-
-            # 5) Quit and relaunch the app
-            driver.terminate_app(BASKETBALL_SHOTS_PACKAGE)
-            time.sleep(2)
-            driver.activate_app(BASKETBALL_SHOTS_PACKAGE)
-            time.sleep(5)
-
-            # 6) Random pause before next iteration
-            wait_time = random.randint(1, 4)
-            print(f"[{udid}] Waiting {wait_time}s before next iteration...")
-            time.sleep(wait_time)
-
-            iteration += 1
-
-    except Exception as e:
-        print(f"[{udid}] UNEXPECTED ERROR: {e}")
-    finally:
-        print(f"[{udid}] ← Quitting session")
-        try:
-            driver.quit()
-        except Exception:
-            pass
+    run_scenario(SCENARIO, udid, server_port, system_port, ledger, device_index)
 
 
 if __name__ == "__main__":
@@ -150,42 +68,86 @@ if __name__ == "__main__":
         print("No physical devices found. Connect devices and retry.")
         sys.exit(1)
 
-    # 1) Launch Appium servers
-    appium_processes = []
-    for idx, udid in enumerate(devices):
-        port = APPIUM_BASE_PORT + idx * PARALLEL_OFFSET
-        p = start_appium_server(port)
-        appium_processes.append(p)
-        print(f"Spawned Appium server on port {port} for device {udid}")
+    # Port bases, packages and per-device tuning (config.yaml)
+    try:
+        config = live_config.LiveConfig()
+    except ValueError as e:
+        print(f"Bad configuration: {e}")
+        sys.exit(1)
 
-    # Give servers time to start
-    time.sleep(5)
+    # 1) Launch Appium servers, or adopt the ones a detached run left up;
+    #    devices keep the ports they had, so their sessions can be reattached
+    state = session_state.load()
+    ports = session_state.assign_ports(devices, state, *config.ports())
+    appium_processes = {}
+    for udid in devices:
+        port = ports[udid][0]
+        if session_state.server_alive(port):
+            pid = state["devices"].get(udid, {}).get("server_pid")
+            appium_processes[udid] = session_state.AdoptedServer(pid, port)
+            print(f"Reusing Appium server on port {port} for device {udid}")
+        else:
+            appium_processes[udid] = start_appium_server(port)
+            print(f"Spawned Appium server on port {port} for device {udid}")
+
+    # Give new servers time to start
+    if any(not isinstance(a, session_state.AdoptedServer) for a in appium_processes.values()):
+        time.sleep(5)
 
     # 2) Spawn worker processes
-    workers = []
-    for idx, udid in enumerate(devices):
-        port = APPIUM_BASE_PORT + idx * PARALLEL_OFFSET
-        system_port = SYSTEM_PORT_BASE + idx
-        p = multiprocessing.Process(
-            target=run_loop_on,
-            args=(udid, port, system_port),
-            daemon=True
-        )
-        p.start()
-        workers.append(p)
-        print(f"Spawned worker for {udid} → Appium port {port}, systemPort {system_port}")
-
-    # 3) Shutdown handling
+    context = worker_context(START_METHOD)
+    print(f"Worker template ({context.get_start_method()}) ready in {warm(context):.2f}s")
+    ledger = RunLedger(context=context)
+    ledger.begin_run("basketballShotsTestManyDevices_2")
+    jobs = []
+    tracers = []
+    for index, udid in enumerate(devices):
+        port, system_port = ports[udid]
+        if RECORD_TRACES:
+            # the recording proxy takes the free port next to the server
+            tracers.append(webdriver_trace.start_recorder(port + 1, port, webdriver_trace.trace_path(udid)))
+            port += 1
+        jobs.append((udid, (udid, port, system_port, ledger.client(udid), index)))
+        print(f"Worker for {udid} → Appium port {port}, systemPort {system_port}")
+    workers = spawn_workers(run_loop_on, jobs, WORKER_MODE, DEVICES_PER_PROCESS, context)
+    print(f"Spawned {len(workers)} worker process(es) in {WORKER_MODE} mode")
+
+    # 3) Shutdown handling. SIGHUP detaches instead: workers stop, but the
+    #    Appium servers and their sessions stay up for the next start
     def shutdown(signum, frame):
-        print("Shutting down workers and Appium servers...")
+        detach = signum == getattr(signal, "SIGHUP", None)
+        if detach:
+            print("Detaching; Appium servers and sessions stay up...")
+        else:
+            print("Shutting down workers and Appium servers...")
         for w in workers:
             w.terminate()
-        for a in appium_processes:
-            a.terminate()
+        if detach:
+            session_state.save(session_state.entries(ledger.sessions, appium_processes, state))
+        else:
+            for a in appium_processes.values():
+                a.terminate()
+            session_state.clear()
+        for server, writer in tracers:
+            server.shutdown()
+            writer.close()
+        ledger.end_run()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, shutdown)
-
-    # 4) Keep main alive
-    for w in workers:
-        w.join()
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, shutdown)
+
+    # 4) Keep main alive; replace workers that crash, keep the session
+    #    state file current, and say once how the sessions were obtained
+    saved, reported = {}, False
+    while any(w.is_alive() for w in workers):
+        time.sleep(5)
+        terminate_stalled(workers, ledger.last_progress)
+        workers = respawn_dead(run_loop_on, workers, WORKER_MODE, context)
+        if ledger.sessions != saved:
+            saved = dict(ledger.sessions)
+            session_state.save(session_state.entries(saved, appium_processes, state))
+        if not reported and len(saved) == len(devices):
+            print(session_state.report(saved, state))
+            reported = True
@@ -0,0 +1,144 @@
+"""
+Offline latency comparison: template matching vs. XPath lookups.
+
+    python bench_template_locator.py record <udid> <screen-name>
+        saves BENCH_DIR/<screen>.raw (screencap), <screen>.xml (uiautomator
+        dump) and <screen>.json (how long the dump took on the device)
+
+    python bench_template_locator.py run [--xpath XPATH] [--template NAME] ...
+        matches every template against every recorded screen and evaluates
+        the XPath on the recorded hierarchy. XPath latency is reported as
+        recorded dump time + evaluation time, which is what the server pays.
+
+With no recordings the checked-in error screenshots are used, with a crop
+taken from each frame standing in for the template.
+"""
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from screenshots import decode_png, parse_raw_screencap
+from template_locator import TemplateLocator, frame_to_array
+
+# --- Configuration ---
+BENCH_DIR = "bench_frames"
+REPEATS = 20
+DEFAULT_XPATH = '//android.widget.Button[@text="Play"]'
+FALLBACK_FRAMES = ["error_screenshot.png", "error_screenshot_basketball_shots.png"]
+
+
+def record(udid, name):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    raw = subprocess.check_output(["adb", "-s", udid, "exec-out", "screencap"])
+    with open(os.path.join(BENCH_DIR, name + ".raw"), "wb") as f:
+        f.write(raw)
+    t0 = time.perf_counter()
+    xml = subprocess.check_output(["adb", "-s", udid, "exec-out", "uiautomator", "dump", "/dev/tty"], text=True)
+    dump_seconds = time.perf_counter() - t0
+    xml = xml[:xml.rfind(">") + 1]  # drop the "UI hierchary dumped to" trailer
+    with open(os.path.join(BENCH_DIR, name + ".xml"), "w", encoding="utf-8") as f:
+        f.write(xml)
+    with open(os.path.join(BENCH_DIR, name + ".json"), "w") as f:
+        json.dump({"udid": udid, "dump_seconds": dump_seconds}, f)
+    print(f"Recorded {name}: {len(raw)} bytes raw, dump took {dump_seconds * 1000:.0f} ms")
+
+
+def appium_xpath_to_etree(xpath):
+    """
+    Translates the simple `//Class[@attr="value"]...` form used by the loops
+    into ElementTree syntax over a uiautomator dump (`<node class=...>`).
+    """
+    m = re.fullmatch(r"//([\w.*]+)((?:\[@[\w-]+=[\"'][^\"']*[\"']\])*)", xpath)
+    if not m:
+        raise ValueError(f"unsupported xpath for offline bench: {xpath}")
+    cls, preds = m.groups()
+    out = ".//node"
+    if cls != "*":
+        out += f"[@class='{cls}']"
+    for attr, value in re.findall(r"\[@([\w-]+)=[\"']([^\"']*)[\"']\]", preds):
+        out += f"[@{attr}='{value}']"
+    return out
+
+
+def load_screens():
+    screens = []
+    for raw_path in sorted(glob.glob(os.path.join(BENCH_DIR, "*.raw"))):
+        base = raw_path[:-4]
+        with open(raw_path, "rb") as f:
+            frame = parse_raw_screencap(f.read())
+        meta = {}
+        if os.path.exists(base + ".json"):
+            with open(base + ".json") as f:
+                meta = json.load(f)
+        xml = base + ".xml" if os.path.exists(base + ".xml") else None
+        screens.append((os.path.basename(base), frame_to_array(frame), xml, meta))
+    if not screens:
+        for path in FALLBACK_FRAMES:
+            with open(path, "rb") as f:
+                frame = decode_png(f.read())
+            if frame is None:
+                sys.exit("No recordings and Pillow is not installed to read the fallback PNGs.")
+            screens.append((os.path.splitext(path)[0], frame_to_array(frame), None, {}))
+    return screens
+
+
+def timed(fn, repeats):
+    fn()  # warm-up (template load, FFT plans)
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return float(np.median(samples)), fn()
+
+
+def run(xpath, template_names):
+    locator = TemplateLocator()
+    print(f"{'screen':<40} {'locator':<14} {'median ms':>10} {'result'}")
+    for name, pixels, xml, meta in load_screens():
+        names = list(template_names)
+        if not names:
+            # stand-in template: a button-sized crop from the lower middle of the screen
+            h, w = pixels.shape[:2]
+            bh, bw = h // 12, w // 4
+            top = (h - 3 * bh) // locator.scale * locator.scale
+            left = (w - bw) // 2 // locator.scale * locator.scale
+            crop = pixels[top:top + bh, left:left + bw]
+            locator.add_template(f"{name}:crop", crop)
+            names = [f"{name}:crop"]
+        for tmpl in names:
+            median, result = timed(lambda: locator.match(pixels, tmpl, threshold=-1.0), REPEATS)
+            print(f"{name:<40} {'template':<14} {median * 1000:>10.2f} {result}")
+        if xml:
+            tree = ET.parse(xml)
+            expr = appium_xpath_to_etree(xpath)
+            median, result = timed(lambda: tree.getroot().findall(expr), REPEATS)
+            total = median + meta.get("dump_seconds", 0.0)
+            print(f"{name:<40} {'xpath eval':<14} {median * 1000:>10.2f} {len(result)} node(s)")
+            print(f"{name:<40} {'xpath + dump':<14} {total * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["record"] and len(args) == 3:
+        record(args[1], args[2])
+    elif args[:1] in (["run"], []):
+        xpath, templates = DEFAULT_XPATH, []
+        rest = args[1:]
+        while rest:
+            flag, value, rest = rest[0], rest[1], rest[2:]
+            if flag == "--xpath":
+                xpath = value
+            elif flag == "--template":
+                templates.append(value)
+        run(xpath, templates)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,94 @@
+"""
+Process-per-device vs. threads-per-process: memory and time to first session.
+
+Starts a fake Appium server, launches N simulated devices in each worker
+mode, and reports RSS/PSS per device and launch-to-first-session latency.
+Each simulated device does what run_loop_on does before its loop: import
+the Appium/Selenium stack and create a session.
+
+    python bench_worker_modes.py [devices] [devices_per_process]
+"""
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+import fake_appium_server
+from thread_workers import spawn_workers
+
+# --- Configuration ---
+BENCH_PORT = 4790
+HOLD_SECONDS = 3
+
+
+def simulated_device(name, server_url, launched_at, results):
+    from appium import webdriver
+    from appium.options.android import UiAutomator2Options
+    from selenium.webdriver.support.ui import WebDriverWait  # noqa: F401 (imported like the loops do)
+    from selenium.webdriver.support import expected_conditions  # noqa: F401
+
+    opts = UiAutomator2Options()
+    opts.udid = name
+    driver = webdriver.Remote(server_url, options=opts)
+    results.put((name, os.getpid(), time.time() - launched_at))
+    time.sleep(HOLD_SECONDS)
+    driver.quit()
+
+
+def memory_kb(pid):
+    """
+    (RSS, PSS) in KB from /proc; PSS splits shared pages fairly between
+    forked processes. Returns (None, None) off Linux.
+    """
+    try:
+        rss = pss = None
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+        return rss, pss
+    except OSError:
+        return None, None
+
+
+def run_mode(mode, devices, per_process):
+    results = multiprocessing.Queue()
+    url = f"http://127.0.0.1:{BENCH_PORT}"
+    launched = time.time()
+    jobs = [(f"dev{i:02d}", (f"dev{i:02d}", url, launched, results)) for i in range(devices)]
+    procs = spawn_workers(simulated_device, jobs, mode, per_process)
+
+    latencies, pids = [], set()
+    for _ in range(devices):
+        _name, pid, latency = results.get(timeout=120)
+        latencies.append(latency)
+        pids.add(pid)
+    rss = pss = 0
+    for pid in pids:
+        r, p = memory_kb(pid)
+        rss += r or 0
+        pss += p or 0
+    for p in procs:
+        p.join(HOLD_SECONDS + 30)
+    return {
+        "mode": mode, "processes": len(pids),
+        "rss_per_device_mb": rss / 1024 / devices, "pss_per_device_mb": pss / 1024 / devices,
+        "first_session_p50": statistics.median(latencies), "first_session_max": max(latencies),
+    }
+
+
+if __name__ == "__main__":
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_process = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    server, _fake = fake_appium_server.serve(BENCH_PORT, background=True)
+    print(f"{'mode':<8} {'procs':>5} {'RSS/dev MB':>11} {'PSS/dev MB':>11} {'1st sess p50':>13} {'max':>7}")
+    for mode in ("process", "thread"):
+        r = run_mode(mode, devices, per_process)
+        print(f"{r['mode']:<8} {r['processes']:>5} {r['rss_per_device_mb']:>11.1f} {r['pss_per_device_mb']:>11.1f} "
+              f"{r['first_session_p50']:>12.2f}s {r['first_session_max']:>6.2f}s")
+    server.shutdown()
@@ -0,0 +1,97 @@
+"""
+Worker startup time under each start method.
+
+For every method this starts N workers at once (fleet start) and then one
+more on its own (a restart), and reports per worker: spawn time (start()
+to the worker's first line), import time of the Appium/Selenium stack in
+the worker, and the total until the worker could create a session.
+Each method runs in a fresh interpreter, since the forkserver can only be
+configured once per process. Like the loops, the parent has the stack
+imported before it starts workers.
+
+    python bench_worker_startup.py [workers]
+"""
+import json
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+
+from worker_factory import worker_context, warm, PRELOAD_MODULES
+
+# --- Configuration ---
+METHODS = ("fork", "spawn", "forkserver", "forkserver+preload")
+STACK = PRELOAD_MODULES[1:]
+
+
+def import_stack():
+    import importlib
+    for name in STACK:
+        importlib.import_module(name)
+
+
+def worker(started_at, results):
+    entered = time.time()
+    t0 = time.perf_counter()
+    import_stack()
+    imported = time.perf_counter() - t0
+    results.put((entered - started_at, imported, time.time() - started_at))
+
+
+def measure(method, workers):
+    t0 = time.perf_counter()
+    import_stack()
+    parent_import = time.perf_counter() - t0
+
+    if method == "forkserver+preload":
+        ctx = worker_context("forkserver", PRELOAD_MODULES)
+    elif method == "forkserver":
+        ctx = worker_context("forkserver", None)
+    else:
+        ctx = worker_context(method)
+    template = warm(ctx)
+    results = ctx.Queue()
+
+    def start(n):
+        procs = []
+        for _ in range(n):
+            p = ctx.Process(target=worker, args=(time.time(), results))
+            p.start()
+            procs.append(p)
+        rows = [results.get(timeout=120) for _ in range(n)]
+        for p in procs:
+            p.join()
+        return rows
+
+    fleet = start(workers)
+    restart = start(1)[0]
+    return {
+        "method": method, "parent_import": parent_import, "template": template,
+        "spawn_p50": statistics.median(r[0] for r in fleet),
+        "import_p50": statistics.median(r[1] for r in fleet),
+        "ready_max": max(r[2] for r in fleet),
+        "restart_ready": restart[2],
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--method":
+        print(json.dumps(measure(sys.argv[2], int(sys.argv[3]))))
+        sys.exit(0)
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    print(f"{workers} workers; times in seconds")
+    print(f"{'method':<20} {'parent imp':>10} {'template':>9} {'spawn p50':>10} {'import p50':>11} "
+          f"{'fleet ready':>12} {'restart':>8}")
+    for method in METHODS:
+        if method.split("+")[0] not in multiprocessing.get_all_start_methods():
+            continue
+        out = subprocess.run([sys.executable, __file__, "--method", method, str(workers)],
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f"{method:<20} failed: {out.stderr.strip().splitlines()[-1:]}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{r['method']:<20} {r['parent_import']:>10.3f} {r['template']:>9.3f} {r['spawn_p50']:>10.3f} "
+              f"{r['import_p50']:>11.3f} {r['ready_max']:>12.3f} {r['restart_ready']:>8.3f}")
@@ -0,0 +1,240 @@
+"""
+Device-side offload for coordinate-only scenarios.
+
+Once the engine has run an iteration through Appium and learned every tap
+point, a scenario whose steps are all taps, gestures, sleeps and
+relaunches can run on the phone itself. shell_script() compiles the plan
+to an sh loop of `input tap` / `input swipe` / `am force-stop` /
+`am start`. The loop is pushed to OFFLOAD_DIR and started in the
+background, and it appends "<iteration> <epoch>" to a progress file after
+every iteration. Iteration durations come from these device timestamps
+alone, so a skew between the host and device clocks does not matter.
+
+The host only supervises. Every SUPERVISE_INTERVAL it reads the progress
+file and records new iterations in telemetry and the ledger. Every
+`ui_check` seconds it makes one Appium lookup for the scenario's first
+click target, which also keeps the session from idling out. When the UI
+check keeps failing or progress stalls, it stops the script, forgets the
+learned points and hands back to the Appium loop.
+
+Enable per scenario:
+
+    offload: {enabled: true, iterations: 200, ui_check: 30}
+"""
+import math
+import os
+import subprocess
+import tempfile
+import time
+
+from scenario_engine import Sleep, Click, TapChain, Gesture, Relaunch
+from telemetry_store import OK
+
+# --- Configuration ---
+OFFLOAD_DIR = "/data/local/tmp"
+SUPERVISE_INTERVAL = 5          # seconds between progress reads
+UI_CHECK_INTERVAL = 30          # seconds between Appium UI checks (below newCommandTimeout)
+UI_CHECK_FAILURES = 3           # consecutive misses before falling back
+STALL_FACTOR = 3                # no progress for this many expected iterations → fall back
+
+
+def adb(udid, *args, timeout=60):
+    return subprocess.run(["adb", "-s", udid, *args], capture_output=True, text=True, timeout=timeout)
+
+
+def adb_shell(udid, command, timeout=60):
+    return adb(udid, "shell", command, timeout=timeout).stdout
+
+
+def _sleep_line(op):
+    if op.fixed:
+        return f"sleep {op.low:g}"
+    low, high = int(op.low), int(math.ceil(op.high))
+    return f"sleep $(({low} + RANDOM % {high - low + 1}))"
+
+
+def _tap_line(run, click):
+    xy = run.learned.get(click.learn) if click.learn else None
+    if not xy:
+        raise ValueError(f"{click.step}: tap point not learned yet")
+    return f"input tap {int(xy[0])} {int(xy[1])}"
+
+
+def shell_script(run, iterations, start_iteration, progress, stop_file, pid_file):
+    """
+    sh source for `iterations` iterations of run.plan on the device. Raises
+    ValueError when a step cannot run without Appium (a lookup whose point
+    is not learned, a hook, a WebView probe).
+    """
+    plan = run.plan
+    body, pause = plan.loop, None
+    if body and isinstance(body[-1], Sleep) and body[-1].step is None:
+        body, pause = body[:-1], body[-1]
+
+    steps = []
+    for op in body:
+        if isinstance(op, Sleep):
+            steps.append(_sleep_line(op))
+        elif isinstance(op, Click):
+            steps.append(_tap_line(run, op))
+        elif isinstance(op, TapChain):
+            steps += [_tap_line(run, op.first), _sleep_line(op.pause), _tap_line(run, op.second)]
+        elif isinstance(op, Gesture):
+            x, y = run._point(op.tap)
+            swipes = op.swipes
+            if op.scroll:
+                known = run.learned.get(op.scroll.learn)
+                if not known:
+                    raise ValueError(f"{op.step}: scroll not learned yet")
+                swipes = int(known[0])
+            if op.swipe:
+                x1, y1 = run._point(op.swipe["from"])
+                x2, y2 = run._point(op.swipe["to"])
+                steps += [f"input swipe {x1} {y1} {x2} {y2} {op.swipe.get('ms', 300)}"] * swipes
+            steps.append(f"input tap {x} {y}")
+        elif isinstance(op, Relaunch):
+            steps += [f"am force-stop {plan.package}", f"sleep {op.pause:g}",
+                      f"am start -W -n {plan.package}/{plan.activity} > /dev/null"]
+        else:
+            raise ValueError(f"{op!r} needs Appium")
+
+    lines = [
+        "#!/system/bin/sh",
+        f"# {plan.name}: {iterations} iterations, generated by device_offload.py",
+        f"i={start_iteration}",
+        f"end={start_iteration + iterations - 1}",
+        f"rm -f {stop_file}",
+        f"echo $$ > {pid_file}",
+        f"echo \"start $(date +%s)\" > {progress}",
+        "while [ $i -le $end ]; do",
+        f"  [ -f {stop_file} ] && break",
+    ]
+    lines += [f"  {s}" for s in steps]
+    lines.append(f"  echo \"$i $(date +%s)\" >> {progress}")
+    if pause is not None:
+        lines.append(f"  {_sleep_line(pause)}")
+    lines += ["  i=$((i + 1))", "done", f"echo \"done $(date +%s)\" >> {progress}", ""]
+    return "\n".join(lines)
+
+
+def expected_iteration_seconds(plan):
+    total = 0.0
+    for op in plan.loop:
+        if isinstance(op, Sleep):
+            total += op.high
+        elif isinstance(op, TapChain):
+            total += op.pause.high
+        elif isinstance(op, Relaunch):
+            total += op.pause + 3
+    return total + 2
+
+
+class Offload:
+    """
+    The script and progress file of one scenario on one device.
+    """
+
+    def __init__(self, udid, name):
+        self.udid = udid
+        self.script = f"{OFFLOAD_DIR}/offload_{name}.sh"
+        self.progress = f"{OFFLOAD_DIR}/offload_{name}.progress"
+        self.stop_file = f"{OFFLOAD_DIR}/offload_{name}.stop"
+        self.pid_file = f"{OFFLOAD_DIR}/offload_{name}.pid"
+
+    def start(self, source):
+        with tempfile.NamedTemporaryFile("w", suffix=".sh", newline="\n", delete=False) as f:
+            f.write(source)
+        try:
+            result = adb(self.udid, "push", f.name, self.script)
+        finally:
+            os.remove(f.name)
+        if result.returncode != 0:
+            raise RuntimeError(f"adb push failed: {result.stderr.strip()}")
+        # a progress or pid file left by an earlier run must not be read as this one's
+        adb_shell(self.udid, f"rm -f {self.progress} {self.pid_file}; nohup sh {self.script} > /dev/null 2>&1 &")
+
+    def read(self):
+        """
+        (start epoch, [(iteration, epoch)], finished) from the progress
+        file; the start is None until the script has written it.
+        """
+        start, rows, finished = None, [], False
+        for line in adb_shell(self.udid, f"cat {self.progress} 2>/dev/null", timeout=15).splitlines():
+            parts = line.split()
+            if len(parts) != 2:
+                continue
+            if parts[0] == "done":
+                finished = True
+            elif parts[0] == "start":
+                start = float(parts[1])
+            else:
+                rows.append((int(parts[0]), float(parts[1])))
+        return start, rows, finished
+
+    def stop(self):
+        """
+        Ends the loop now rather than at the next iteration, so its taps do
+        not mix with the Appium loop taking over. The loop is frozen before
+        its current command is killed, so it cannot start the next one.
+        """
+        adb_shell(self.udid, f"touch {self.stop_file}; pid=$(cat {self.pid_file}); "
+                             f"kill -STOP $pid; pkill -P $pid; kill -KILL $pid", timeout=15)
+
+
+def run_offloaded(run, iterations, ui_check=UI_CHECK_INTERVAL):
+    """
+    Offloads up to `iterations` iterations of run.plan to the device and
+    supervises them. Returns the number of iterations the device completed;
+    run.iteration is advanced past them.
+    """
+    plan, udid = run.plan, run.udid
+    offload = Offload(udid, plan.name)
+    source = shell_script(run, iterations, run.iteration, offload.progress, offload.stop_file,
+                          offload.pid_file)
+    offload.start(source)
+    print(f"[{udid}] → Offloaded {iterations} iterations of '{plan.name}' to the device")
+
+    first_click = next((op.first if isinstance(op, TapChain) else op)
+                       for op in plan.loop if isinstance(op, (Click, TapChain)))
+    stall = STALL_FACTOR * expected_iteration_seconds(plan)
+    seen, last_ts, last_progress = 0, None, time.time()   # last_ts: device clock
+    last_check, misses, reason = time.time(), 0, None
+
+    def collect():
+        nonlocal seen, last_ts, last_progress
+        start, rows, finished = offload.read()
+        if last_ts is None:
+            last_ts = start
+        for iteration, ts in rows[seen:]:
+            run.telemetry.record("iteration", iteration, last_ts, ts - last_ts, OK)
+            if run.ledger is not None:
+                run.ledger.iteration(iteration, last_ts, "offloaded")
+            last_ts = ts
+            last_progress = time.time()
+        seen = len(rows)
+        return finished
+
+    while True:
+        time.sleep(SUPERVISE_INTERVAL)
+        if collect():
+            break
+        if time.time() - last_progress > stall:
+            reason = f"no progress for {stall:.0f}s"
+        elif time.time() - last_check >= ui_check:
+            last_check = time.time()
+            found = run._find_once(first_click.locators[0])
+            misses = 0 if found is not None else misses + 1
+            if misses >= UI_CHECK_FAILURES:
+                reason = f"'{first_click.step}' missing in {misses} UI checks"
+        if reason:
+            print(f"[{udid}] WARNING: stopping offloaded loop: {reason}")
+            offload.stop()
+            collect()
+            run.screenshots.capture(udid, "offload_stopped", run.driver)
+            run.learned.clear()
+            if run.ledger is not None:
+                run.ledger.save_state({})
+            break
+    run.iteration += seen
+    print(f"[{udid}] ← Device ran {seen} offloaded iterations")
+    return seen
@@ -0,0 +1,32 @@
+"""
+Stand-in for the adb binary, for fleet dry runs without phones.
+
+    FAKE_ADB_DEVICES=serial1,serial2 python fake_adb.py devices
+
+`devices` lists FAKE_ADB_DEVICES; `-s <serial> shell getprop ro.product.model`
+prints FAKE_ADB_MODEL; every other command succeeds with no output.
+"""
+import os
+import sys
+
+# --- Configuration ---
+DEFAULT_MODEL = "FakePhone"
+
+
+def main(argv):
+    args = list(argv)
+    serial = None
+    if len(args) >= 2 and args[0] == "-s":
+        serial, args = args[1], args[2:]
+    if args[:1] == ["devices"]:
+        print("List of devices attached")
+        for udid in filter(None, os.environ.get("FAKE_ADB_DEVICES", "").split(",")):
+            print(f"{udid}\tdevice")
+        return 0
+    if serial and args[:1] == ["shell"] and "getprop ro.product.model" in " ".join(args[1:]):
+        print(os.environ.get("FAKE_ADB_MODEL", DEFAULT_MODEL))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,158 @@
+"""
+Minimal stand-in for an Appium server, for benchmarks and dry runs without
+phones. It speaks enough of the W3C WebDriver protocol for the loops:
+session create/delete/list, find element(s), click, rect, window size,
+execute (mobile: commands), actions, app terminate/activate, contexts and
+settings. Every response can be delayed by a fixed latency. With
+busy_ms the screen never goes idle, like the game screen: lookups wait
+min(waitForIdleTimeout, busy_ms) and clicks also
+min(actionAcknowledgmentTimeout, busy_ms), as UiAutomator2 would.
+
+    python fake_appium_server.py [port] [latency_ms] [busy_ms]
+"""
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+FAKE_PORT = 4723
+FAKE_LATENCY_MS = 0
+FAKE_BUSY_MS = 0
+FAKE_WINDOW = {"width": 1080, "height": 2340}
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+
+
+class FakeAppium:
+    def __init__(self, latency_ms=FAKE_LATENCY_MS, busy_ms=FAKE_BUSY_MS):
+        self.latency = latency_ms / 1000.0
+        self.busy_ms = busy_ms
+        self.sessions = {}
+        self.requests = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def handle(self, method, path, body):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if path == "/status":
+            return 200, {"ready": True, "message": "fake appium"}
+        if path == "/sessions":
+            return 200, [{"id": sid, "capabilities": s["caps"]} for sid, s in self.sessions.items()]
+        if method == "POST" and path == "/session":
+            caps = body.get("capabilities", {}).get("alwaysMatch", {})
+            sid = uuid.uuid4().hex
+            self.sessions[sid] = {"caps": caps, "settings": {}, "context": "NATIVE_APP"}
+            return 200, {"sessionId": sid, "capabilities": dict(caps, platformName="Android")}
+        m = re.match(r"^/session/([^/]+)(/.*)?$", path)
+        if not m:
+            return 404, {"error": "unknown command", "message": path, "stacktrace": ""}
+        sid, rest = m.group(1), m.group(2) or ""
+        session = self.sessions.get(sid)
+        if session is None:
+            return 404, {"error": "invalid session id", "message": sid, "stacktrace": ""}
+        if method == "DELETE" and rest == "":
+            del self.sessions[sid]
+            return 200, None
+        if self.busy_ms and method == "POST" and (rest.startswith("/element") or rest == "/elements"):
+            settings = session["settings"]
+            wait = min(settings.get("waitForIdleTimeout", 10000), self.busy_ms)
+            if rest.endswith("/click"):
+                wait += min(settings.get("actionAcknowledgmentTimeout", 3000), self.busy_ms)
+            time.sleep(wait / 1000.0)
+        if rest == "/element":
+            return 200, {ELEMENT_KEY: f"el-{next(self._ids)}"}
+        if rest == "/elements":
+            return 200, [{ELEMENT_KEY: f"el-{next(self._ids)}"} for _ in range(3)]
+        if rest == "/window/rect" or rest == "/window/size":
+            return 200, dict(FAKE_WINDOW, x=0, y=0)
+        if rest.endswith("/rect"):
+            return 200, {"x": 340, "y": 1800, "width": 400, "height": 120}
+        if rest.endswith("/displayed") or rest.endswith("/enabled"):
+            return 200, True
+        if rest == "/contexts":
+            return 200, ["NATIVE_APP", "WEBVIEW_com.basketballshots.app"]
+        if rest == "/context":
+            if method == "POST":
+                session["context"] = body.get("name")
+                return 200, None
+            return 200, session["context"]
+        if rest == "/appium/settings":
+            if method == "POST":
+                session["settings"].update(body.get("settings", {}))
+                return 200, None
+            return 200, session["settings"]
+        if rest == "/source":
+            return 200, "<hierarchy><node class=\"android.widget.Button\" text=\"Play\"/></hierarchy>"
+        if rest == "/screenshot":
+            return 200, ""
+        return 200, None
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True      # headers and body go out in separate writes
+
+        def _reply(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                body = {}
+            path = self.path.split("?", 1)[0].rstrip("/") or "/"
+            if path.startswith("/wd/hub"):
+                path = path[len("/wd/hub"):] or "/"
+            status, value = fake.handle(method, path, body)
+            payload = json.dumps({"value": value}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._reply("GET")
+
+        def do_POST(self):
+            self._reply("POST")
+
+        def do_DELETE(self):
+            self._reply("DELETE")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=FAKE_PORT, latency_ms=FAKE_LATENCY_MS, background=False, busy_ms=FAKE_BUSY_MS):
+    """
+    Starts a fake server. With background=True it runs on a daemon thread
+    and the (server, fake) pair is returned.
+    """
+    fake = FakeAppium(latency_ms, busy_ms)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fake))
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, fake
+    print(f"Fake Appium listening on {port} ({latency_ms} ms latency)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    serve(int(sys.argv[1]) if len(sys.argv) > 1 else FAKE_PORT,
+          int(sys.argv[2]) if len(sys.argv) > 2 else FAKE_LATENCY_MS,
+          busy_ms=int(sys.argv[3]) if len(sys.argv) > 3 else FAKE_BUSY_MS)
@@ -0,0 +1,530 @@
+"""
+Multi-host fleet: one coordinator, one agent per machine with phones.
+
+An agent lists its devices with adb, reports them with its capacity in a
+heartbeat, and gets back which scenario each of its devices should run.
+It starts one Appium server and one worker per assigned device on its own
+port range, and reports per-scenario iterations (from its local run
+ledger) with every heartbeat. The coordinator splits all reported
+devices between scenarios by weight, keeps assignments stable while the
+fleet does not change, and rebalances when an agent joins, leaves
+(SIGINT) or stops sending heartbeats (SIGTERM, crash, network loss).
+
+    python fleet.py coordinator [--port 9100] [--scenarios play=3,banner=1]
+    python fleet.py agent --coordinator http://host:9100 [--name host1] [--capacity 16]
+    python fleet.py status --coordinator http://host:9100
+    python fleet.py demo [agents] [devices_per_agent] [seconds]
+
+`demo` runs a coordinator and several agents on this machine with
+fake_adb.py and fake_appium_server.py and no phones.
+"""
+import argparse
+import collections
+import importlib
+import json
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import live_config
+import run_ledger
+from run_ledger import RunLedger
+from thread_workers import spawn_workers, respawn_dead
+from watchdog import terminate_stalled
+from worker_factory import worker_context
+
+# --- Configuration ---
+COORDINATOR_PORT = 9100
+HEARTBEAT_INTERVAL = 2          # seconds between agent heartbeats
+AGENT_TIMEOUT = 8               # seconds without a heartbeat before an agent is dropped
+AGENT_CAPACITY = 16             # devices one agent drives at most
+SCENARIO_WEIGHTS = {"play": 1, "banner": 1}
+SCENARIOS = {
+    "play": "basketballShotsTestManyDevices_2:run_loop_on",
+    "banner": "banerClicking_3:run_loop_on",
+}
+APPIUM_COMMAND = ["appium", "-p", "{port}", "--session-override"]
+APPIUM_START_TIMEOUT = 30
+DEMO_ITERATION_SECONDS = 0.5
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# -- coordinator --------------------------------------------------------
+
+def scenario_targets(weights, n):
+    """
+    Device count per scenario for n devices (largest remainder).
+    """
+    total = sum(weights.values())
+    exact = {s: n * w / total for s, w in weights.items()}
+    targets = {s: int(v) for s, v in exact.items()}
+    spare = n - sum(targets.values())
+    for s in sorted(exact, key=lambda s: exact[s] - targets[s], reverse=True)[:spare]:
+        targets[s] += 1
+    return targets
+
+
+class Coordinator:
+    def __init__(self, weights=SCENARIO_WEIGHTS, agent_timeout=AGENT_TIMEOUT):
+        self.weights = dict(weights)
+        self.agent_timeout = agent_timeout
+        self.agents = {}            # agent id -> latest heartbeat + last_seen
+        self.assignments = {}       # (agent id, udid) -> scenario
+        # (agent id, agent run) -> {scenario: [iterations, device seconds]} of agents that are gone
+        self.departed = {}
+        self._lock = threading.Lock()
+
+    def heartbeat(self, report):
+        """
+        Records an agent's heartbeat and returns {udid: scenario} for it.
+        """
+        agent_id = report["agent"]
+        with self._lock:
+            if agent_id not in self.agents:
+                print(f"Agent {agent_id} joined: {len(report['devices'])} devices, capacity {report['capacity']}")
+            # an agent back from a timeout reports its totals from its start again
+            self.departed.pop((agent_id, report.get("run")), None)
+            self.agents[agent_id] = dict(report, last_seen=time.time())
+            self._expire()
+            self._rebalance()
+            return {udid: s for (a, udid), s in self.assignments.items() if a == agent_id}
+
+    def leave(self, agent_id, reason="left"):
+        with self._lock:
+            self._drop(agent_id, reason)
+            self._rebalance()
+
+    def tick(self):
+        with self._lock:
+            if self._expire():
+                self._rebalance()
+
+    def _expire(self):
+        now = time.time()
+        stale = [a for a, r in self.agents.items() if now - r["last_seen"] > self.agent_timeout]
+        for agent_id in stale:
+            self._drop(agent_id, "timed out")
+        return bool(stale)
+
+    def _drop(self, agent_id, reason):
+        report = self.agents.pop(agent_id, None)
+        if report is None:
+            return
+        self.departed[(agent_id, report.get("run"))] = report.get("scenarios", {})
+        print(f"Agent {agent_id} {reason}; rebalancing")
+
+    def _rebalance(self):
+        slots = []
+        for agent_id in sorted(self.agents):
+            report = self.agents[agent_id]
+            slots += [(agent_id, udid) for udid in sorted(report["devices"])[:report["capacity"]]]
+        live = set(slots)
+        self.assignments = {k: s for k, s in self.assignments.items() if k in live and s in self.weights}
+
+        targets = scenario_targets(self.weights, len(slots))
+        counts = collections.Counter(self.assignments.values())
+        for key in sorted(self.assignments, reverse=True):
+            scenario = self.assignments[key]
+            if counts[scenario] > targets[scenario]:
+                del self.assignments[key]
+                counts[scenario] -= 1
+        for key in slots:
+            if key not in self.assignments:
+                scenario = max(self.weights, key=lambda s: targets[s] - counts[s])
+                self.assignments[key] = scenario
+                counts[scenario] += 1
+
+    def status(self):
+        with self._lock:
+            scenarios = {s: {"devices": 0, "iterations": 0, "device_seconds": 0.0} for s in self.weights}
+            for scenario in self.assignments.values():
+                scenarios[scenario]["devices"] += 1
+            totals = list(self.departed.values()) + [r.get("scenarios", {}) for r in self.agents.values()]
+            for report in totals:
+                for scenario, (n, secs) in report.items():
+                    row = scenarios.setdefault(scenario, {"devices": 0, "iterations": 0, "device_seconds": 0.0})
+                    row["iterations"] += n
+                    row["device_seconds"] += secs
+            for row in scenarios.values():
+                row["per_hour"] = row["iterations"] * 3600.0 / row["device_seconds"] if row["device_seconds"] else 0.0
+            now = time.time()
+            agents = {a: {"devices": len(r["devices"]), "capacity": r["capacity"],
+                          "assigned": sum(1 for (x, _u) in self.assignments if x == a),
+                          "seen_ago": now - r["last_seen"]}
+                      for a, r in self.agents.items()}
+            return {"weights": self.weights, "agents": agents, "scenarios": scenarios}
+
+
+def make_handler(coordinator):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, value):
+            payload = json.dumps(value).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._send(200, coordinator.status())
+            else:
+                self._send(404, {"error": self.path})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/heartbeat":
+                self._send(200, {"assignments": coordinator.heartbeat(body)})
+            elif self.path == "/leave":
+                coordinator.leave(body["agent"])
+                self._send(200, {})
+            else:
+                self._send(404, {"error": self.path})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve_coordinator(port=COORDINATOR_PORT, weights=SCENARIO_WEIGHTS, background=False):
+    coordinator = Coordinator(weights)
+    server = ThreadingHTTPServer(("0.0.0.0", port), make_handler(coordinator))
+    server.daemon_threads = True
+
+    def expire_loop():
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            coordinator.tick()
+
+    threading.Thread(target=expire_loop, daemon=True).start()
+    print(f"Coordinator on port {port}, scenarios {weights}")
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, coordinator
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def _call(url, path, body=None, timeout=5):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url.rstrip("/") + path, data=data,
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def format_status(status):
+    lines = [f"{'agent':<24} {'devices':>8} {'capacity':>9} {'assigned':>9} {'seen':>6}"]
+    for agent_id, a in sorted(status["agents"].items()):
+        lines.append(f"{agent_id:<24} {a['devices']:>8} {a['capacity']:>9} {a['assigned']:>9} {a['seen_ago']:>5.1f}s")
+    lines.append("")
+    lines.append(f"{'scenario':<24} {'weight':>7} {'devices':>8} {'iterations':>11} {'iter/h/dev':>11}")
+    for scenario, row in sorted(status["scenarios"].items()):
+        lines.append(f"{scenario:<24} {status['weights'].get(scenario, 0):>7} {row['devices']:>8} "
+                     f"{row['iterations']:>11} {row['per_hour']:>11.1f}")
+    return "\n".join(lines)
+
+
+# -- agent --------------------------------------------------------------
+
+def adb_command():
+    """
+    The adb executable; ADB in the environment overrides it (fake_adb.py).
+    """
+    return shlex.split(os.environ.get("ADB", "adb"))
+
+
+def list_devices():
+    raw = subprocess.run(adb_command() + ["devices"], capture_output=True, text=True, timeout=15).stdout
+    udids = []
+    for line in raw.strip().splitlines()[1:]:
+        parts = line.split()
+        if len(parts) == 2 and parts[1] == "device" and not parts[0].startswith("emulator-"):
+            udids.append(parts[0])
+    return udids
+
+
+def load_scenario(name):
+    module, func = SCENARIOS[name].split(":")
+    return getattr(importlib.import_module(module), func)
+
+
+def demo_loop(udid, server_port, system_port, ledger=None, device_index=None):
+    """
+    Stand-in scenario for dry runs: one find + click per iteration against
+    whatever server is on server_port.
+    """
+    from appium import webdriver
+    from appium.options.android import UiAutomator2Options
+    from appium.webdriver.common.appiumby import AppiumBy
+
+    opts = UiAutomator2Options()
+    opts.udid = udid
+    opts.system_port = system_port
+    driver = webdriver.Remote(f"http://localhost:{server_port}", options=opts)
+    iteration = ledger.resume()[0] - 1 if ledger else 0
+    try:
+        while True:
+            iteration += 1
+            started = time.time()
+            driver.find_element(AppiumBy.XPATH, "//android.widget.Button[@text='Play']").click()
+            time.sleep(DEMO_ITERATION_SECONDS)
+            if ledger:
+                ledger.iteration(iteration, started)
+    finally:
+        driver.quit()
+
+
+def wait_for_server(port, timeout=APPIUM_START_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/status", timeout=2):
+                return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    return False
+
+
+class Agent:
+    def __init__(self, coordinator_url, agent_id, capacity=AGENT_CAPACITY,
+                 port_base=None, system_port_base=None,
+                 appium_command=APPIUM_COMMAND, ledger_path=run_ledger.LEDGER_DB, dry_run=False):
+        self.url = coordinator_url
+        self.agent_id = agent_id
+        self.capacity = capacity
+        # port bases not given on the command line come from config.yaml
+        config_base, self.port_offset, config_system_base = live_config.LiveConfig().ports()
+        self.port_base = port_base if port_base is not None else config_base
+        self.system_port_base = system_port_base if system_port_base is not None else config_system_base
+        self.appium_command = appium_command
+        self.dry_run = dry_run
+        self.context = worker_context()
+        self.ledger = RunLedger(ledger_path, self.context)
+        self.ledger.begin_run(f"fleet:{agent_id}")
+        self.slots = {}             # udid -> port slot, kept for the agent's lifetime
+        self.servers = {}           # udid -> Appium Popen
+        self.running = {}           # udid -> {"scenario", "proc", "base", "started"}
+        self.totals = collections.defaultdict(lambda: [0, 0.0])    # finished assignments per scenario
+        self.stopping = False
+
+    def _slot(self, udid):
+        if udid not in self.slots:
+            used = set(self.slots.values())
+            self.slots[udid] = next(i for i in range(len(used) + 1) if i not in used)
+        return self.slots[udid]
+
+    def _iteration_counts(self):
+        conn = run_ledger.connect(self.ledger.path)
+        try:
+            return dict(conn.execute("SELECT udid, COUNT(*) FROM iterations WHERE run_id = ? GROUP BY udid",
+                                     (self.ledger.run_id,)).fetchall())
+        finally:
+            conn.close()
+
+    def scenario_metrics(self):
+        """
+        {scenario: [iterations, device seconds]} since the agent started.
+        """
+        counts = self._iteration_counts()
+        out = {s: list(v) for s, v in self.totals.items()}
+        now = time.time()
+        for udid, w in self.running.items():
+            row = out.setdefault(w["scenario"], [0, 0.0])
+            row[0] += counts.get(udid, 0) - w["base"]
+            row[1] += now - w["started"]
+        return out
+
+    def start(self, udid, scenario):
+        slot = self._slot(udid)
+        port = self.port_base + slot * self.port_offset
+        system_port = self.system_port_base + slot
+        if udid not in self.servers or self.servers[udid].poll() is not None:
+            cmd = [part.format(port=port) for part in self.appium_command]
+            self.servers[udid] = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                                  shell=(sys.platform == "win32"))
+            if not wait_for_server(port):
+                print(f"[{self.agent_id}] Appium on {port} for {udid} did not come up")
+                return
+        target = demo_loop if self.dry_run else load_scenario(scenario)
+        [proc] = spawn_workers(target, [(udid, (udid, port, system_port, self.ledger.client(udid), slot))],
+                               "process", context=self.context)
+        self.running[udid] = {"scenario": scenario, "proc": proc, "target": target,
+                              "base": self._iteration_counts().get(udid, 0), "started": time.time()}
+        print(f"[{self.agent_id}] {udid} → {scenario} (Appium {port}, systemPort {system_port})")
+
+    def stop(self, udids):
+        """
+        Stops the workers of `udids` (their Appium servers stay up) and adds
+        what they did to the finished totals.
+        """
+        stopped = [(udid, self.running.pop(udid)) for udid in udids]
+        for _udid, w in stopped:
+            w["proc"].terminate()
+        for _udid, w in stopped:
+            w["proc"].join(5)
+        if not stopped:
+            return
+        # let the ledger writer commit the last rows before they are counted
+        time.sleep(run_ledger.BATCH_INTERVAL + 0.2)
+        counts = self._iteration_counts()
+        for udid, w in stopped:
+            row = self.totals[w["scenario"]]
+            row[0] += counts.get(udid, 0) - w["base"]
+            row[1] += time.time() - w["started"]
+
+    def reconcile(self, assignments):
+        """
+        Makes the running workers match {udid: scenario}.
+        """
+        self.stop([udid for udid, w in self.running.items() if assignments.get(udid) != w["scenario"]])
+        for udid in list(self.servers):
+            if udid not in assignments and udid not in self.running:
+                self.servers.pop(udid).terminate()
+        for udid, scenario in sorted(assignments.items()):
+            if udid not in self.running:
+                self.start(udid, scenario)
+        terminate_stalled([w["proc"] for w in self.running.values()], self.ledger.last_progress)
+        for w in self.running.values():
+            if not w["proc"].is_alive() and w["proc"].exitcode != 0:
+                w["proc"] = respawn_dead(w["target"], [w["proc"]], "process", self.context)[0]
+
+    def run(self):
+        while not self.stopping:
+            try:
+                devices = list_devices()
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"[{self.agent_id}] adb failed: {e}")
+                devices = list(self.running)
+            report = {"agent": self.agent_id, "run": self.ledger.run_id,
+                      "host": socket.gethostname(), "devices": devices,
+                      "capacity": self.capacity, "scenarios": self.scenario_metrics()}
+            try:
+                assignments = _call(self.url, "/heartbeat", report)["assignments"]
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                # keep the phones busy with what they have while the coordinator is away
+                print(f"[{self.agent_id}] coordinator unreachable: {e}")
+            else:
+                if not self.stopping:
+                    self.reconcile(assignments)
+            time.sleep(HEARTBEAT_INTERVAL)
+
+    def shutdown(self, leave=True):
+        self.stopping = True
+        for udid in list(self.running):
+            self.running.pop(udid)["proc"].terminate()
+        for server in self.servers.values():
+            server.terminate()
+        self.servers.clear()
+        if leave:
+            try:
+                _call(self.url, "/leave", {"agent": self.agent_id})
+            except (urllib.error.URLError, OSError):
+                pass
+        self.ledger.end_run()
+
+
+def run_agent(args):
+    command = APPIUM_COMMAND
+    if args.fake_appium:
+        command = [sys.executable, os.path.join(HERE, "fake_appium_server.py"), "{port}"]
+    agent = Agent(args.coordinator, args.name or socket.gethostname(), args.capacity,
+                  args.port_base, args.system_port_base, command, args.ledger, args.dry_run)
+
+    def stop(signum, frame):
+        # SIGINT leaves the fleet; SIGTERM just stops, like a lost host
+        agent.shutdown(leave=(signum == signal.SIGINT))
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    agent.run()
+
+
+# -- demo ---------------------------------------------------------------
+
+def run_demo(agents=3, devices_per_agent=4, seconds=30):
+    """
+    Coordinator plus `agents` local agents with fake phones. Halfway through
+    the first agent is killed without leaving, to show timeout and rebalance.
+    """
+    workdir = tempfile.mkdtemp(prefix="fleet-demo-")
+    port = COORDINATOR_PORT
+    server, coordinator = serve_coordinator(port, SCENARIO_WEIGHTS, background=True)
+    url = f"http://127.0.0.1:{port}"
+    procs = []
+    for i in range(agents):
+        env = dict(os.environ,
+                   ADB=f"{shlex.quote(sys.executable)} {shlex.quote(os.path.join(HERE, 'fake_adb.py'))}",
+                   FAKE_ADB_DEVICES=",".join(f"host{i}-dev{j}" for j in range(devices_per_agent)))
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "agent", "--coordinator", url, "--name", f"host{i}",
+             "--port-base", str(4800 + i * 100), "--system-port-base", str(8300 + i * 100),
+             "--ledger", os.path.join(workdir, f"host{i}.sqlite"), "--fake-appium", "--dry-run"],
+            env=env, cwd=workdir))
+
+    time.sleep(seconds / 2)
+    print(format_status(coordinator.status()))
+    print("\nStopping host0 without leaving the fleet…")
+    procs[0].send_signal(signal.SIGTERM)
+    time.sleep(max(seconds / 2, AGENT_TIMEOUT + 3 * HEARTBEAT_INTERVAL))
+    print(format_status(coordinator.status()))
+    for p in procs[1:]:
+        p.send_signal(signal.SIGINT)
+    for p in procs:
+        p.wait(30)
+    server.shutdown()
+    print(f"\nLedgers in {workdir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-host fleet coordinator and agent")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    c = sub.add_parser("coordinator")
+    c.add_argument("--port", type=int, default=COORDINATOR_PORT)
+    c.add_argument("--scenarios", default=",".join(f"{k}={v}" for k, v in SCENARIO_WEIGHTS.items()),
+                   help="weights, e.g. play=3,banner=1")
+
+    a = sub.add_parser("agent")
+    a.add_argument("--coordinator", required=True)
+    a.add_argument("--name")
+    a.add_argument("--capacity", type=int, default=AGENT_CAPACITY)
+    a.add_argument("--port-base", type=int, help="default: ports.appium_base in config.yaml")
+    a.add_argument("--system-port-base", type=int, help="default: ports.system_base in config.yaml")
+    a.add_argument("--ledger", default=run_ledger.LEDGER_DB)
+    a.add_argument("--fake-appium", action="store_true", help="start fake_appium_server.py instead of appium")
+    a.add_argument("--dry-run", action="store_true", help="run demo_loop for every scenario")
+
+    s = sub.add_parser("status")
+    s.add_argument("--coordinator", required=True)
+
+    d = sub.add_parser("demo")
+    d.add_argument("agents", nargs="?", type=int, default=3)
+    d.add_argument("devices_per_agent", nargs="?", type=int, default=4)
+    d.add_argument("seconds", nargs="?", type=int, default=30)
+
+    args = parser.parse_args()
+    if args.command == "coordinator":
+        weights = {k: float(v) for k, v in (p.split("=") for p in args.scenarios.split(","))}
+        serve_coordinator(args.port, weights)
+    elif args.command == "agent":
+        run_agent(args)
+    elif args.command == "status":
+        print(format_status(_call(args.coordinator, "/status")))
+    else:
+        run_demo(args.agents, args.devices_per_agent, args.seconds)
@@ -0,0 +1,119 @@
+"""
+Gesture batching: taps, swipes and pauses compiled into one W3C `actions`
+request (or one `mobile:` gesture when the batch is a single tap/swipe),
+so the whole sequence runs on the server in a single round trip.
+"""
+
+
+class RoundTripCounter:
+    """
+    Counts HTTP commands sent through a driver. Installed by wrapping the
+    driver's command executor; `saved` accumulates what batching avoided.
+    """
+
+    def __init__(self, driver):
+        self.count = 0
+        self.saved = 0
+        executor = driver.command_executor
+        inner = executor.execute
+
+        def counting_execute(command, params):
+            self.count += 1
+            return inner(command, params)
+
+        executor.execute = counting_execute
+
+    def take(self):
+        """
+        Returns (round trips, round trips without batching) since the last
+        call and starts a new window.
+        """
+        actual, unbatched = self.count, self.count + self.saved
+        self.count = self.saved = 0
+        return actual, unbatched
+
+
+class GestureBatch:
+    """
+    Builder for one touch sequence. Coordinates are device pixels,
+    durations milliseconds.
+    """
+
+    def __init__(self, pointer="finger"):
+        self.pointer = pointer
+        self._steps = []        # (kind, args) in order, kept for the mobile: shortcut
+        self._actions = []
+
+    def tap(self, x, y, hold_ms=50):
+        self._steps.append(("tap", (x, y)))
+        self._actions += [
+            {"type": "pointerMove", "duration": 0, "x": int(x), "y": int(y)},
+            {"type": "pointerDown", "button": 0},
+            {"type": "pause", "duration": hold_ms},
+            {"type": "pointerUp", "button": 0},
+        ]
+        return self
+
+    def swipe(self, x1, y1, x2, y2, duration_ms=300, hold_ms=0):
+        """
+        `hold_ms` keeps the finger down at the end, so the list stops where
+        the finger did instead of flinging on.
+        """
+        self._steps.append(("swipe", (x1, y1, x2, y2, duration_ms, hold_ms)))
+        self._actions += [
+            {"type": "pointerMove", "duration": 0, "x": int(x1), "y": int(y1)},
+            {"type": "pointerDown", "button": 0},
+            {"type": "pointerMove", "duration": duration_ms, "x": int(x2), "y": int(y2)},
+        ]
+        if hold_ms:
+            self._actions.append({"type": "pause", "duration": int(hold_ms)})
+        self._actions.append({"type": "pointerUp", "button": 0})
+        return self
+
+    def pause(self, ms):
+        self._steps.append(("pause", (ms,)))
+        self._actions.append({"type": "pause", "duration": int(ms)})
+        return self
+
+    @property
+    def unbatched_round_trips(self):
+        """
+        Requests the same sequence costs when every tap and swipe is sent on
+        its own (pauses are host-side sleeps and cost nothing).
+        """
+        return sum(1 for kind, _ in self._steps if kind != "pause")
+
+    def w3c_payload(self):
+        return {"actions": [{
+            "type": "pointer",
+            "id": self.pointer,
+            "parameters": {"pointerType": "touch"},
+            "actions": self._actions,
+        }]}
+
+    def perform(self, driver, counter=None, replaces=None):
+        """
+        Sends the batch in a single request. `replaces` is the number of
+        requests the caller's unbatched code path would have made, if that
+        differs from unbatched_round_trips (e.g. a UiScrollable lookup that
+        did all the swipes in one call).
+        """
+        if not self._steps:
+            return
+        if len(self._steps) == 1 and self._steps[0][0] == "tap":
+            x, y = self._steps[0][1]
+            driver.execute_script("mobile: clickGesture", {"x": int(x), "y": int(y)})
+        elif len(self._steps) == 1 and self._steps[0][0] == "swipe" and not self._steps[0][1][5]:
+            x1, y1, x2, y2, duration_ms, _hold = self._steps[0][1]
+            # dragGesture speed is px/s; match the requested duration
+            distance = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
+            driver.execute_script("mobile: dragGesture", {
+                "startX": int(x1), "startY": int(y1), "endX": int(x2), "endY": int(y2),
+                "speed": max(1, int(distance * 1000 / max(1, duration_ms))),
+            })
+        else:
+            driver.execute("actions", self.w3c_payload())
+        if counter is not None:
+            if replaces is None:
+                replaces = self.unbatched_round_trips
+            counter.saved += max(0, replaces - 1)
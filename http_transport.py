@@ -0,0 +1,240 @@
+"""
+Pooled, tuned HTTP transport for the Appium clients.
+
+webdriver.Remote(url) talks through a stock AppiumConnection. Per command
+it re-parses the URL and rebuilds the headers through class-level state
+shared by every driver in the process. It copies the params for a debug
+line and looks the pool up through PoolManager. Every command gets the
+same timeout and urllib3's default retries. Its SYSTEM proxy setting
+also reads http_proxy / no_proxy at startup, so an exported proxy can
+route localhost traffic through it.
+
+TunedConnection talks to one local Appium server over a single keep-alive
+HTTPConnectionPool:
+
+- headers are built once per connection; the idempotency key goes only
+  on POST /session;
+- no proxy and no environment lookups; no retries, so a failed command
+  reaches the step's own error handling at once;
+- connect and read timeouts per command class (COMMAND_TIMEOUTS). The
+  read timeout is capped by client_config.timeout, which the watchdog
+  sets to the deadline of the current step;
+- its connections are kept in `sockets`, so the watchdog can cut a
+  blocked read.
+
+    driver = webdriver.Remote(connect(server_url), options=opts)
+
+    python http_transport.py [requests]     per-command overhead, stock vs tuned
+"""
+import statistics
+import string
+import subprocess
+import sys
+import time
+import uuid
+import weakref
+from urllib.parse import urlparse
+
+import urllib3
+from appium.webdriver.appium_connection import AppiumConnection, HEADER_IDEMOTENCY_KEY
+from appium.webdriver.client_config import AppiumClientConfig
+from selenium.webdriver.common.proxy import Proxy, ProxyType
+from selenium.webdriver.remote import utils
+from selenium.webdriver.remote.errorhandler import ErrorCode
+from selenium.webdriver.remote.remote_connection import remote_commands
+
+# --- Configuration ---
+POOL_SIZE = 4                   # a worker rarely has more than two requests in flight
+COMMAND_TIMEOUTS = {            # (connect, read) seconds
+    "session": (5, 180),
+    "find": (2, 30),
+    "action": (2, 30),
+    "app": (2, 60),
+    "script": (2, 60),
+    "source": (2, 60),
+    "default": (2, 60),
+}
+COMMAND_CLASSES = {
+    "newSession": "session",
+    "quit": "session",
+    "findElement": "find",
+    "findElements": "find",
+    "findChildElement": "find",
+    "findChildElements": "find",
+    "getElementRect": "find",
+    "clickElement": "action",
+    "actions": "action",
+    "getPageSource": "source",
+    "screenshot": "source",
+    "terminateApp": "app",
+    "activateApp": "app",
+}
+APP_SCRIPTS = ("mobile: terminateApp", "mobile: activateApp", "mobile: startActivity")
+BENCH_PORT = 4791
+
+
+def command_class(command, params):
+    if command == "w3cExecuteScript":
+        script = params.get("script", "") if isinstance(params, dict) else ""
+        return "app" if script.startswith(APP_SCRIPTS) else "script"
+    return COMMAND_CLASSES.get(command, "default")
+
+
+def tracked_pool(registry):
+    """
+    An HTTPConnectionPool class whose connections add themselves to
+    `registry` (a WeakSet) when they connect, so a blocked read can be cut.
+    """
+    class Connection(urllib3.connection.HTTPConnection):
+        def connect(self):
+            super().connect()
+            registry.add(self)
+
+    class Pool(urllib3.HTTPConnectionPool):
+        ConnectionCls = Connection
+
+    return Pool
+
+
+class TunedConnection(AppiumConnection):
+    def __init__(self, client_config):
+        # the stock constructor would build a PoolManager; this keeps one pool instead
+        self._client_config = client_config
+        self._proxy_url = None
+        self._commands = remote_commands
+        url = urlparse(client_config.remote_server_addr)
+        self._prefix = url.path.rstrip("/")
+        self.sockets = weakref.WeakSet()
+        self._pool = tracked_pool(self.sockets)(url.hostname, url.port or 80, maxsize=POOL_SIZE,
+                                                 block=False, retries=False)
+        self._conn = self._pool         # what the stock close() and callers expect
+        self._headers = {"Accept": "application/json",
+                         "Content-Type": "application/json;charset=UTF-8",
+                         "User-Agent": AppiumConnection.user_agent,
+                         "Connection": "keep-alive"}
+        self._templates = {}
+
+    def _path(self, command, params):
+        template = self._templates.get(command)
+        if template is None:
+            method, path = self._commands.get(command) or self.extra_commands[command]
+            names = [w[1:] for w in path.split("/") if w.startswith("$")]
+            template = self._templates[command] = (method, string.Template(path), names)
+        method, path, names = template
+        url = path.substitute(params)
+        for name in names:
+            params.pop(name, None)
+        return method, url
+
+    def execute(self, command, params):
+        method, path = self._path(command, params)
+        connect, read = COMMAND_TIMEOUTS[command_class(command, params)]
+        cap = self._client_config.timeout
+        if isinstance(cap, (int, float)):
+            read = min(read, cap)
+        headers = self._headers
+        if command == "newSession":
+            headers = dict(headers, **{HEADER_IDEMOTENCY_KEY: str(uuid.uuid4())})
+        body = utils.dump_json(params) if method in ("POST", "PUT") else None
+        response = self._pool.urlopen(method, self._prefix + path, body=body, headers=headers,
+                                      timeout=urllib3.Timeout(connect=connect, read=read),
+                                      retries=False, redirect=False)
+        return self._parse(response)
+
+    @staticmethod
+    def _parse(response):
+        # same results as RemoteConnection._request for the statuses Appium sends
+        status = response.status
+        data = response.data.decode("UTF-8")
+        if 399 < status <= 500:
+            if status == 401:
+                return {"status": status, "value": "Authorization Required"}
+            return {"status": status, "value": data.strip() or str(status)}
+        if response.headers.get("Content-Type", "").startswith("image/png"):
+            return {"status": 0, "value": data}
+        try:
+            data = utils.load_json(data.strip())
+        except ValueError:
+            return {"status": ErrorCode.SUCCESS if 199 < status < 300 else ErrorCode.UNKNOWN_ERROR,
+                    "value": data.strip()}
+        if "value" not in data:
+            data["value"] = None
+        return data
+
+    def close(self):
+        self._pool.close()
+
+
+def client_config(server_url, timeout=None):
+    return AppiumClientConfig(server_url, proxy=Proxy(raw={"proxyType": ProxyType.DIRECT}), timeout=timeout)
+
+
+def connect(server_url, timeout=None):
+    """
+    A TunedConnection for webdriver.Remote(command_executor=...). `timeout`
+    caps every read (the watchdog adjusts it per step afterwards).
+    """
+    return TunedConnection(client_config(server_url, timeout))
+
+
+# -- benchmark ----------------------------------------------------------
+
+def _bench_driver(executor, port):
+    from appium import webdriver
+    from appium.options.android import UiAutomator2Options
+    opts = UiAutomator2Options()
+    opts.udid = "bench"
+    if executor == "stock":
+        return webdriver.Remote(f"http://127.0.0.1:{port}", options=opts)
+    return webdriver.Remote(connect(f"http://127.0.0.1:{port}"), options=opts)
+
+
+def benchmark(requests=2000, port=BENCH_PORT):
+    """
+    Mean / p50 / p99 microseconds per command for the stock connection and
+    TunedConnection against fake_appium_server in its own process (no
+    added latency), so the numbers are client overhead plus loopback.
+    """
+    from appium.webdriver.common.appiumby import AppiumBy
+    import fake_appium_server
+    from fleet import wait_for_server
+
+    server = subprocess.Popen([sys.executable, fake_appium_server.__file__, str(port)],
+                              stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(port)
+        commands = {
+            "find_elements": lambda d, el: d.find_elements(AppiumBy.ID, "play"),
+            "click": lambda d, el: el.click(),
+            "clickGesture": lambda d, el: d.execute_script("mobile: clickGesture", {"x": 1, "y": 2}),
+            "window_size": lambda d, el: d.get_window_size(),
+        }
+        rows = {}
+        for executor in ("stock", "tuned"):
+            driver = _bench_driver(executor, port)
+            element = driver.find_element(AppiumBy.ID, "play")
+            for name, call in commands.items():
+                for _ in range(50):
+                    call(driver, element)
+                samples = []
+                for _ in range(requests):
+                    t0 = time.perf_counter()
+                    call(driver, element)
+                    samples.append((time.perf_counter() - t0) * 1e6)
+                samples.sort()
+                rows[(name, executor)] = (statistics.fmean(samples), samples[len(samples) // 2],
+                                          samples[int(len(samples) * 0.99)])
+            driver.quit()
+    finally:
+        server.terminate()
+    lines = [f"{'command':<16} {'executor':<8} {'mean us':>9} {'p50 us':>9} {'p99 us':>9}"]
+    for (name, executor), (mean, p50, p99) in rows.items():
+        lines.append(f"{name:<16} {executor:<8} {mean:>9.0f} {p50:>9.0f} {p99:>9.0f}")
+    for name in commands:
+        stock, tuned = rows[(name, "stock")][0], rows[(name, "tuned")][0]
+        lines.append(f"{name:<16} saved {stock - tuned:.0f} us/command ({100 * (1 - tuned / stock):.0f}%)")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,232 @@
+"""
+HDR-style latency histograms with bounded memory.
+
+Values are recorded in microseconds into log-linear buckets sized so that
+every value is represented to SIGNIFICANT_DIGITS decimal digits, between 1 us
+and HIGHEST_TRACKABLE. Memory depends only on those two settings, never on
+the number of samples. Histograms with the same settings merge by adding
+counts, so per-worker snapshots can be combined across processes and hosts.
+
+Workers write a snapshot per session to HISTOGRAM_DIR/<name>.hdr;
+
+    python latency_histogram.py [dir]
+
+merges them and prints p50/p90/p99/p99.9 per step and per device/step.
+"""
+import base64
+import glob
+import json
+import math
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+# --- Configuration ---
+HISTOGRAM_DIR = "histograms"
+SIGNIFICANT_DIGITS = 3
+HIGHEST_TRACKABLE = 3600 * 1000 * 1000      # one hour, in microseconds
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+_SNAPSHOT_HEADER = struct.Struct("<4sBQqqI")    # magic, digits, highest, min, max, counts length
+_MAGIC = b"HDR1"
+
+
+class LatencyHistogram:
+    """
+    record() takes seconds (as measured by the loops); everything inside is
+    integer microseconds.
+    """
+
+    def __init__(self, significant_digits=SIGNIFICANT_DIGITS, highest=HIGHEST_TRACKABLE):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("significant_digits must be 1..5")
+        self.significant_digits = significant_digits
+        self.highest = highest
+        largest_single_unit = 2 * 10 ** significant_digits
+        self._sub_bucket_count_magnitude = int(math.ceil(math.log2(largest_single_unit)))
+        self._half_magnitude = self._sub_bucket_count_magnitude - 1
+        self._sub_bucket_count = 1 << self._sub_bucket_count_magnitude
+        self._half_count = self._sub_bucket_count // 2
+        self._sub_bucket_mask = self._sub_bucket_count - 1
+
+        bucket_count, smallest_untrackable = 1, self._sub_bucket_count
+        while smallest_untrackable <= highest:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.counts = np.zeros((bucket_count + 1) * self._half_count, dtype=np.int64)
+        self.total = 0
+        self.min = sys.maxsize
+        self.max = 0
+        self._values = None     # lazily built index -> value table
+
+    # -- indexing -------------------------------------------------------
+
+    def _index(self, value):
+        bucket = (value | self._sub_bucket_mask).bit_length() - self._half_magnitude - 1
+        sub_bucket = value >> bucket
+        return ((bucket + 1) << self._half_magnitude) + (sub_bucket - self._half_count)
+
+    def _value_table(self):
+        """
+        Highest value that falls into each counts slot, as an array.
+        """
+        if self._values is None:
+            idx = np.arange(self.counts.size, dtype=np.int64)
+            bucket = (idx >> self._half_magnitude) - 1
+            sub_bucket = (idx & (self._half_count - 1)) + self._half_count
+            low = bucket < 0
+            sub_bucket[low] -= self._half_count
+            bucket[low] = 0
+            lowest = sub_bucket << bucket
+            self._values = lowest + (np.int64(1) << bucket) - 1
+        return self._values
+
+    # -- recording ------------------------------------------------------
+
+    def record(self, seconds, count=1):
+        self.record_us(int(seconds * 1e6), count)
+
+    def record_us(self, value, count=1):
+        value = min(max(0, value), self.highest)
+        self.counts[self._index(value)] += count
+        self.total += count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if (other.significant_digits, other.highest) != (self.significant_digits, self.highest):
+            raise ValueError("cannot merge histograms with different settings")
+        self.counts += other.counts
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    # -- queries --------------------------------------------------------
+
+    def percentiles(self, pcts=REPORT_PERCENTILES):
+        """
+        {pct: seconds} for several percentiles in one pass over the counts.
+        """
+        if self.total == 0:
+            return {p: None for p in pcts}
+        cumulative = np.cumsum(self.counts)
+        ranks = [max(1, math.ceil(p / 100.0 * self.total)) for p in pcts]
+        idx = np.searchsorted(cumulative, ranks, side="left")
+        values = self._value_table()[idx]
+        return {p: min(int(v), self.max) / 1e6 for p, v in zip(pcts, values)}
+
+    def percentile(self, pct):
+        return self.percentiles((pct,))[pct]
+
+    # -- snapshots ------------------------------------------------------
+
+    def to_bytes(self):
+        body = zlib.compress(self.counts.astype("<i8").tobytes(), 6)
+        return _SNAPSHOT_HEADER.pack(_MAGIC, self.significant_digits, self.highest,
+                                     self.min if self.total else -1, self.max, self.counts.size) + body
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, digits, highest, lo, hi, length = _SNAPSHOT_HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError("not a histogram snapshot")
+        h = cls(digits, highest)
+        counts = np.frombuffer(zlib.decompress(data[_SNAPSHOT_HEADER.size:]), dtype="<i8")
+        if counts.size != length or length != h.counts.size:
+            raise ValueError("histogram snapshot size mismatch")
+        h.counts[:] = counts
+        h.total = int(counts.sum())
+        h.min = sys.maxsize if lo < 0 else lo
+        h.max = hi
+        return h
+
+
+class HistogramSet:
+    """
+    Histograms keyed by (device, step) for one worker.
+    """
+
+    def __init__(self, significant_digits=SIGNIFICANT_DIGITS, highest=HIGHEST_TRACKABLE):
+        self.significant_digits = significant_digits
+        self.highest = highest
+        self.histograms = {}
+
+    def record(self, device, step, seconds):
+        key = (str(device), step)
+        h = self.histograms.get(key)
+        if h is None:
+            h = self.histograms[key] = LatencyHistogram(self.significant_digits, self.highest)
+        h.record(seconds)
+
+    def merge(self, other):
+        for key, h in other.histograms.items():
+            if key in self.histograms:
+                self.histograms[key].merge(h)
+            else:
+                self.histograms[key] = h
+        return self
+
+    def by_step(self):
+        merged = {}
+        for (_device, step), h in self.histograms.items():
+            if step not in merged:
+                merged[step] = LatencyHistogram(h.significant_digits, h.highest)
+            merged[step].merge(h)
+        return merged
+
+    def dumps(self):
+        """
+        JSON text, safe to send between hosts.
+        """
+        return json.dumps({f"{d}\t{s}": base64.b64encode(h.to_bytes()).decode("ascii")
+                           for (d, s), h in self.histograms.items()})
+
+    @classmethod
+    def loads(cls, text):
+        hs = cls()
+        for key, blob in json.loads(text).items():
+            device, step = key.split("\t", 1)
+            h = LatencyHistogram.from_bytes(base64.b64decode(blob))
+            hs.significant_digits, hs.highest = h.significant_digits, h.highest
+            hs.histograms[(device, step)] = h
+        return hs
+
+    def save(self, worker, directory=HISTOGRAM_DIR):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{worker}.hdr")
+        with open(path + ".tmp", "w") as f:
+            f.write(self.dumps())
+        os.replace(path + ".tmp", path)
+
+
+def load_all(directory=HISTOGRAM_DIR):
+    merged = HistogramSet()
+    for path in sorted(glob.glob(os.path.join(directory, "*.hdr"))):
+        with open(path) as f:
+            merged.merge(HistogramSet.loads(f.read()))
+    return merged
+
+
+def format_rows(rows):
+    header = f"{'key':<32} {'n':>9} " + " ".join(f"{'p' + str(p):>9}" for p in REPORT_PERCENTILES)
+    lines = [header]
+    for key, h in rows:
+        pcts = h.percentiles()
+        lines.append(f"{key:<32} {h.total:>9} " + " ".join(f"{pcts[p]:>9.3f}" for p in REPORT_PERCENTILES))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    hs = load_all(sys.argv[1] if len(sys.argv) > 1 else HISTOGRAM_DIR)
+    if not hs.histograms:
+        print("No histogram snapshots found.")
+        sys.exit(1)
+    print(format_rows(sorted(hs.by_step().items())))
+    print()
+    print(format_rows(sorted((f"{d}/{s}", h) for (d, s), h in hs.histograms.items())))
@@ -0,0 +1,237 @@
+"""
+Typed fleet configuration, reloaded while the fleet runs.
+
+config.yaml holds what used to be constants in each script: the port
+bases, and per scenario the app package plus the knobs a slow device
+needs turned:
+
+    pace: 1.5                       every sleep of the loop x 1.5
+    timeouts: {play: 40}            a click step's wait, seconds
+    sleeps: {ad_wait: 20}           a named sleep, N or [lo, hi]
+    locators: {quit: [...]}         a click step's locators (or a
+                                    gesture's fallback), as in the scenario
+
+Settings for a device are layered: the scenario file, then
+`scenarios.<name>`, then `models.<model>` (adb ro.product.model), then
+`devices.<udid>`. A model or device entry takes the same keys, applied to
+every scenario, plus `scenarios.<name>` for one of them.
+
+Workers check the file's mtime between iterations (at most every
+RELOAD_INTERVAL seconds) and apply new waits, pacing and locators from
+the next iteration on. A file that fails validation is reported and the
+previous settings stay. Ports, package and activity are read when the
+fleet or a session starts.
+
+    python live_config.py [udid [model]]     validate and print the settings per scenario
+"""
+import os
+import sys
+import time
+
+import yaml
+
+# --- Configuration ---
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
+RELOAD_INTERVAL = 5             # seconds between mtime checks in a worker
+PORTS = {"appium_base": 4723, "parallel_offset": 2, "system_base": 8200}
+SESSION_KEYS = ("package", "activity")          # applied when a session starts
+LIVE_KEYS = ("pace", "timeouts", "sleeps", "locators")
+
+
+# -- validation ---------------------------------------------------------
+
+def _number(value, where):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError(f"{where}: expected a non-negative number, got {value!r}")
+    return float(value)
+
+
+def _port(value, where):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 < value < 65536:
+        raise ValueError(f"{where}: expected a port number, got {value!r}")
+    return value
+
+
+def _string(value, where):
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{where}: expected a string, got {value!r}")
+    return value
+
+
+def _pace(value, where):
+    value = _number(value, where)
+    if value == 0:
+        raise ValueError(f"{where}: pace must be above 0")
+    return value
+
+
+def _sleep(value, where):
+    if isinstance(value, list):
+        if len(value) != 2:
+            raise ValueError(f"{where}: expected [lo, hi], got {value!r}")
+        low, high = (_number(v, where) for v in value)
+        if low > high:
+            raise ValueError(f"{where}: lo is above hi in {value!r}")
+        return [low, high]
+    return _number(value, where)
+
+
+def _locators(value, where):
+    # the locator kinds themselves are checked when scenario_engine applies them
+    if not isinstance(value, list) or not value:
+        raise ValueError(f"{where}: expected a list of locators, got {value!r}")
+    for entry in value:
+        if not isinstance(entry, dict) or len({k for k in entry if k != "pick"}) != 1:
+            raise ValueError(f"{where}: a locator needs exactly one kind, got {entry!r}")
+    return value
+
+
+def _mapping(value, where, check):
+    if not isinstance(value, dict):
+        raise ValueError(f"{where}: expected a mapping, got {value!r}")
+    return {str(k): check(v, f"{where}.{k}") for k, v in value.items()}
+
+
+FIELDS = {
+    "package": _string,
+    "activity": _string,
+    "pace": _pace,
+    "timeouts": lambda v, where: _mapping(v, where, _number),
+    "sleeps": lambda v, where: _mapping(v, where, _sleep),
+    "locators": lambda v, where: _mapping(v, where, _locators),
+}
+
+
+def _settings(block, where, nested):
+    """
+    One settings block; `nested` blocks (models, devices) may also hold
+    `scenarios.<name>` blocks.
+    """
+    out = {}
+    for key, value in _mapping(block or {}, where, lambda v, _where: v).items():
+        if key == "scenarios" and nested:
+            out[key] = {name: _settings(b, f"{where}.scenarios.{name}", False)
+                        for name, b in _mapping(value or {}, f"{where}.scenarios", lambda v, _w: v).items()}
+        elif key in FIELDS:
+            out[key] = FIELDS[key](value, f"{where}.{key}")
+        else:
+            raise ValueError(f"{where}: unknown key {key!r}")
+    return out
+
+
+def validate(spec):
+    """
+    The checked config (every section present) for a loaded config.yaml;
+    raises ValueError naming the offending key.
+    """
+    spec = _mapping(spec or {}, "config", lambda v, _where: v)
+    unknown = set(spec) - {"ports", "scenarios", "models", "devices"}
+    if unknown:
+        raise ValueError(f"unknown section(s): {sorted(unknown)}")
+    ports = dict(PORTS)
+    for key, value in _mapping(spec.get("ports") or {}, "ports", _port).items():
+        if key not in PORTS:
+            raise ValueError(f"ports: unknown key {key!r}")
+        ports[key] = value
+    sections = {"ports": ports}
+    for section in ("scenarios", "models", "devices"):
+        blocks = _mapping(spec.get(section) or {}, section, lambda v, _where: v)
+        sections[section] = {str(name): _settings(b, f"{section}.{name}", section != "scenarios")
+                             for name, b in blocks.items()}
+    return sections
+
+
+# -- resolution ---------------------------------------------------------
+
+def _merge(into, block):
+    for key, value in block.items():
+        if key == "scenarios":
+            continue
+        into[key] = dict(into.get(key, {}), **value) if isinstance(value, dict) else value
+
+
+def resolve(config, scenario, udid=None, model=None):
+    """
+    The settings of one device in one scenario, later layers winning
+    (mappings such as timeouts are merged key by key).
+    """
+    out = {}
+    _merge(out, config["scenarios"].get(scenario, {}))
+    for block in (config["models"].get(model), config["devices"].get(udid)):
+        if block:
+            _merge(out, block)
+            _merge(out, block.get("scenarios", {}).get(scenario, {}))
+    return out
+
+
+class LiveConfig:
+    """
+    config.yaml as last read successfully. changed() is cheap enough to
+    call every iteration. Without `strict` a file that does not validate
+    at startup is reported and the defaults are used.
+    """
+
+    def __init__(self, path=CONFIG_FILE, strict=True):
+        self.path = path
+        self.version = 0
+        self.data = validate({})
+        self._mtime = None
+        self._checked = time.monotonic()
+        self._read(strict)
+
+    def _read(self, strict=False):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            if mtime is None:
+                data = validate({})
+            else:
+                with open(self.path, encoding="utf-8") as f:
+                    data = validate(yaml.safe_load(f))
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            if strict:
+                raise ValueError(f"{self.path}: {e}") from e
+            print(f"WARNING: {self.path} not applied, keeping the previous settings: {e}")
+            return False
+        self.data = data
+        self.version += 1
+        return True
+
+    def changed(self):
+        """
+        True when the file changed and validated since the last check.
+        """
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return False
+        self._checked = now
+        return self._read()
+
+    def ports(self):
+        """
+        (appium_base, parallel_offset, system_base).
+        """
+        p = self.data["ports"]
+        return p["appium_base"], p["parallel_offset"], p["system_base"]
+
+    @property
+    def uses_models(self):
+        return bool(self.data["models"])
+
+    def settings(self, scenario, udid=None, model=None):
+        return resolve(self.data, scenario, udid, model)
+
+
+if __name__ == "__main__":
+    config = LiveConfig()
+    udid = sys.argv[1] if len(sys.argv) > 1 else None
+    model = sys.argv[2] if len(sys.argv) > 2 else None
+    print(f"{config.path}: ports {dict(zip(PORTS, config.ports()))}")
+    names = sorted(set(config.data["scenarios"]) | {"play", "banner"})
+    for name in names:
+        print(f"  {name}: {config.settings(name, udid, model) or '(scenario defaults)'}")
@@ -0,0 +1,117 @@
+"""
+Runs the play loop and the banner loop side by side on one host.
+
+The two scripts each start Appium servers on 4723+ and use systemPorts
+from 8200, so they cannot run at the same time. This orchestrator owns a
+single pool instead: every device gets one Appium server and one
+systemPort slot for the whole run, and whichever scenario the device is
+assigned runs against them. Devices are split between scenarios by
+weight; with --rotate, the assignment shifts by one device every N seconds
+so each phone cycles through the mix. Per-scenario throughput is printed
+every REPORT_INTERVAL seconds and at exit.
+
+    python mixed_scenarios.py [play=3,banner=1] [--rotate 1800] [--capacity 16]
+
+The fleet agent's --fake-appium/--dry-run options and the ADB variable
+work here too, for a run without phones.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import run_ledger
+from fleet import (Agent, APPIUM_COMMAND, AGENT_CAPACITY, HEARTBEAT_INTERVAL, HERE,
+                   format_status, list_devices, scenario_targets)
+
+# --- Configuration ---
+DEFAULT_WEIGHTS = "play=1,banner=1"
+REPORT_INTERVAL = 60
+
+
+def plan(devices, weights, rotation=0):
+    """
+    {udid: scenario} for the devices. The scenario sequence is laid out by
+    weight and shifted by `rotation`, so the mix stays the same while the
+    devices move through it.
+    """
+    devices = sorted(devices)
+    if not devices:
+        return {}
+    targets = scenario_targets(weights, len(devices))
+    order = [s for s in sorted(weights) for _ in range(targets[s])]
+    k = rotation % len(devices)
+    return dict(zip(devices, order[k:] + order[:k]))
+
+
+def status(agent, weights, assignments):
+    """
+    The agent's numbers in the shape fleet.format_status prints.
+    """
+    scenarios = {s: {"devices": 0, "iterations": 0, "device_seconds": 0.0} for s in weights}
+    for scenario in assignments.values():
+        scenarios[scenario]["devices"] += 1
+    for scenario, (n, secs) in agent.scenario_metrics().items():
+        row = scenarios.setdefault(scenario, {"devices": 0, "iterations": 0, "device_seconds": 0.0})
+        row["iterations"] += n
+        row["device_seconds"] += secs
+    for row in scenarios.values():
+        row["per_hour"] = row["iterations"] * 3600.0 / row["device_seconds"] if row["device_seconds"] else 0.0
+    agents = {agent.agent_id: {"devices": len(agent.slots), "capacity": agent.capacity,
+                               "assigned": len(assignments), "seen_ago": 0.0}}
+    return {"weights": weights, "agents": agents, "scenarios": scenarios}
+
+
+def run(weights, rotate=None, capacity=AGENT_CAPACITY, appium_command=APPIUM_COMMAND,
+        ledger_path=run_ledger.LEDGER_DB, dry_run=False, duration=None):
+    agent = Agent(None, f"mixed@{socket.gethostname()}", capacity,
+                  appium_command=appium_command, ledger_path=ledger_path, dry_run=dry_run)
+    started = last_report = time.time()
+    assignments = {}
+
+    def report():
+        print(format_status(status(agent, weights, assignments)))
+
+    def shutdown(signum, frame):
+        agent.stop(list(agent.running))
+        report()
+        agent.shutdown(leave=False)
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    while duration is None or time.time() - started < duration:
+        try:
+            devices = list_devices()[:capacity]
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"adb failed: {e}")
+            devices = list(assignments)
+        rotation = int((time.time() - started) // rotate) if rotate else 0
+        assignments = plan(devices, weights, rotation)
+        agent.reconcile(assignments)
+        if time.time() - last_report >= REPORT_INTERVAL:
+            report()
+            last_report = time.time()
+        time.sleep(HEARTBEAT_INTERVAL)
+    shutdown(None, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Weighted mix of scenarios on one host")
+    parser.add_argument("scenarios", nargs="?", default=DEFAULT_WEIGHTS, help="weights, e.g. play=3,banner=1")
+    parser.add_argument("--rotate", type=float, help="seconds between rotating devices through the mix")
+    parser.add_argument("--capacity", type=int, default=AGENT_CAPACITY)
+    parser.add_argument("--ledger", default=run_ledger.LEDGER_DB)
+    parser.add_argument("--fake-appium", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    args = parser.parse_args()
+
+    weights = {k: float(v) for k, v in (p.split("=") for p in args.scenarios.split(","))}
+    command = APPIUM_COMMAND
+    if args.fake_appium:
+        command = [sys.executable, os.path.join(HERE, "fake_appium_server.py"), "{port}"]
+    run(weights, args.rotate, args.capacity, command, args.ledger, args.dry_run, args.duration)
@@ -0,0 +1,224 @@
+"""
+SQLite run ledger: every run, device and iteration outcome, kept across
+launches in LEDGER_DB (WAL mode).
+
+Only the orchestrator process writes. Workers get a LedgerClient that puts
+rows on a multiprocessing queue without blocking; the RunLedger writer
+thread drains it and commits in batches. Workers read (resume) directly,
+which WAL allows while the writer is active.
+
+    python run_ledger.py [runs]     iterations/hour by device model over the last N runs
+"""
+import json
+import multiprocessing
+import queue
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+# --- Configuration ---
+LEDGER_DB = "run_ledger.sqlite"
+BATCH_SIZE = 200
+BATCH_INTERVAL = 1.0            # seconds between commits when the queue is quiet
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    script   TEXT NOT NULL,
+    host     TEXT NOT NULL,
+    started  REAL NOT NULL,
+    ended    REAL
+);
+CREATE TABLE IF NOT EXISTS devices (
+    udid       TEXT PRIMARY KEY,
+    model      TEXT,
+    first_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS iterations (
+    run_id    INTEGER NOT NULL REFERENCES runs(run_id),
+    udid      TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    started   REAL NOT NULL,
+    duration  REAL NOT NULL,
+    outcome   TEXT NOT NULL,
+    PRIMARY KEY (run_id, udid, iteration)
+);
+CREATE INDEX IF NOT EXISTS iterations_by_device ON iterations (udid, iteration);
+CREATE TABLE IF NOT EXISTS device_state (
+    udid    TEXT PRIMARY KEY,
+    state   TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def connect(path=LEDGER_DB):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def device_model(udid):
+    try:
+        return subprocess.run(["adb", "-s", udid, "shell", "getprop ro.product.model"],
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def resume(udid, path=LEDGER_DB):
+    """
+    (next iteration number, learned state dict) for a device, so counters
+    and per-device state carry over between launches.
+    """
+    conn = connect(path)
+    try:
+        conn.executescript(SCHEMA)
+        (last,) = conn.execute("SELECT MAX(iteration) FROM iterations WHERE udid = ?", (udid,)).fetchone()
+        row = conn.execute("SELECT state FROM device_state WHERE udid = ?", (udid,)).fetchone()
+        return (last or 0) + 1, json.loads(row[0]) if row else {}
+    finally:
+        conn.close()
+
+
+class RunLedger:
+    """
+    Orchestrator side: owns the only write connection. `context` must be
+    the multiprocessing context the workers are started with.
+    """
+
+    def __init__(self, path=LEDGER_DB, context=None):
+        self.path = path
+        self.queue = (context or multiprocessing).Queue()
+        self.run_id = None
+        self.last_progress = {}     # udid -> time of its last row (see watchdog.terminate_stalled)
+        self.sessions = {}          # udid -> the session its worker holds (see session_state)
+        self._conn = connect(path)
+        self._conn.executescript(SCHEMA)
+        self._thread = None
+
+    def begin_run(self, script):
+        cur = self._conn.execute("INSERT INTO runs (script, host, started) VALUES (?, ?, ?)",
+                                 (script, socket.gethostname(), time.time()))
+        self._conn.commit()
+        self.run_id = cur.lastrowid
+        self._thread = threading.Thread(target=self._writer, name="ledger-writer", daemon=True)
+        self._thread.start()
+        print(f"Ledger run #{self.run_id} → {self.path}")
+        return self.run_id
+
+    def client(self, udid):
+        return LedgerClient(self.queue, self.run_id, udid, self.path)
+
+    def end_run(self, timeout=10):
+        self.queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._conn.execute("UPDATE runs SET ended = ? WHERE run_id = ?", (time.time(), self.run_id))
+        self._conn.commit()
+        self._conn.close()
+
+    def _writer(self):
+        # SQLite connections belong to the thread that uses them
+        conn = connect(self.path)
+        pending, last_commit, done = [], time.monotonic(), False
+        while not done:
+            try:
+                item = self.queue.get(timeout=BATCH_INTERVAL)
+                if item is None:
+                    done = True
+                else:
+                    pending.append(item)
+                    kind, args = item
+                    self.last_progress[args[1] if kind == "iteration" else args[0]] = time.time()
+                    if kind == "session":
+                        udid, session_id, server_port, system_port, seconds, reattached = args
+                        self.sessions[udid] = {"session_id": session_id, "server_port": server_port,
+                                               "system_port": system_port, "seconds": seconds,
+                                               "reattached": reattached}
+            except queue.Empty:
+                pass
+            if pending and (done or len(pending) >= BATCH_SIZE
+                            or time.monotonic() - last_commit >= BATCH_INTERVAL):
+                self._flush(conn, pending)
+                pending, last_commit = [], time.monotonic()
+        conn.close()
+
+    @staticmethod
+    def _flush(conn, items):
+        with conn:
+            for kind, args in items:
+                if kind == "iteration":
+                    conn.execute("INSERT OR REPLACE INTO iterations VALUES (?, ?, ?, ?, ?, ?)", args)
+                elif kind == "device":
+                    conn.execute("INSERT OR IGNORE INTO devices VALUES (?, ?, ?)", args)
+                    conn.execute("UPDATE devices SET model = COALESCE(?, model) WHERE udid = ?",
+                                 (args[1], args[0]))
+                elif kind == "state":
+                    conn.execute("INSERT OR REPLACE INTO device_state VALUES (?, ?, ?)", args)
+
+
+class LedgerClient:
+    """
+    Worker side. Picklable; every call only enqueues.
+    """
+
+    def __init__(self, q, run_id, udid, path=LEDGER_DB):
+        self.queue = q
+        self.run_id = run_id
+        self.udid = udid
+        self.path = path
+
+    def resume(self):
+        return resume(self.udid, self.path)
+
+    def register_device(self, model):
+        self.queue.put(("device", (self.udid, model, time.time())))
+
+    def iteration(self, iteration, started, outcome="ok"):
+        self.queue.put(("iteration", (self.run_id, self.udid, iteration, started,
+                                      time.time() - started, outcome)))
+
+    def save_state(self, state):
+        self.queue.put(("state", (self.udid, json.dumps(state), time.time())))
+
+    def session(self, session_id, server_port, system_port, seconds, reattached):
+        self.queue.put(("session", (self.udid, session_id, server_port, system_port, seconds, reattached)))
+
+
+def iterations_per_hour_by_model(last_runs=7, path=LEDGER_DB):
+    """
+    [(model, runs, devices, iterations, iterations/hour)] over the last N
+    runs. Hours are summed per (run, device) active span, so idle devices
+    do not dilute the rate.
+    """
+    conn = connect(path)
+    try:
+        conn.executescript(SCHEMA)
+        return conn.execute("""
+            WITH recent AS (SELECT run_id FROM runs ORDER BY run_id DESC LIMIT ?),
+            spans AS (
+                SELECT i.run_id, i.udid, COUNT(*) AS n,
+                       MAX(i.started + i.duration) - MIN(i.started) AS seconds
+                FROM iterations i JOIN recent r ON r.run_id = i.run_id
+                GROUP BY i.run_id, i.udid
+            )
+            SELECT COALESCE(d.model, 'unknown') AS model,
+                   COUNT(DISTINCT s.run_id), COUNT(DISTINCT s.udid), SUM(s.n),
+                   SUM(s.n) * 3600.0 / MAX(SUM(s.seconds), 1)
+            FROM spans s LEFT JOIN devices d ON d.udid = s.udid
+            GROUP BY model ORDER BY model
+        """, (last_runs,)).fetchall()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    print(f"{'model':<24} {'runs':>5} {'devices':>8} {'iterations':>11} {'iter/h':>8}")
+    for model, n_runs, n_devices, n, rate in iterations_per_hour_by_model(runs):
+        print(f"{model:<24} {n_runs:>5} {n_devices:>8} {n:>11} {rate:>8.1f}")
@@ -0,0 +1,1148 @@
+"""
+Declarative scenarios: YAML step lists compiled into execution plans.
+
+A scenario file (scenarios/<name>.yaml) names the app, a few setup steps
+and the steps of one loop iteration. compile_scenario() turns it into a
+plan:
+
+- adjacent plain sleeps are merged into one pause (fixed and random parts
+  add up);
+- simple XPath locators (//Class[@text="..."]) are rewritten to UiSelector
+  lookups, which UiAutomator2 answers without serialising the whole
+  hierarchy to XML first;
+- a click that `learn`s its tap point, a fixed sleep and a second learning
+  click become a tap chain: once both points are known, the first click,
+  the pause and the second click go out as one W3C actions request;
+- the lookup of a click that follows a sleep is prefetched during the
+  last PREFETCH_LEAD seconds of that sleep, when its first locator has no
+  side effects (no scrolling, no screenshot).
+
+run_scenario() runs a plan on one device; it takes the same arguments as
+the scripts' run_loop_on. tune() applies the device's config.yaml
+settings (live_config.py) to the plan; ScenarioRun re-applies them
+between iterations when the file changes.
+
+    python scenario_engine.py <scenario>     print the compiled plan
+
+Step keys:
+    sleep: N | [lo, hi]          with `step:` it is timed under that name
+    click: [locator, ...]        first locator waited up to `timeout`, the
+                                 rest tried once each; also learn, on_found,
+                                 on_fail (skip|continue), capture, forget
+    gesture: {swipes, swipe, tap} with fallback: [locator, ...]
+    scroll: {learn, swipe, max}  on a click or gesture: learn the swipes that
+                                 reach the target (the click's first
+                                 non-scrolling locator) or the end of the
+                                 list, and replay them (see scroll_plan.py)
+    relaunch: {pause: N}
+    hook: name                   see HOOKS
+    webview_ad: true
+    enabled: false               leaves the step out
+    deadline: N                  seconds before the watchdog cancels the step
+                                 (default from watchdog.STEP_DEADLINES)
+    profile: name                UiAutomator2 settings profile for the step
+                                 (see uia2_settings.py; default `profile:`
+                                 at the top of the scenario)
+
+Locators: xpath, id, accessibility_id, class, uiautomator or template,
+plus `pick: last` to take the last match instead of the first.
+"""
+import copy
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import yaml
+from appium import webdriver
+from appium.options.android import UiAutomator2Options
+from appium.webdriver.appium_connection import AppiumConnection
+from appium.webdriver.client_config import AppiumClientConfig
+from appium.webdriver.common.appiumby import AppiumBy
+from selenium.common.exceptions import (TimeoutException, NoSuchElementException,
+                                        StaleElementReferenceException, WebDriverException)
+from selenium.webdriver.support import expected_conditions as EC
+
+import screenshots
+from screen_recorder import RollingRecorder
+from template_locator import TemplateLocator
+from gestures import GestureBatch, RoundTripCounter
+from adaptive_wait import AdaptiveWait, LatencyModel
+from webview_ads import AdSelectorStats, WebViewAdLocator
+from app_startup import StartupRecorder
+from app_metrics import AppMetrics
+from telemetry_store import TELEMETRY_DIR, TelemetryWriter, StepClock, STEPS, OK, FAILED, TIMEOUT
+from latency_histogram import HISTOGRAM_DIR, HistogramSet
+from run_ledger import device_model
+import http_transport
+import live_config
+import scroll_plan
+import uia2_settings
+import uia2_direct
+import session_state
+from watchdog import StepWatchdog, SessionHung, STEP_DEADLINES, SESSION_DEADLINE, QUIT_DEADLINE
+
+# --- Configuration ---
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+PREFETCH_LEAD = 0.5             # seconds before a sleep ends that the next lookup starts
+PREFETCH_MIN_SLEEP = 1.0        # shorter sleeps are not worth a thread
+SAVE_EVERY = 10                 # iterations between wait model / histogram snapshots
+TUNED_TRANSPORT = True          # pooled connection with per-command timeouts (http_transport.py)
+DIRECT_UIA2 = False             # hot commands straight to UiAutomator2 on systemPort (uia2_direct.py)
+
+LOCATOR_BY = {
+    "xpath": AppiumBy.XPATH,
+    "id": AppiumBy.ID,
+    "accessibility_id": AppiumBy.ACCESSIBILITY_ID,
+    "class": AppiumBy.CLASS_NAME,
+    "uiautomator": AppiumBy.ANDROID_UIAUTOMATOR,
+}
+_SIMPLE_XPATH = re.compile(r'^//([\w.]+|\*)\[@(text|resource-id|content-desc)="([^"\\]*)"\]$')
+_UISELECTOR_ATTR = {"text": "text", "resource-id": "resourceId", "content-desc": "description"}
+
+
+# -- plan ---------------------------------------------------------------
+
+class Locator:
+    def __init__(self, kind, value, pick="first"):
+        if kind != "template" and kind not in LOCATOR_BY:
+            raise ValueError(f"unknown locator kind: {kind}")
+        if pick not in ("first", "last"):
+            raise ValueError(f"pick must be first or last, not {pick!r}")
+        self.kind = kind
+        self.value = value
+        self.pick = pick
+
+    @property
+    def by(self):
+        return LOCATOR_BY[self.kind]
+
+    @property
+    def side_effect_free(self):
+        """
+        Safe to look up ahead of time: does not scroll or grab the screen.
+        """
+        if self.kind == "template":
+            return False
+        return self.kind != "uiautomator" or "UiScrollable" not in self.value
+
+    def __repr__(self):
+        suffix = " (last)" if self.pick == "last" else ""
+        return f"{self.kind}={self.value}{suffix}"
+
+
+class Sleep:
+    def __init__(self, low, high=None, step=None):
+        self.low = float(low)
+        self.high = float(high if high is not None else low)
+        self.step = step
+        self.prefetch = None        # Click whose lookup runs at the end of this sleep
+
+    @property
+    def fixed(self):
+        return self.low == self.high
+
+    def seconds(self):
+        return self.low if self.fixed else random.uniform(self.low, self.high)
+
+    def __repr__(self):
+        span = f"{self.low:g}s" if self.fixed else f"{self.low:g}-{self.high:g}s"
+        name = f" [{self.step}]" if self.step else ""
+        ahead = f", prefetching {self.prefetch.step}" if self.prefetch else ""
+        return f"sleep {span}{name}{ahead}"
+
+
+class Click:
+    def __init__(self, step, locators, timeout=None, learn=None, on_found=None,
+                 on_fail="continue", capture=None, forget=(), scroll=None):
+        if on_fail not in ("skip", "continue"):
+            raise ValueError(f"{step}: on_fail must be skip or continue")
+        self.step = step
+        self.locators = locators
+        self.timeout = timeout
+        self.learn = learn
+        self.on_found = on_found
+        self.on_fail = on_fail
+        self.capture = capture
+        self.forget = list(forget)
+        self.scroll = scroll
+
+    def __repr__(self):
+        wait = f" wait {self.timeout:g}s" if self.timeout else ""
+        learn = f", learns {self.learn}" if self.learn else ""
+        scroll = f", {self.scroll!r}" if self.scroll else ""
+        return f"click [{self.step}]{wait}: " + " | ".join(map(repr, self.locators)) + learn + scroll
+
+
+class TapChain:
+    def __init__(self, first, pause, second):
+        self.first = first
+        self.pause = pause
+        self.second = second
+
+    def __repr__(self):
+        return (f"tap chain [{self.first.step} → {self.second.step}], one request once "
+                f"{self.first.learn} and {self.second.learn} are known:\n"
+                f"      {self.first!r}\n      {self.pause!r}\n      {self.second!r}")
+
+
+class Gesture:
+    def __init__(self, step, swipes, swipe, tap, fallback=(), capture=None, scroll=None):
+        self.step = step
+        self.swipes = int(swipes)
+        self.swipe = swipe
+        self.tap = tap
+        self.fallback = list(fallback)
+        self.capture = capture
+        self.scroll = scroll        # learns the swipe count to the end of the list instead
+
+    def __repr__(self):
+        swipes = f"{self.scroll!r} to the end" if self.scroll else f"{self.swipes} swipes"
+        return (f"gesture [{self.step}]: {swipes} + tap {self.tap}"
+                + (", fallback " + " | ".join(map(repr, self.fallback)) if self.fallback else ""))
+
+
+class Relaunch:
+    def __init__(self, step, pause=2):
+        self.step = step
+        self.pause = pause
+
+    def __repr__(self):
+        return f"relaunch [{self.step}]"
+
+
+class Hook:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"hook {self.name}"
+
+
+class WebViewAd:
+    def __init__(self, step):
+        self.step = step
+
+    def __repr__(self):
+        return f"webview ad [{self.step}]"
+
+
+class Plan:
+    def __init__(self, spec, setup, loop, notes):
+        self.name = spec["name"]
+        self.package = spec["package"]
+        self.activity = spec["activity"]
+        self.startup_mode = spec.get("startup_mode")
+        self.app_metrics = bool(spec.get("app_metrics"))
+        self.offload = spec.get("offload") or {}
+        self.settings_profiles = uia2_settings.check_profiles(spec.get("settings_profiles"))
+        self.profile = spec.get("profile")
+        self.setup = setup
+        self.loop = loop
+        self.notes = notes
+
+    def describe(self):
+        lines = [f"scenario {self.name} ({self.package}/{self.activity})", "  setup:"]
+        lines += [f"    {op!r}{self._profile_note(op)}" for op in self.setup]
+        lines.append("  loop:")
+        lines += [f"    {op!r}{self._profile_note(op)}" for op in self.loop]
+        lines.append("  optimisations:")
+        lines += [f"    - {n}" for n in self.notes] or ["    (none)"]
+        return "\n".join(lines)
+
+    def _profile_note(self, op):
+        if isinstance(op, (Sleep, Hook)) or len(self.settings_profiles) < 2:
+            return ""
+        if isinstance(op, TapChain):
+            first, second = _step_profile(self, op.first), _step_profile(self, op.second)
+            return f"  <{first}>" if first == second else f"  <{first} → {second} when not chained>"
+        return f"  <{_step_profile(self, op)}>"
+
+
+# -- compiler -----------------------------------------------------------
+
+def load_scenario(name_or_path):
+    path = name_or_path
+    if not os.path.exists(path):
+        path = os.path.join(SCENARIO_DIR, f"{name_or_path}.yaml")
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def _locator(entry):
+    entry = dict(entry)
+    pick = entry.pop("pick", "first")
+    if len(entry) != 1:
+        raise ValueError(f"locator needs exactly one kind: {entry}")
+    (kind, value), = entry.items()
+    if kind == "uiautomator":
+        # long selectors may be split over lines in the YAML
+        value = "".join(line.strip() for line in str(value).splitlines())
+    return Locator(kind, str(value), pick)
+
+
+def _op(entry):
+    op = _action(entry)
+    op.deadline = entry.get("deadline")
+    op.profile = entry.get("profile")
+    return op
+
+
+def _action(entry):
+    step = entry.get("step")
+    if step is not None and step not in STEPS:
+        raise ValueError(f"unknown step {step!r}; telemetry knows {sorted(STEPS)}")
+    if "sleep" in entry:
+        value = entry["sleep"]
+        low, high = (value if isinstance(value, list) else (value, value))
+        return Sleep(low, high, step)
+    if "click" in entry:
+        return Click(step, [_locator(e) for e in entry["click"]], entry.get("timeout"), entry.get("learn"),
+                     entry.get("on_found"), entry.get("on_fail", "continue"), entry.get("capture"),
+                     entry.get("forget", ()), scroll_plan.parse(entry.get("scroll")))
+    if "gesture" in entry:
+        g = entry["gesture"]
+        scroll = scroll_plan.parse(entry.get("scroll"))
+        if scroll is not None and not g.get("swipe"):
+            raise ValueError(f"{step}: a learned scroll needs the gesture's swipe")
+        return Gesture(step, g.get("swipes", 0), g.get("swipe"), g.get("tap"),
+                       [_locator(e) for e in entry.get("fallback", ())], entry.get("capture"), scroll)
+    if "relaunch" in entry:
+        opts = entry["relaunch"] if isinstance(entry["relaunch"], dict) else {}
+        return Relaunch(step or "relaunch", opts.get("pause", 2))
+    if "hook" in entry:
+        if entry["hook"] not in HOOKS:
+            raise ValueError(f"unknown hook {entry['hook']!r}")
+        return Hook(entry["hook"])
+    if "webview_ad" in entry:
+        return WebViewAd(step or "webview_ad")
+    raise ValueError(f"step without an action: {entry}")
+
+
+def _rewrite_xpath(locator):
+    m = _SIMPLE_XPATH.match(locator.value) if locator.kind == "xpath" else None
+    if not m:
+        return None
+    cls, attr, value = m.groups()
+    selector = "new UiSelector()"
+    if cls != "*":
+        selector += f'.className("{cls}")'
+    selector += f'.{_UISELECTOR_ATTR[attr]}("{value}")'
+    return Locator("uiautomator", selector, locator.pick)
+
+
+def _deadline(op):
+    """
+    Default deadline of a step: its own waits and pauses plus the
+    allowance for its kind.
+    """
+    if isinstance(op, Sleep):
+        return op.high + STEP_DEADLINES["sleep"]
+    if isinstance(op, Click):
+        learning = op.scroll.budget() if op.scroll else 0
+        return (op.timeout or 0) + learning + STEP_DEADLINES["click"]
+    if isinstance(op, TapChain):
+        return ((op.first.timeout or 0) + op.pause.high + (op.second.timeout or 0)
+                + STEP_DEADLINES["tap_chain"])
+    if isinstance(op, Gesture):
+        swiping = op.swipes * op.swipe.get("ms", 300) / 1000.0 if op.swipe else 0
+        if op.scroll:
+            swiping = op.scroll.budget(op.swipe)
+        return swiping + STEP_DEADLINES["gesture"]
+    if isinstance(op, Relaunch):
+        return op.pause + STEP_DEADLINES["relaunch"]
+    if isinstance(op, Hook):
+        return STEP_DEADLINES["hook"]
+    return STEP_DEADLINES["webview_ad"]
+
+
+def _label(op):
+    if isinstance(op, TapChain):
+        return f"{op.first.step}+{op.second.step}"
+    if isinstance(op, Hook):
+        return f"hook {op.name}"
+    return getattr(op, "step", None) or "sleep"
+
+
+def _merge_sleeps(ops):
+    out = []
+    for op in ops:
+        prev = out[-1] if out else None
+        if isinstance(op, Sleep) and op.step is None and isinstance(prev, Sleep) and prev.step is None:
+            out[-1] = Sleep(prev.low + op.low, prev.high + op.high)
+        else:
+            out.append(op)
+    return out
+
+
+def _chain_taps(ops):
+    out, i = [], 0
+    while i < len(ops):
+        a = ops[i]
+        if (i + 2 < len(ops) and isinstance(a, Click) and a.learn and not a.scroll
+                and isinstance(ops[i + 1], Sleep) and ops[i + 1].step is None and ops[i + 1].fixed
+                and isinstance(ops[i + 2], Click) and ops[i + 2].learn and not ops[i + 2].scroll):
+            out.append(TapChain(a, ops[i + 1], ops[i + 2]))
+            i += 3
+        else:
+            out.append(a)
+            i += 1
+    return out
+
+
+def _scroll_check(op):
+    """
+    The locator that tells whether a learned scroll reached its target.
+    """
+    return next((loc for loc in op.locators if loc.side_effect_free), None)
+
+
+def _first_click(op):
+    return op.first if isinstance(op, TapChain) else op if isinstance(op, Click) else None
+
+
+def compile_scenario(spec):
+    """
+    Builds a Plan from a loaded scenario dict.
+    """
+    notes = []
+    ops = {}
+    for section in ("setup", "loop"):
+        raw = [e for e in spec.get(section) or () if e.get("enabled", True)]
+        ops[section] = [_op(e) for e in raw]
+        merged = _merge_sleeps(ops[section])
+        if len(merged) < len(ops[section]):
+            notes.append(f"{section}: {len(ops[section]) - len(merged)} adjacent sleep(s) merged")
+        ops[section] = merged
+
+    for op in ops["setup"] + ops["loop"]:
+        if isinstance(op, (Click, Gesture)):
+            locators = op.locators if isinstance(op, Click) else op.fallback
+            for i, loc in enumerate(locators):
+                cheaper = _rewrite_xpath(loc)
+                if cheaper is not None:
+                    locators[i] = cheaper
+                    notes.append(f"{op.step}: {loc!r} → {cheaper!r}")
+        if isinstance(op, Click) and op.scroll and _scroll_check(op) is None:
+            raise ValueError(f"{op.step}: a learned scroll needs a locator that does not scroll, to check with")
+        if getattr(op, "scroll", None):
+            notes.append(f"{op.step}: swipes learned per device ({op.scroll.learn}), sent as one request "
+                         f"and checked once; UiScrollable only when the check misses")
+
+    loop = _chain_taps(ops["loop"])
+    for op in loop:
+        if isinstance(op, TapChain):
+            notes.append(f"{op.first.step} + {op.second.step}: tap chain with a {op.pause.low:g}s pause")
+
+    for op in ops["setup"] + loop:
+        if getattr(op, "deadline", None) is None:
+            op.deadline = _deadline(op)
+
+    # the sleep before a click (wrapping around the end of the loop) hides its lookup
+    for i, op in enumerate(loop):
+        click = _first_click(op)
+        before = loop[i - 1] if loop else None
+        if _prefetchable(click, before, op):
+            before.prefetch = click
+            notes.append(f"{click.step}: lookup prefetched during the preceding {before.low:g}s+ sleep")
+    plan = Plan(spec, ops["setup"], loop, notes)
+    _check_profiles(plan)
+    return plan
+
+
+def _step_profile(plan, op):
+    return getattr(_parts(op)[0], "profile", None) or plan.profile or uia2_settings.DEFAULT_PROFILE
+
+
+def _check_profiles(plan):
+    names = plan.settings_profiles
+    if plan.profile is not None and plan.profile not in names:
+        raise ValueError(f"unknown settings profile {plan.profile!r}; the scenario has {sorted(names)}")
+    for op in plan.setup + plan.loop:
+        for part in _parts(op):
+            profile = getattr(part, "profile", None)
+            if profile is not None and profile not in names:
+                raise ValueError(f"{_label(op)}: unknown settings profile {profile!r}")
+    # one switch per change of profile around the loop (a tap chain runs on its first step's)
+    sequence = [_step_profile(plan, op) for op in plan.loop if not isinstance(op, (Sleep, Hook))]
+    switches = sum(1 for a, b in zip(sequence, sequence[1:] + sequence[:1]) if a != b)
+    if switches:
+        plan.notes.append(f"settings profiles: {switches} switch(es) per iteration, "
+                          f"{' → '.join(sequence)}")
+
+
+def _prefetchable(click, before, op):
+    return (click is not None and click.timeout and click.locators[0].side_effect_free
+            and isinstance(before, Sleep) and before is not op and before.low >= PREFETCH_MIN_SLEEP)
+
+
+def _live(settings):
+    return {key: settings[key] for key in live_config.LIVE_KEYS if key in settings}
+
+
+def _parts(op):
+    return (op.first, op.pause, op.second) if isinstance(op, TapChain) else (op,)
+
+
+def tune(plan, settings):
+    """
+    A copy of `plan` with live_config settings applied by step name (pace,
+    timeouts, sleeps, locators); `plan` stays as compiled. A sleep set by
+    name is taken as given, the others are scaled by pace. Deadlines move
+    with the waits. Step names the plan does not have are ignored, since
+    device-wide settings cover every scenario. Raises ValueError for a bad
+    locator.
+    """
+    if settings.get("pace", 1.0) == 1.0 and not any(settings.get(key) for key in live_config.LIVE_KEYS[1:]):
+        return plan
+    pace = settings.get("pace", 1.0)
+    timeouts = settings.get("timeouts", {})
+    sleeps = settings.get("sleeps", {})
+    locators = {step: [_rewrite_xpath(loc) or loc for loc in map(_locator, entries)]
+                for step, entries in settings.get("locators", {}).items()}
+    tuned = copy.deepcopy(plan)
+    for op in tuned.setup + tuned.loop:
+        before = _deadline(op)
+        for part in _parts(op):
+            if isinstance(part, Sleep):
+                if part.step in sleeps:
+                    value = sleeps[part.step]
+                    part.low, part.high = value if isinstance(value, list) else (value, value)
+                else:
+                    part.low *= pace
+                    part.high *= pace
+            elif isinstance(part, Click):
+                part.timeout = timeouts.get(part.step, part.timeout)
+                part.locators = list(locators.get(part.step, part.locators))
+            elif isinstance(part, Gesture):
+                part.fallback = list(locators.get(part.step, part.fallback))
+        op.deadline = max(1.0, op.deadline + _deadline(op) - before)
+    for i, op in enumerate(tuned.loop):
+        if isinstance(op, Sleep) and op.prefetch is not None:
+            following = tuned.loop[(i + 1) % len(tuned.loop)]
+            if not _prefetchable(op.prefetch, op, following):
+                op.prefetch = None
+    tuned.notes = tuned.notes + [f"config.yaml: {_live(settings)}"]
+    return tuned
+
+
+# -- engine -------------------------------------------------------------
+
+HOOKS = {                       # no-ops in scenarios without app_metrics
+    "session_start": lambda run: run.metrics and run.metrics.session_start(),
+    "session_end": lambda run: run.metrics and run.metrics.session_end(run.iteration),
+}
+
+
+class _Skip(Exception):
+    """
+    Ends the current iteration early; the message is the ledger outcome.
+    """
+
+
+def _centre(rect):
+    return rect["x"] + rect["width"] // 2, rect["y"] + rect["height"] // 2
+
+
+class ScenarioRun:
+    """
+    One device executing a plan.
+    """
+
+    def __init__(self, plan, udid, driver, device_index, ledger=None, config=None, out_dir=None):
+        self.plan = plan
+        self.base_plan = plan       # as compiled; self.plan has the config.yaml settings applied
+        self.config = config        # live_config.LiveConfig, or None to run the plan as compiled
+        self.settings = {}
+        self.model = None
+        self._config_version = None
+        self.udid = udid
+        self.driver = driver
+        self.ledger = ledger
+        self.device_index = device_index
+        # telemetry and histograms go under out_dir when given (offline runs
+        # that must not mix with the fleet's files in the working directory)
+        self.out_dir = out_dir
+        self.worker = f"{plan.name}-{device_index}"
+        self.iteration = 1
+        self.learned = {}
+        self.size = None
+        self.offload_blocked = False
+        self.scroll_retry = {}      # learn key -> iteration before which learning is not retried
+        self.prefetched = {}        # Click -> element found during the preceding sleep
+
+        self.screenshots = screenshots.shared()
+        self.recorder = RollingRecorder(udid)
+        self.locator = TemplateLocator()
+        self.round_trips = RoundTripCounter(driver)
+        self.profiles = None
+        if any(plan.settings_profiles.values()):
+            self.profiles = uia2_settings.ProfileSwitcher(driver, plan.settings_profiles, udid)
+        self.wait_model = LatencyModel(udid)
+        self.waits = AdaptiveWait(driver, self.wait_model)
+        self.startup = None
+        if plan.startup_mode:
+            self.startup = StartupRecorder(udid, plan.package, plan.activity, plan.startup_mode)
+        self.metrics = AppMetrics(udid, plan.package) if plan.app_metrics else None
+        self.ad_stats = self.webview_ads = None
+        if any(isinstance(op, WebViewAd) for op in plan.loop):
+            self.ad_stats = AdSelectorStats(plan.package)
+            self.webview_ads = WebViewAdLocator(driver, udid, self.ad_stats)
+        self.telemetry = TelemetryWriter(self.worker, device_index, self._output(TELEMETRY_DIR))
+        self.histograms = HistogramSet()
+        # one snapshot per session; load_all merges them, so an earlier
+        # session's latencies are not overwritten by this one's
+        self.histogram_name = f"{self.worker}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.clock = StepClock(self.telemetry, self.histograms, udid)
+        self.watchdog = StepWatchdog(driver, udid, self.clock)
+
+    # -- lookups --------------------------------------------------------
+
+    def _condition(self, locator):
+        return EC.element_to_be_clickable((locator.by, locator.value))
+
+    def _find_once(self, locator):
+        if locator.kind == "template":
+            if not self.locator.has_template(locator.value):
+                return None
+            m = self.locator.locate(self.udid, locator.value, self.driver)
+            return (m.x, m.y) if m is not None else None
+        elements = self.driver.find_elements(locator.by, locator.value)
+        if not elements:
+            return None
+        return elements[-1] if locator.pick == "last" else elements[0]
+
+    def _resolve(self, op):
+        """
+        Element or (x, y) for a click step, or None. The first locator is
+        waited on (if the step has a timeout), the others tried once.
+        """
+        target = self.prefetched.pop(op, None)
+        if target is not None:
+            return target
+        for i, locator in enumerate(op.locators):
+            try:
+                if i == 0 and op.timeout and locator.kind != "template":
+                    return self.waits.until(op.step, self._condition(locator), op.timeout)
+                target = self._find_once(locator)
+                if target is not None:
+                    return target
+            except (TimeoutException, NoSuchElementException):
+                continue
+            except Exception as e:
+                print(f"[{self.udid}] WARNING: {op.step} lookup by {locator.kind} failed: {e}")
+        return None
+
+    def _prefetch(self, op):
+        try:
+            found = self._condition(op.locators[0])(self.driver)
+            if found:
+                self.prefetched[op] = found
+        except Exception:
+            pass
+
+    # -- steps ----------------------------------------------------------
+
+    def _hook(self, name):
+        if name is None:
+            return
+        try:
+            HOOKS[name](self)
+        except Exception as e:
+            print(f"[{self.udid}] WARNING: {name} failed: {e}")
+
+    def _fail(self, op, outcome, message):
+        self.clock.done(outcome)
+        print(f"[{self.udid}] ERROR: {message}")
+        if op.capture:
+            self.screenshots.capture(self.udid, op.capture, self.driver)
+            self.recorder.keep(op.capture)
+        if getattr(op, "forget", None):
+            for key in op.forget:
+                self.learned.pop(key, None)
+            if self.ledger is not None:
+                self.ledger.save_state(self.learned)
+        if getattr(op, "on_fail", "continue") == "skip":
+            raise _Skip(op.capture or f"{op.step}_failed")
+
+    def _learn(self, key, xy):
+        if key and self.learned.get(key) != tuple(xy):
+            self.learned[key] = tuple(xy)
+            if self.ledger is not None:
+                self.ledger.save_state({k: list(v) for k, v in self.learned.items()})
+
+    def _tap(self, target, learn=False):
+        """
+        Clicks an element or a point. Returns the point when `learn` is set
+        (reading an element's rect costs a round trip, so only until the
+        point is known).
+        """
+        if isinstance(target, tuple):
+            self.driver.execute_script("mobile: clickGesture", {"x": int(target[0]), "y": int(target[1])})
+            return target
+        xy = _centre(target.rect) if learn else None
+        target.click()
+        return xy
+
+    def _switch(self, op):
+        if self.profiles is not None:
+            self.profiles.use(_step_profile(self.plan, op))
+
+    def click(self, op):
+        self.clock.start(op.step)
+        self._switch(op)
+        target = self._scroll(op) if op.scroll is not None else None
+        if target is None:
+            target = self._resolve(op)
+        if target is None:
+            outcome = TIMEOUT if len(op.locators) == 1 and op.timeout else FAILED
+            self._fail(op, outcome, f"'{op.step}' not found")
+            return
+        self._hook(op.on_found)
+        try:
+            xy = self._tap(target, bool(op.learn) and op.learn not in self.learned)
+        except StaleElementReferenceException:
+            # a prefetched element that went away; look again
+            target = self._resolve(op)
+            if target is None:
+                self._fail(op, FAILED, f"'{op.step}' went stale")
+                return
+            xy = self._tap(target, bool(op.learn) and op.learn not in self.learned)
+        if xy is not None:
+            self._learn(op.learn, xy)
+        self.clock.done()
+
+    def tap_chain(self, op):
+        first, second = op.first, op.second
+        p1, p2 = self.learned.get(first.learn), self.learned.get(second.learn)
+        if not (p1 and p2):
+            self.click(first)
+            self.sleep(op.pause)
+            self.click(second)
+            return
+        # still wait for the first screen, but send both taps in one request
+        self.clock.start(first.step)
+        self._switch(first)
+        if self._resolve(first) is None:
+            outcome = TIMEOUT if len(first.locators) == 1 and first.timeout else FAILED
+            self._fail(first, outcome, f"'{first.step}' not found")
+            return
+        self._hook(first.on_found)
+        self.clock.done()
+        self.clock.start(second.step)
+        try:
+            GestureBatch().tap(*p1).pause(op.pause.low * 1000).tap(*p2).perform(
+                self.driver, self.round_trips, replaces=3)
+            self.clock.done()
+        except WebDriverException as e:
+            self.clock.done(FAILED)
+            print(f"[{self.udid}] WARNING: batched {first.step}+{second.step} failed ({e}); relearning")
+            self.learned.pop(first.learn, None)
+            self.learned.pop(second.learn, None)
+
+    def _point(self, xy):
+        """
+        Scenario coordinates: 0..1 is a fraction of the window, a negative
+        number is pixels from the right/bottom edge, anything else pixels.
+        """
+        if self.size is None:
+            self.size = self.driver.get_window_size()
+        out = []
+        for v, extent in zip(xy, (self.size["width"], self.size["height"])):
+            if v < 0:
+                out.append(int(extent + v))
+            elif v <= 1:
+                out.append(int(extent * v))
+            else:
+                out.append(int(v))
+        return out
+
+    def _swipe(self, swipe):
+        x1, y1 = self._point(swipe["from"])
+        x2, y2 = self._point(swipe["to"])
+        return x1, y1, x2, y2, swipe.get("ms", 300)
+
+    def _scroll(self, op):
+        """
+        Scrolls with the step's learned plan, learning it first if needed.
+        Returns the element reached (click) or True at the end of the list
+        (gesture); None when the step has to fall back to UiScrollable.
+        """
+        spec = op.scroll
+        swipe = self._swipe(op.swipe if isinstance(op, Gesture) else spec.swipe)
+        check = _scroll_check(op) if isinstance(op, Click) else None
+        known = self.learned.get(spec.learn)
+        if known:
+            n, last = int(known[0]), float(known[1])
+            by, value = (check.by, check.value) if check is not None else (AppiumBy.ANDROID_UIAUTOMATOR, known[2])
+            try:
+                scroll_plan.batch(swipe, n, last).perform(self.driver, self.round_trips, replaces=1)
+                found = self.driver.find_elements(by, value)
+            except WebDriverException as e:
+                print(f"[{self.udid}] WARNING: {op.step}: learned scroll failed: {e}")
+                found = None
+            if found:
+                return found[0] if check is not None else True
+            print(f"[{self.udid}] WARNING: {op.step}: learned scroll ({n} swipes) missed; using UiScrollable")
+            self.learned.pop(spec.learn, None)
+            if self.ledger is not None:
+                self.ledger.save_state(self.learned)
+            return None
+        if self.iteration < self.scroll_retry.get(spec.learn, 0):
+            return None
+        try:
+            if check is not None:
+                result = scroll_plan.learn_to_element(self.driver, swipe, (check.by, check.value),
+                                                      spec.max_swipes, self.size["height"])
+            else:
+                result = scroll_plan.learn_to_end(self.driver, swipe, spec.max_swipes)
+        except WebDriverException as e:
+            print(f"[{self.udid}] WARNING: {op.step}: learning the scroll failed: {e}")
+            result = None
+        if result is None:
+            self.scroll_retry[spec.learn] = self.iteration + scroll_plan.RELEARN_AFTER
+            print(f"[{self.udid}] {op.step}: no scroll plan learned; UiScrollable for "
+                  f"{scroll_plan.RELEARN_AFTER} iterations")
+            return None
+        if check is not None:
+            n, last, element = result
+            self._learn(spec.learn, (n, last))
+        else:
+            (n, marker), last, element = result, 1.0, True
+            self._learn(spec.learn, (n, last, marker))
+        print(f"[{self.udid}] {op.step}: learned scroll of {n} swipe(s), last one {last:.0%}")
+        return element
+
+    def gesture(self, op):
+        x, y = self._point(op.tap)
+        if op.scroll is not None:
+            self.clock.start(op.step)
+            self._switch(op)
+            if self._scroll(op):
+                self._gesture_tap(op, x, y)
+            else:
+                self._gesture_fallback(op, x, y)
+            return
+        batch = GestureBatch()
+        if op.swipe:
+            x1, y1 = self._point(op.swipe["from"])
+            x2, y2 = self._point(op.swipe["to"])
+            for _ in range(op.swipes):
+                batch.swipe(x1, y1, x2, y2, op.swipe.get("ms", 300))
+        batch.tap(x, y)
+        self.clock.start(op.step)
+        self._switch(op)
+        try:
+            batch.perform(self.driver, self.round_trips, replaces=len(op.fallback) + 1)
+            self.clock.done()
+            print(f"[{self.udid}] → {op.step}: {op.swipes} swipes, tapped ({x},{y})")
+            return
+        except Exception as e:
+            print(f"[{self.udid}] WARNING: batched {op.step} failed ({e}), retrying step by step")
+        self._gesture_fallback(op, x, y)
+
+    def _gesture_fallback(self, op, x, y):
+        for locator in op.fallback:
+            try:
+                self.driver.find_element(locator.by, locator.value)
+            except Exception as e:
+                print(f"[{self.udid}] WARNING: {locator.kind} fallback failed: {e}")
+        self._gesture_tap(op, x, y)
+
+    def _gesture_tap(self, op, x, y):
+        try:
+            self.driver.execute_script("mobile: clickGesture", {"x": x, "y": y})
+            self.clock.done()
+            print(f"[{self.udid}] → clickGesture at ({x},{y})")
+        except Exception as e:
+            self._fail(op, FAILED, f"clickGesture failed: {e}")
+
+    def relaunch(self, op):
+        self.clock.start(op.step)
+        self._switch(op)
+        try:
+            if self.startup is not None:
+                self.startup.relaunch(self.driver, self.iteration, pause=op.pause)
+            else:
+                self.driver.terminate_app(self.plan.package)
+                time.sleep(op.pause)
+                self.driver.activate_app(self.plan.package)
+                print(f"[{self.udid}] → Relaunched app")
+            self.clock.done()
+        except Exception as e:
+            self.clock.done(FAILED)
+            print(f"[{self.udid}] ERROR relaunching app: {e}")
+
+    def webview_ad(self, op):
+        self.clock.start(op.step)
+        self._switch(op)
+        try:
+            self.clock.done(OK if self.webview_ads.click_ad() else FAILED)
+        except Exception as e:
+            self.clock.done(FAILED)
+            print(f"[{self.udid}] WARNING: WebView ad probe failed: {e}")
+
+    def sleep(self, op):
+        seconds = op.seconds()
+        if op.step:
+            self.clock.start(op.step)
+        if op.prefetch is not None and seconds > PREFETCH_LEAD:
+            time.sleep(seconds - PREFETCH_LEAD)
+            self._switch(op.prefetch)       # off the click's clock
+            t = threading.Thread(target=self._prefetch, args=(op.prefetch,), daemon=True)
+            t.start()
+            time.sleep(PREFETCH_LEAD)
+            t.join()
+        else:
+            time.sleep(seconds)
+        if op.step:
+            self.clock.done()
+
+    def execute(self, op):
+        self.watchdog.arm(_label(op), op.deadline)
+        try:
+            if isinstance(op, Sleep):
+                self.sleep(op)
+            elif isinstance(op, Click):
+                self.click(op)
+            elif isinstance(op, TapChain):
+                self.tap_chain(op)
+            elif isinstance(op, Gesture):
+                self.gesture(op)
+            elif isinstance(op, Relaunch):
+                self.relaunch(op)
+            elif isinstance(op, Hook):
+                self._hook(op.name)
+            elif isinstance(op, WebViewAd):
+                self.webview_ad(op)
+        finally:
+            # raises SessionHung after too many hung steps in a row
+            self.watchdog.disarm()
+
+    # -- loop -----------------------------------------------------------
+
+    def retune(self):
+        """
+        Applies the device's config.yaml settings when they are new or the
+        file changed; True when the plan was replaced. Invalid locators keep
+        the current plan.
+        """
+        if self.config is None:
+            return False
+        if self._config_version == self.config.version and not self.config.changed():
+            return False
+        self._config_version = self.config.version
+        if self.config.uses_models and self.model is None:
+            self.model = device_model(self.udid)
+        settings = _live(self.config.settings(self.base_plan.name, self.udid, self.model))
+        if settings == self.settings:
+            return False
+        try:
+            plan = tune(self.base_plan, settings)
+        except ValueError as e:
+            print(f"[{self.udid}] WARNING: config.yaml not applied, keeping the current settings: {e}")
+            return False
+        # a tap point learned through locators that changed may be wrong now
+        moved = {step for step in set(settings.get("locators", {})) | set(self.settings.get("locators", {}))
+                 if settings.get("locators", {}).get(step) != self.settings.get("locators", {}).get(step)}
+        for op in self.base_plan.setup + self.base_plan.loop:
+            for part in _parts(op):
+                if isinstance(part, Click) and part.step in moved and part.learn:
+                    self.learned.pop(part.learn, None)
+        self.plan, self.settings = plan, settings
+        self.prefetched.clear()
+        print(f"[{self.udid}] Settings applied: {settings or '(scenario defaults)'}")
+        return True
+
+    def _body(self):
+        # the closing pause runs after the iteration is recorded
+        body, pause = self.plan.loop, None
+        if body and isinstance(body[-1], Sleep) and body[-1].step is None:
+            body, pause = body[:-1], body[-1]
+        return body, pause
+
+    def _output(self, directory):
+        return directory if self.out_dir is None else os.path.join(self.out_dir, directory)
+
+    def save(self):
+        self.wait_model.save()
+        self.histograms.save(self.histogram_name, self._output(HISTOGRAM_DIR))
+        if self.ad_stats is not None:
+            self.ad_stats.save()
+
+    def run(self, max_iterations=None):
+        """
+        Runs the setup steps, then iterations until stopped (or until
+        `max_iterations` have run).
+        """
+        self.retune()
+        for op in self.plan.setup:
+            self.execute(op)
+        if self.ledger is not None:
+            self.iteration, state = self.ledger.resume()
+            self.learned = {k: tuple(v) for k, v in state.items() if v}
+            self.ledger.register_device(device_model(self.udid))
+            print(f"[{self.udid}] Resuming at iteration #{self.iteration}")
+        body, pause = self._body()
+        done = 0
+        while max_iterations is None or done < max_iterations:
+            done += 1
+            if self.retune():
+                body, pause = self._body()
+            print(f"[{self.udid}] Iteration #{self.iteration}")
+            if self.metrics is not None:
+                self.metrics.iteration_boundary(self.iteration)
+            self.clock.iteration = self.iteration
+            started = time.time()
+            try:
+                for op in body:
+                    self.execute(op)
+            except _Skip as skip:
+                if self.ledger is not None:
+                    self.ledger.iteration(self.iteration, started, str(skip))
+                self.iteration += 1
+                self.watchdog.iteration_done()
+                continue
+            self.telemetry.record("iteration", self.iteration, started, time.time() - started, OK)
+            self.watchdog.iteration_done()
+            if self.ledger is not None:
+                self.ledger.iteration(self.iteration, started)
+            actual, unbatched = self.round_trips.take()
+            print(f"[{self.udid}] Round trips this iteration: {actual} (unbatched: {unbatched})")
+            if self.iteration % SAVE_EVERY == 0:
+                self.save()
+                print(self.wait_model.report())
+            if pause is not None:
+                self.sleep(pause)
+            self.iteration += 1
+            if self.plan.offload.get("enabled") and not self.offload_blocked:
+                self._offload()
+
+    def _offload(self):
+        import device_offload
+        try:
+            device_offload.run_offloaded(self, int(self.plan.offload.get("iterations", 100)),
+                                         self.plan.offload.get("ui_check", device_offload.UI_CHECK_INTERVAL))
+        except ValueError as e:
+            print(f"[{self.udid}] Offload not possible, staying on Appium: {e}")
+            self.offload_blocked = True
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            print(f"[{self.udid}] WARNING: offload failed: {e}")
+
+    def close(self):
+        self.watchdog.stop()
+        self.save()
+        print(self.wait_model.report())
+        self.telemetry.close()
+        self.recorder.stop()
+
+
+def _connect(server_url, system_port, opts, session_id=None):
+    """
+    A driver on a new session, or on `session_id` if given. Every request
+    is bounded from the first one; the watchdog sets per-step timeouts
+    after this.
+    """
+    if DIRECT_UIA2:
+        executor = uia2_direct.connect(server_url, system_port, SESSION_DEADLINE)
+    elif TUNED_TRANSPORT:
+        executor = http_transport.connect(server_url, SESSION_DEADLINE)
+    else:
+        executor = AppiumConnection(client_config=AppiumClientConfig(server_url, timeout=SESSION_DEADLINE))
+    if session_id is not None:
+        return session_state.attach(executor, session_id, opts)
+    return webdriver.Remote(executor, options=opts)
+
+
+def run_scenario(scenario, udid, server_port, system_port, ledger=None, device_index=None):
+    """
+    Connects to Appium at localhost:server_port and drives device udid
+    through `scenario` (a name under SCENARIO_DIR, a path, or a Plan) until
+    the process is stopped. A session the watchdog gives up on is replaced.
+    A session recorded in session_state for the same ports is reattached
+    to instead of creating one. config.yaml settings apply throughout:
+    package and activity per session, waits, pacing and locators live.
+    A session that cannot be started or an unexpected error is raised
+    after cleanup, so the worker is restarted (thread_workers).
+    `device_index` is the device's position in the orchestrator; it names
+    the worker and tags its telemetry.
+    """
+    plan = scenario if isinstance(scenario, Plan) else compile_scenario(load_scenario(scenario))
+    config = live_config.LiveConfig(strict=False)
+    model = device_model(udid) if config.uses_models else None
+    session = config.settings(plan.name, udid, model)
+    if any(key in session for key in live_config.SESSION_KEYS):
+        plan = copy.copy(plan)
+        plan.package = session.get("package", plan.package)
+        plan.activity = session.get("activity", plan.activity)
+    server_url = f"http://localhost:{server_port}"
+    opts = UiAutomator2Options()
+    opts.udid = udid
+    opts.app_package = plan.package
+    opts.app_activity = plan.activity
+    opts.language = "en"
+    opts.locale = "US"
+    opts.set_capability("systemPort", system_port)
+    opts.new_command_timeout = session_state.NEW_COMMAND_TIMEOUT
+
+    recorded = session_state.lookup(udid, server_port, system_port)
+    while True:
+        t0 = time.perf_counter()
+        driver = None
+        if recorded is not None:
+            try:
+                driver = _connect(server_url, system_port, opts, recorded["session_id"])
+                print(f"[{udid}] → Reattached to session {recorded['session_id']} at {server_url}")
+            except Exception as e:
+                print(f"[{udid}] Recorded session is gone ({e}); starting a new one")
+            recorded = None
+        reattached = driver is not None
+        if driver is None:
+            print(f"[{udid}] → Starting Appium session for '{plan.name}' at {server_url} (systemPort={system_port})")
+            try:
+                driver = _connect(server_url, system_port, opts)
+            except Exception as e:
+                print(f"[{udid}] ERROR starting session: {e}")
+                raise
+        if ledger is not None:
+            ledger.session(driver.session_id, server_port, system_port, time.perf_counter() - t0, reattached)
+
+        run = ScenarioRun(plan, udid, driver, device_index or 0, ledger, config)
+        run.model = model
+        if DIRECT_UIA2:
+            driver.command_executor.histograms = run.histograms
+            driver.command_executor.label = udid
+        run.recorder.start()
+        hung = False
+        try:
+            run.run()
+        except SessionHung as e:
+            hung = True
+            print(f"[{udid}] ERROR: session hung ({e}); starting a new one")
+            run.screenshots.capture(udid, "session_hung", driver)
+            run.recorder.keep("session_hung")
+        except Exception as e:
+            print(f"[{udid}] UNEXPECTED ERROR: {e}")
+            run.screenshots.capture(udid, "unexpected_error", driver)
+            run.recorder.keep("unexpected_error")
+            raise
+        finally:
+            print(f"[{udid}] ← Quitting session")
+            run.watchdog.arm("quit", QUIT_DEADLINE)
+            run.close()
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        if not hung:
+            return
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    print(compile_scenario(load_scenario(sys.argv[1])).describe())
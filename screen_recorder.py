@@ -0,0 +1,193 @@
+"""
+Rolling on-device screen recording.
+
+The device keeps the last few `screenrecord` segments in a ring under
+RECORD_DEVICE_DIR. Nothing crosses USB until keep() is called for a failed
+step; then the segment being written is finalised and the ones covering
+the last RECORD_KEEP_SECONDS are pulled to the host in the background.
+
+The loop on the device writes its pid and the ring slot it is recording
+to next to the segments, so segments are picked by slot and the loop is
+stopped by pid (adbd runs commands through `sh -c`, so a `pkill -f` on
+the directory would match the shell running it).
+"""
+import os
+import subprocess
+import threading
+import time
+
+# --- Configuration ---
+RECORD_DEVICE_DIR = "/sdcard/rollrec"
+RECORD_HOST_DIR = "recordings"
+RECORD_SEGMENT_SECONDS = 10
+RECORD_KEEP_SECONDS = 30
+RECORD_BIT_RATE = 2000000
+RECORD_SIZE = "720x1280"
+
+
+def adb_shell(udid, command, timeout=30):
+    return subprocess.run(
+        ["adb", "-s", udid, "shell", command],
+        capture_output=True, text=True, timeout=timeout
+    ).stdout
+
+
+def _proc_cpu_ticks(stat_line):
+    """
+    utime + stime from a /proc/<pid>/stat line.
+    """
+    fields = stat_line.rsplit(")", 1)[1].split()
+    return int(fields[11]) + int(fields[12])
+
+
+def _total_cpu_ticks(proc_stat):
+    """
+    Sum of the aggregate `cpu` line of /proc/stat.
+    """
+    for line in proc_stat.splitlines():
+        if line.startswith("cpu "):
+            return sum(int(v) for v in line.split()[1:])
+    return 0
+
+
+class RollingRecorder:
+    """
+    One per device. start() launches the ring on the device, keep(label)
+    saves the recent past for a failure, stop() tears it down.
+    """
+
+    def __init__(self, udid, segment_seconds=RECORD_SEGMENT_SECONDS,
+                 keep_seconds=RECORD_KEEP_SECONDS, host_dir=RECORD_HOST_DIR):
+        self.udid = udid
+        self.segment_seconds = segment_seconds
+        self.keep_seconds = keep_seconds
+        self.host_dir = os.path.join(host_dir, udid)
+        # one extra slot: the segment being recorded is never complete
+        self.ring_size = -(-keep_seconds // segment_seconds) + 1
+        self._proc = None
+        self._pulls = []
+
+    def start(self):
+        script = (
+            f"mkdir -p {RECORD_DEVICE_DIR}; rm -f {RECORD_DEVICE_DIR}/seg_*.mp4; "
+            f"echo $$ > {RECORD_DEVICE_DIR}/loop.pid; i=0; "
+            f"while true; do echo $((i % {self.ring_size})) > {RECORD_DEVICE_DIR}/slot; "
+            f"screenrecord --time-limit {self.segment_seconds} --bit-rate {RECORD_BIT_RATE} "
+            f"--size {RECORD_SIZE} {RECORD_DEVICE_DIR}/seg_$((i % {self.ring_size})).mp4; "
+            f"i=$((i + 1)); done"
+        )
+        self._proc = subprocess.Popen(
+            ["adb", "-s", self.udid, "shell", script],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        print(f"[{self.udid}] → Rolling recorder on ({self.ring_size} x {self.segment_seconds}s segments)")
+
+    def stop(self):
+        if self._proc is None:
+            return
+        self._proc.terminate()
+        try:
+            # the loop first, so it does not start another segment
+            adb_shell(self.udid, f"kill $(cat {RECORD_DEVICE_DIR}/loop.pid); kill $(pidof screenrecord)")
+        except (OSError, subprocess.SubprocessError):
+            pass
+        try:
+            adb_shell(self.udid, f"rm -rf {RECORD_DEVICE_DIR}")
+        except (OSError, subprocess.SubprocessError):
+            pass
+        self._proc = None
+        for t in self._pulls:
+            t.join(60)
+
+    def keep(self, label):
+        """
+        Saves the last keep_seconds of screen for `label` without blocking
+        the caller. Returns the host directory the segments go to.
+        """
+        dest = os.path.join(self.host_dir, time.strftime("%Y%m%d-%H%M%S") + f"_{label}")
+        t = threading.Thread(target=self._pull, args=(dest,), daemon=True)
+        t.start()
+        self._pulls = [p for p in self._pulls if p.is_alive()] + [t]
+        return dest
+
+    def _pull(self, dest):
+        try:
+            # SIGINT makes screenrecord write its moov atom; the loop then
+            # moves on to the next slot, so recording continues.
+            slot = adb_shell(self.udid, f"cat {RECORD_DEVICE_DIR}/slot; kill -INT $(pidof screenrecord)").strip()
+            if not slot.isdigit():
+                raise RuntimeError(f"recorder is not running (slot: {slot!r})")
+            time.sleep(0.5)
+            # the finalised slot and the ones before it, oldest first; the
+            # slot after it is being recorded over
+            slots = [(int(slot) - k) % self.ring_size for k in range(self.ring_size - 2, -1, -1)]
+            listing = adb_shell(self.udid, f"stat -c '%s %n' {RECORD_DEVICE_DIR}/seg_*.mp4")
+            sizes = {}
+            for line in listing.splitlines():
+                parts = line.split(" ", 1)
+                if len(parts) == 2 and parts[0].isdigit():
+                    sizes[parts[1]] = int(parts[0])
+            wanted = [f"{RECORD_DEVICE_DIR}/seg_{i}.mp4" for i in slots]
+            wanted = [remote for remote in wanted if sizes.get(remote, 0) > 0]
+            os.makedirs(dest, exist_ok=True)
+            for n, remote in enumerate(wanted):
+                subprocess.run(
+                    ["adb", "-s", self.udid, "pull", remote, os.path.join(dest, f"{n:02d}.mp4")],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=120
+                )
+            print(f"[{self.udid}] → Saved {len(wanted)} recording segment(s) to {dest}")
+        except Exception as e:
+            print(f"[{self.udid}] WARNING: could not pull recording: {e}")
+
+    def measure_overhead(self, duration=30):
+        """
+        Samples host and device CPU use of the recorder over `duration`
+        seconds. Percentages are of one host core and of the whole device.
+        """
+        def device_sample():
+            out = adb_shell(self.udid,
+                            "cat /proc/stat; for p in $(pidof screenrecord); do cat /proc/$p/stat; done")
+            total = _total_cpu_ticks(out)
+            rec = sum(_proc_cpu_ticks(l) for l in out.splitlines() if "(screenrecord)" in l)
+            return total, rec
+
+        def host_sample():
+            if self._proc is None:
+                return 0
+            try:
+                with open(f"/proc/{self._proc.pid}/stat") as f:
+                    return _proc_cpu_ticks(f.read())
+            except OSError:
+                return None
+
+        hz = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        d_total0, d_rec0 = device_sample()
+        h0, wall0 = host_sample(), time.monotonic()
+        time.sleep(duration)
+        d_total1, d_rec1 = device_sample()
+        h1, wall1 = host_sample(), time.monotonic()
+
+        result = {
+            "device_cpu_pct": 100.0 * (d_rec1 - d_rec0) / max(1, d_total1 - d_total0),
+            "host_cpu_pct": None,
+        }
+        if h0 is not None and h1 is not None:
+            result["host_cpu_pct"] = 100.0 * (h1 - h0) / hz / (wall1 - wall0)
+        host = "n/a" if result["host_cpu_pct"] is None else f"{result['host_cpu_pct']:.2f}%"
+        print(f"[{self.udid}] recorder overhead: device {result['device_cpu_pct']:.1f}%, host {host}")
+        return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("usage: python screen_recorder.py <udid> [seconds]")
+        sys.exit(1)
+    recorder = RollingRecorder(sys.argv[1])
+    recorder.start()
+    try:
+        time.sleep(2)
+        recorder.measure_overhead(int(sys.argv[2]) if len(sys.argv) > 2 else 30)
+    finally:
+        recorder.stop()
@@ -0,0 +1,292 @@
+"""
+Failure-screenshot pipeline used by the device loops.
+
+capture() only enqueues a job: the frame is grabbed on a background thread
+(raw `adb exec-out screencap`, or Appium as a fallback), optionally
+downscaled, dropped if it is a near-duplicate of a recent frame, written as
+PNG and trimmed to a per-device disk quota.  The device loop never waits
+on any of it.  shared() gives every device loop of a process the same
+pipeline, so a process runs one grab and one encode thread however many
+devices it drives.
+"""
+import atexit
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+import zlib
+
+try:
+    from PIL import Image  # optional: only needed to decode Appium PNGs
+except ImportError:
+    Image = None
+
+# --- Configuration ---
+SCREENSHOT_DIR = "screenshots"
+SCREENSHOT_SCALE = 2                # keep every Nth pixel in both directions
+SCREENSHOT_COMPRESSION = 6          # zlib level used for the PNGs we write
+SCREENSHOT_QUOTA_BYTES = 50 * 1024 * 1024   # per device
+DEDUP_MAX_DISTANCE = 4              # dHash bits that may differ for a "duplicate"
+DEDUP_HISTORY = 8                   # recent hashes remembered per device
+QUEUE_SIZE = 16
+
+
+class Frame:
+    """
+    Uncompressed pixels: `data` holds height rows of width*channels bytes.
+    """
+    __slots__ = ("width", "height", "channels", "data")
+
+    def __init__(self, width, height, channels, data):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.data = data
+
+
+def parse_raw_screencap(raw):
+    """
+    Parses the output of `screencap` without -p: a 12-byte header
+    (width, height, format), or 16 bytes on Android 11+ (plus colour space),
+    followed by RGBA_8888 pixels.
+    """
+    width, height, _fmt = struct.unpack_from("<III", raw, 0)
+    header = len(raw) - width * height * 4
+    if header not in (12, 16):
+        raise ValueError(f"unexpected screencap size {len(raw)} for {width}x{height}")
+    return Frame(width, height, 4, memoryview(raw)[header:])
+
+
+def decode_png(png_bytes):
+    """
+    Decodes a PNG into a Frame. Requires Pillow; returns None without it.
+    """
+    if Image is None:
+        return None
+    import io
+    img = Image.open(io.BytesIO(png_bytes))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    return Frame(img.width, img.height, len(img.mode), img.tobytes())
+
+
+def downscale(frame, factor):
+    """
+    Nearest-neighbour downscale by an integer factor. Each output row is built
+    with extended slices, so the work stays in C.
+    """
+    if factor <= 1:
+        return frame
+    ch = frame.channels
+    src_stride = frame.width * ch
+    out_w = (frame.width + factor - 1) // factor
+    out_h = (frame.height + factor - 1) // factor
+    out = bytearray(out_w * out_h * ch)
+    data = frame.data
+    step = factor * ch
+    for oy in range(out_h):
+        row = data[oy * factor * src_stride:(oy * factor + 1) * src_stride]
+        dst = oy * out_w * ch
+        line = bytearray(out_w * ch)
+        for c in range(ch):
+            line[c::ch] = row[c::step]
+        out[dst:dst + out_w * ch] = line
+    return Frame(out_w, out_h, ch, out)
+
+
+def dhash(frame, size=8):
+    """
+    64-bit difference hash: compares horizontally adjacent luma samples on a
+    (size+1) x size grid.
+    """
+    ch = frame.channels
+    data = frame.data
+    stride = frame.width * ch
+    value = 0
+    for gy in range(size):
+        y = (gy * 2 + 1) * frame.height // (size * 2)
+        prev = None
+        for gx in range(size + 1):
+            x = (gx * 2 + 1) * frame.width // ((size + 1) * 2)
+            i = y * stride + x * ch
+            luma = (data[i] * 299 + data[i + 1] * 587 + data[i + 2] * 114) // 1000
+            if prev is not None:
+                value = (value << 1) | (luma > prev)
+            prev = luma
+    return value
+
+
+def encode_png(frame, level=SCREENSHOT_COMPRESSION):
+    """
+    Minimal PNG writer (filter type 0 on every row).
+    """
+    stride = frame.width * frame.channels
+    data = frame.data
+    raw = b"".join(b"\x00" + bytes(data[y * stride:(y + 1) * stride]) for y in range(frame.height))
+    color_type = 6 if frame.channels == 4 else 2
+
+    def chunk(tag, body):
+        return (struct.pack(">I", len(body)) + tag + body
+                + struct.pack(">I", zlib.crc32(tag + body) & 0xFFFFFFFF))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", frame.width, frame.height, 8, color_type, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, level))
+            + chunk(b"IEND", b""))
+
+
+def grab_adb_raw(udid, timeout=10):
+    """
+    Grabs an uncompressed frame over adb; the device does not spend time on PNG.
+    """
+    raw = subprocess.check_output(["adb", "-s", udid, "exec-out", "screencap"], timeout=timeout)
+    return parse_raw_screencap(raw)
+
+
+class ScreenshotPipeline:
+    """
+    Background grab -> encode -> store pipeline shared by every device a
+    process drives. Jobs that do not fit in the queue are dropped and counted.
+    """
+
+    def __init__(self, out_dir=SCREENSHOT_DIR, scale=SCREENSHOT_SCALE,
+                 quota_bytes=SCREENSHOT_QUOTA_BYTES, dedup_distance=DEDUP_MAX_DISTANCE,
+                 queue_size=QUEUE_SIZE):
+        self.out_dir = out_dir
+        self.scale = scale
+        self.quota_bytes = quota_bytes
+        self.dedup_distance = dedup_distance
+        self.stats = {"queued": 0, "dropped_busy": 0, "dropped_duplicate": 0,
+                      "written": 0, "bytes_written": 0, "evicted": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._hashes = {}
+        self._usage = {}
+        self._grab_q = queue.Queue(maxsize=queue_size)
+        self._encode_q = queue.Queue(maxsize=queue_size)
+        self._threads = [
+            threading.Thread(target=self._grab_loop, name="screenshot-grab", daemon=True),
+            threading.Thread(target=self._encode_loop, name="screenshot-encode", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def capture(self, udid, label, driver=None):
+        """
+        Schedules a screenshot of `udid` and returns immediately. The frame is
+        grabbed over adb; `driver` is only used if adb is unavailable.
+        Returns False when the job had to be dropped.
+        """
+        try:
+            self._grab_q.put_nowait((udid, label, driver, time.time()))
+        except queue.Full:
+            self._count("dropped_busy")
+            return False
+        self._count("queued")
+        return True
+
+    def _count(self, key, n=1):
+        # capture() runs on the device threads, the rest on the pipeline's own
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def close(self, timeout=10):
+        """
+        Flushes pending jobs and stops the background threads.
+        """
+        self._grab_q.put((None, None, None, None))
+        for t in self._threads:
+            t.join(timeout)
+
+    def _grab_loop(self):
+        while True:
+            udid, label, driver, ts = self._grab_q.get()
+            if udid is None:
+                self._encode_q.put((None, None, None, None))
+                return
+            try:
+                try:
+                    payload = grab_adb_raw(udid)
+                except (OSError, subprocess.SubprocessError, ValueError):
+                    if driver is None:
+                        raise
+                    payload = driver.get_screenshot_as_png()
+                self._encode_q.put((udid, label, payload, ts))
+            except Exception as e:
+                self._count("errors")
+                print(f"[{udid}] WARNING: screenshot '{label}' failed: {e}")
+
+    def _encode_loop(self):
+        while True:
+            udid, label, payload, ts = self._encode_q.get()
+            if udid is None:
+                return
+            try:
+                self._store(udid, label, payload, ts)
+            except Exception as e:
+                self._count("errors")
+                print(f"[{udid}] WARNING: could not store screenshot '{label}': {e}")
+
+    def _store(self, udid, label, payload, ts):
+        frame = payload if isinstance(payload, Frame) else decode_png(payload)
+        if frame is None:
+            # Appium PNG and no Pillow: keep it as delivered.
+            png = payload
+        else:
+            frame = downscale(frame, self.scale)
+            h = dhash(frame)
+            recent = self._hashes.setdefault(udid, [])
+            if any(bin(h ^ old).count("1") <= self.dedup_distance for old in recent):
+                self._count("dropped_duplicate")
+                return
+            recent.append(h)
+            del recent[:-DEDUP_HISTORY]
+            png = encode_png(frame)
+
+        device_dir = os.path.join(self.out_dir, udid)
+        os.makedirs(device_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(ts)) + f"-{int(ts * 1000) % 1000:03d}"
+        path = os.path.join(device_dir, f"{stamp}_{label}.png")
+        with open(path, "wb") as f:
+            f.write(png)
+        self._count("written")
+        self._count("bytes_written", len(png))
+        self._enforce_quota(udid, device_dir, len(png))
+
+    def _enforce_quota(self, udid, device_dir, added):
+        used = self._usage.get(udid)
+        if used is None:
+            used = sum(os.path.getsize(os.path.join(device_dir, n)) for n in os.listdir(device_dir))
+        else:
+            used += added
+        if used > self.quota_bytes:
+            # file names start with a timestamp, so name order is age order
+            for name in sorted(os.listdir(device_dir)):
+                if used <= self.quota_bytes:
+                    break
+                path = os.path.join(device_dir, name)
+                used -= os.path.getsize(path)
+                os.remove(path)
+                self._count("evicted")
+        self._usage[udid] = used
+
+
+_shared = None
+_shared_pid = None
+_shared_lock = threading.Lock()
+
+
+def shared():
+    """
+    The pipeline of this process, started on first use and flushed at
+    exit. A forked child starts its own instead of inheriting the parent's
+    stopped threads.
+    """
+    global _shared, _shared_pid
+    with _shared_lock:
+        if _shared is None or _shared_pid != os.getpid():
+            _shared = ScreenshotPipeline()
+            _shared_pid = os.getpid()
+            atexit.register(_shared.close)
+        return _shared
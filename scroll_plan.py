@@ -0,0 +1,143 @@
+"""
+Learned scroll plans: a swipe sequence per device and screen, replayed
+in one request.
+
+UiScrollable.scrollIntoView / scrollToEnd scroll one fling at a time and
+dump the hierarchy after each to see whether to go on, so every
+iteration pays for the whole search again. A click or gesture step with a
+`scroll:` block learns instead what it takes on this device:
+
+- a click step swipes one at a time until its first non-scrolling locator
+  (e.g. text("Return to Menu")) matches, and keeps the swipe count plus
+  the fraction of the last swipe that brings the target near the middle
+  of the screen rather than past it;
+- a gesture step swipes until the page source stops changing and keeps
+  the count plus a locator for the last text on screen (the end marker).
+
+The plan is stored with the other learned state in the run ledger, under
+the step's `learn` key, so it carries over between launches and is per
+device. After that the step sends the swipes as one actions request and
+checks the result with one lookup. Only when that check misses does it
+fall back to its UiScrollable locators; the plan is dropped and learned
+again, at most every RELEARN_AFTER iterations when learning fails.
+
+Swipes end with a short hold (SWIPE_HOLD_MS) so the list stops with the
+finger; without it a fling carries on for a device-dependent distance and
+a batched sequence would not scroll like the swipes it was learned from.
+
+    scroll: {learn: return_to_menu_scroll, swipe: {from: [0.5, 0.75], to: [0.5, 0.35], ms: 400}, max: 10}
+"""
+import xml.etree.ElementTree as ET
+
+from gestures import GestureBatch
+
+# --- Configuration ---
+DEFAULT_SWIPE = {"from": [0.5, 0.75], "to": [0.5, 0.35], "ms": 400}
+MAX_SWIPES = 10                 # learning gives up after this many
+SWIPE_HOLD_MS = 100
+TARGET_Y = 0.5                  # where a scrolled-to element should end up, fraction of the height
+MIN_LAST = 0.2                  # shortest last swipe, fraction of a full one
+RELEARN_AFTER = 20              # iterations before learning again after it failed
+CHECK_SECONDS = 1.0             # per-swipe allowance for a lookup or page source while learning
+
+
+class ScrollSpec:
+    def __init__(self, learn, swipe=None, max_swipes=MAX_SWIPES):
+        if not learn:
+            raise ValueError("scroll needs a `learn` key to keep the plan under")
+        self.learn = learn
+        self.swipe = swipe or DEFAULT_SWIPE
+        self.max_swipes = int(max_swipes)
+
+    def budget(self, swipe=None):
+        """
+        Seconds learning can take at most (added to the step's deadline).
+        """
+        ms = (swipe or self.swipe).get("ms", 300)
+        return self.max_swipes * ((ms + SWIPE_HOLD_MS) / 1000.0 + CHECK_SECONDS)
+
+    def __repr__(self):
+        return f"learned scroll {self.learn} (up to {self.max_swipes} swipes)"
+
+
+def parse(entry):
+    if entry is None:
+        return None
+    return ScrollSpec(entry.get("learn"), entry.get("swipe"), entry.get("max", MAX_SWIPES))
+
+
+def batch(swipe, n, last=1.0):
+    """
+    n swipes of `swipe` (x1, y1, x2, y2, ms in pixels), the last one
+    shortened to `last` of its length.
+    """
+    x1, y1, x2, y2, ms = swipe
+    b = GestureBatch()
+    for i in range(n):
+        f = last if i == n - 1 else 1.0
+        b.swipe(x1, y1, x1 + (x2 - x1) * f, y1 + (y2 - y1) * f, max(1, int(ms * f)), SWIPE_HOLD_MS)
+    return b
+
+
+def learn_to_element(driver, swipe, check, max_swipes, height):
+    """
+    Swipes one at a time until `check` (by, value) finds an element.
+    Returns (swipes, last, element), or None when max_swipes were not
+    enough.
+    """
+    by, value = check
+    for n in range(max_swipes + 1):
+        if n:
+            batch(swipe, 1).perform(driver)
+        found = driver.find_elements(by, value)
+        if not found:
+            continue
+        last = 1.0
+        if n:
+            # an element above TARGET_Y was scrolled further than it had to be
+            rect = found[0].rect
+            over = height * TARGET_Y - (rect["y"] + rect["height"] / 2)
+            step = abs(swipe[1] - swipe[3]) or 1
+            last = min(1.0, max(MIN_LAST, 1.0 - over / step)) if over > 0 else 1.0
+        return n, round(last, 2), found[0]
+    return None
+
+
+def end_marker(source):
+    """
+    UiSelector for the last text or description on screen that is unique
+    in `source`, or None (also for an empty or missing page source).
+    """
+    if not isinstance(source, str) or not source:
+        return None
+    try:
+        root = ET.fromstring(source)
+    except ET.ParseError:
+        return None
+    candidates = []
+    for node in root.iter():
+        for attr, method in (("text", "text"), ("content-desc", "description")):
+            v = node.get(attr)
+            if v and '"' not in v and "\\" not in v:
+                candidates.append((method, v))
+    for method, v in reversed(candidates):
+        if candidates.count((method, v)) == 1:
+            return f'new UiSelector().{method}("{v}")'
+    return None
+
+
+def learn_to_end(driver, swipe, max_swipes):
+    """
+    Swipes one at a time until the page source stops changing. Returns
+    (swipes, end marker), or None when the screen kept changing or has no
+    usable marker.
+    """
+    before = driver.page_source
+    for n in range(max_swipes + 1):
+        batch(swipe, 1).perform(driver)
+        after = driver.page_source
+        if after == before:
+            marker = end_marker(after)
+            return (n, marker) if marker else None
+        before = after
+    return None
@@ -0,0 +1,184 @@
+"""
+Reattach to live Appium sessions across orchestrator restarts.
+
+Workers report each session they hold (id, ports, how long it took) to
+the orchestrator through the run ledger queue. The orchestrator keeps
+STATE_FILE up to date with those sessions and its Appium server pids.
+
+On SIGHUP the scripts detach instead of shutting down. Workers are
+stopped without quitting their sessions, the Appium servers keep running
+(they are started in their own process group, so a Ctrl-C in the
+terminal does not reach them either), and the state file stays. On the
+next start:
+
+- every device gets the ports it had (assign_ports);
+- an Appium server that still answers /status is adopted instead of
+  started;
+- run_scenario attaches to the recorded session when the server still has
+  it, and creates a new one otherwise.
+
+report() prints how many sessions were reattached and the session
+creation time that saved. NEW_COMMAND_TIMEOUT keeps sessions alive long
+enough for a restart.
+"""
+import json
+import os
+import signal
+import statistics
+import time
+import urllib.error
+import urllib.request
+
+from appium import webdriver
+
+# --- Configuration ---
+STATE_FILE = "session_state.json"
+NEW_COMMAND_TIMEOUT = 600       # seconds Appium keeps an idle session (default 60)
+PROBE_TIMEOUT = 2
+
+
+def load(path=STATE_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"devices": {}}
+
+
+def save(devices, path=STATE_FILE):
+    """
+    `devices`: {udid: {"session_id", "server_port", "system_port",
+    "server_pid", "create_seconds"}}.
+    """
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"saved": time.time(), "devices": devices}, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def clear(path=STATE_FILE):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def lookup(udid, server_port, system_port, path=STATE_FILE):
+    """
+    The recorded entry for a device if it was on the same ports, else None.
+    """
+    entry = load(path)["devices"].get(udid)
+    if entry and entry.get("session_id") and entry.get("server_port") == server_port \
+            and entry.get("system_port") == system_port:
+        return entry
+    return None
+
+
+def assign_ports(devices, state, base_port, offset, system_base):
+    """
+    {udid: (server_port, system_port)}: recorded devices keep their slot,
+    new ones take the lowest free one.
+    """
+    recorded = state.get("devices", {})
+    used, ports = set(), {}
+    for udid in devices:
+        entry = recorded.get(udid)
+        if entry:
+            slot = (entry["server_port"] - base_port) // offset
+            if slot >= 0 and slot not in used and entry["system_port"] == system_base + slot:
+                used.add(slot)
+                ports[udid] = (base_port + slot * offset, system_base + slot)
+    slot = 0
+    for udid in devices:
+        if udid in ports:
+            continue
+        while slot in used:
+            slot += 1
+        used.add(slot)
+        ports[udid] = (base_port + slot * offset, system_base + slot)
+    return ports
+
+
+def server_alive(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/status", timeout=PROBE_TIMEOUT) as r:
+            return r.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+class AdoptedServer:
+    """
+    An Appium server started by an earlier orchestrator; looks enough like
+    a Popen for the shutdown handlers.
+    """
+
+    def __init__(self, pid, port):
+        self.pid = pid
+        self.port = port
+
+    def poll(self):
+        return None if server_alive(self.port) else 0
+
+    def terminate(self):
+        if self.pid:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+class _Attached(webdriver.Remote):
+    """
+    webdriver.Remote bound to an existing session instead of a new one.
+    """
+
+    def __init__(self, command_executor, session_id, options):
+        self._attach_to = session_id
+        super().__init__(command_executor, options=options)
+
+    def start_session(self, capabilities, browser_profile=None):
+        self.session_id = self._attach_to
+        self.caps = {}
+        # raises InvalidSessionIdException when the server no longer has it
+        self.execute("getTimeouts")
+
+
+def attach(command_executor, session_id, options):
+    return _Attached(command_executor, session_id, options)
+
+
+def report(sessions, state):
+    """
+    One line on how the fleet got its sessions; `sessions` is
+    RunLedger.sessions, `state` the state file as loaded at startup.
+    """
+    new = [s["seconds"] for s in sessions.values() if not s["reattached"]]
+    reattached = {u: s for u, s in sessions.items() if s["reattached"]}
+    if not reattached:
+        return f"{len(new)} new session(s), {statistics.fmean(new) if new else 0:.1f}s each"
+    # what the reattached devices' sessions cost last time they were created
+    recorded = state.get("devices", {})
+    typical = statistics.median(new) if new else None
+    saved = 0.0
+    for udid, s in reattached.items():
+        cost = recorded.get(udid, {}).get("create_seconds") or typical or 0.0
+        saved += cost - s["seconds"]
+    spent = statistics.fmean(s["seconds"] for s in reattached.values())
+    return (f"{len(reattached)} session(s) reattached ({spent:.2f}s each), {len(new)} new; "
+            f"≈{saved:.0f}s of session creation saved")
+
+
+def entries(sessions, servers, recorded=None):
+    """
+    State file entries for the sessions the workers reported. `servers`
+    maps udid to a Popen or AdoptedServer.
+    """
+    recorded = (recorded or {}).get("devices", {})
+    out = {}
+    for udid, s in sessions.items():
+        create = s["seconds"] if not s["reattached"] else recorded.get(udid, {}).get("create_seconds")
+        server = servers.get(udid)
+        out[udid] = {"session_id": s["session_id"], "server_port": s["server_port"],
+                     "system_port": s["system_port"], "create_seconds": create,
+                     "server_pid": getattr(server, "pid", None)}
+    return out
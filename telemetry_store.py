@@ -0,0 +1,195 @@
+"""
+Columnar telemetry store for step timings.
+
+Every worker appends fixed-width 24-byte records to its own memory-mapped
+segment files (TELEMETRY_DIR/<prefix>-<n>.tlm, SEGMENT_RECORDS records
+each). The 32-byte header holds the committed record count, so a reader
+never sees a half-written record. Readers map the segments straight into
+NumPy structured arrays without copying.
+
+    python telemetry_store.py [dir]     percentile / throughput report
+"""
+import glob
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+# --- Configuration ---
+TELEMETRY_DIR = "telemetry"
+SEGMENT_RECORDS = 1 << 20       # 24 MB per segment
+
+MAGIC = b"TLM1"
+HEADER = struct.Struct("<4sIQQQ")           # magic, record size, capacity, count, created
+RECORD = struct.Struct("<HHIdfB3x")         # device, step, iteration, start, duration, outcome
+RECORD_DTYPE = np.dtype({
+    "names": ["device", "step", "iteration", "start", "duration", "outcome"],
+    "formats": ["<u2", "<u2", "<u4", "<f8", "<f4", "u1"],
+    "offsets": [0, 2, 4, 8, 16, 20],
+    "itemsize": RECORD.size,
+})
+HEADER_SIZE = 32
+_COUNT_OFFSET = 4 + 4 + 8
+
+# Step ids are part of the file format: append, never renumber.
+STEPS = {
+    "iteration": 0,
+    "play": 1,
+    "quit": 2,
+    "return_to_menu": 3,
+    "ad_wait": 4,
+    "relaunch": 5,
+    "change_teams": 6,
+    "banner_tap": 7,
+    "webview_ad": 8,
+}
+STEP_NAMES = {v: k for k, v in STEPS.items()}
+
+OK, FAILED, TIMEOUT, SKIPPED, HUNG = 0, 1, 2, 3, 4
+OUTCOME_NAMES = {OK: "ok", FAILED: "failed", TIMEOUT: "timeout", SKIPPED: "skipped", HUNG: "hung"}
+
+
+class TelemetryWriter:
+    """
+    Append-only writer for one worker. `prefix` must be unique per process
+    (device index is a good choice); no locking is done.
+    """
+
+    def __init__(self, prefix, device, directory=TELEMETRY_DIR, segment_records=SEGMENT_RECORDS):
+        self.prefix = prefix
+        self.device = device
+        self.directory = directory
+        self.segment_records = segment_records
+        os.makedirs(directory, exist_ok=True)
+        existing = glob.glob(os.path.join(directory, f"{prefix}-*.tlm"))
+        self._segment_no = max((int(p.rsplit("-", 1)[1][:-4]) for p in existing), default=-1)
+        self._file = self._map = None
+        self._count = self._capacity = 0
+        self._open_next()
+
+    def _open_next(self):
+        self.close()
+        self._segment_no += 1
+        path = os.path.join(self.directory, f"{self.prefix}-{self._segment_no:06d}.tlm")
+        size = HEADER_SIZE + self.segment_records * RECORD.size
+        self._file = open(path, "w+b")
+        self._file.truncate(size)   # sparse until written
+        self._map = mmap.mmap(self._file.fileno(), size)
+        HEADER.pack_into(self._map, 0, MAGIC, RECORD.size, self.segment_records, 0, int(time.time()))
+        self._count, self._capacity = 0, self.segment_records
+
+    def record(self, step, iteration, start, duration, outcome=OK):
+        """
+        `step` is a STEPS name or id; `start` is a time.time() timestamp.
+        """
+        if self._count == self._capacity:
+            self._open_next()
+        step_id = STEPS[step] if isinstance(step, str) else step
+        RECORD.pack_into(self._map, HEADER_SIZE + self._count * RECORD.size,
+                         self.device, step_id, iteration, start, duration, outcome)
+        self._count += 1
+        # publish after the record is in place
+        struct.pack_into("<Q", self._map, _COUNT_OFFSET, self._count)
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+class StepClock:
+    """
+    Small helper for the device loops: start(step) ... done(outcome).
+    Durations of successful steps also go into `histograms` (a
+    latency_histogram.HistogramSet) under `label` when one is given.
+    `override` replaces the outcome of the current step (the watchdog sets
+    it to HUNG).
+    """
+
+    def __init__(self, writer, histograms=None, label=None):
+        self.writer = writer
+        self.histograms = histograms
+        self.label = label
+        self.iteration = 0
+        self._step = None
+        self._t0 = 0.0
+        self.override = None
+
+    def start(self, step):
+        self._step, self._t0, self.override = step, time.time(), None
+
+    def done(self, outcome=OK):
+        duration = time.time() - self._t0
+        if self.override is not None:
+            outcome, self.override = self.override, None
+        if self._step is not None:
+            self.writer.record(self._step, self.iteration, self._t0, duration, outcome)
+            if self.histograms is not None and outcome == OK:
+                self.histograms.record(self.label, self._step, duration)
+        self._step = None
+        return duration
+
+
+def open_segment(path):
+    """
+    Zero-copy structured array over the committed records of one segment.
+    """
+    with open(path, "rb") as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, record_size, _capacity, count, _created = HEADER.unpack_from(m, 0)
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError(f"{path}: not a telemetry segment")
+    return np.frombuffer(m, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+
+
+def load(directory=TELEMETRY_DIR):
+    """
+    All segments in a directory, as a list of zero-copy arrays (one per
+    segment). Use np.concatenate only on the columns you need.
+    """
+    return [open_segment(p) for p in sorted(glob.glob(os.path.join(directory, "*.tlm")))]
+
+
+def column(segments, name):
+    return np.concatenate([s[name] for s in segments]) if segments else np.empty(0, RECORD_DTYPE[name])
+
+
+def report(directory=TELEMETRY_DIR):
+    segments = load(directory)
+    if not segments:
+        print(f"No telemetry in {directory}")
+        return
+    steps = column(segments, "step")
+    durations = column(segments, "duration")
+    outcomes = column(segments, "outcome")
+    starts = column(segments, "start")
+    devices = column(segments, "device")
+    iterations = column(segments, "iteration")
+
+    span_h = max(1e-9, (starts.max() - starts.min()) / 3600.0)
+    print(f"{len(steps)} records, {len(segments)} segment(s), {span_h:.2f} h")
+    print(f"{'step':<16} {'n':>9} {'fail%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for step_id in np.unique(steps):
+        mask = steps == step_id
+        d = durations[mask]
+        fail = 100.0 * np.count_nonzero(outcomes[mask] != OK) / d.size
+        p50, p90, p99 = np.percentile(d, [50, 90, 99])
+        print(f"{STEP_NAMES.get(int(step_id), step_id):<16} {d.size:>9} {fail:>6.1f} "
+              f"{p50:>8.3f} {p90:>8.3f} {p99:>8.3f} {d.max():>8.3f}")
+
+    print(f"{'device':<8} {'iterations':>10} {'iter/h':>8}")
+    for dev in np.unique(devices):
+        mask = devices == dev
+        # one "iteration" record per loop pass; iteration numbers restart with the worker
+        its = np.count_nonzero(mask & (steps == STEPS["iteration"])) or np.unique(iterations[mask]).size
+        dev_span = max(1e-9, (starts[mask].max() - starts[mask].min()) / 3600.0)
+        print(f"{int(dev):<8} {its:>10} {its / dev_span:>8.1f}")
+
+
+if __name__ == "__main__":
+    report(sys.argv[1] if len(sys.argv) > 1 else TELEMETRY_DIR)
@@ -0,0 +1,171 @@
+"""
+Image template-matching locator for buttons drawn on the game canvas.
+
+Small reference crops (TEMPLATE_DIR/<name>.npy, or .png with Pillow) are
+matched against a screen frame by normalised cross-correlation, computed
+with FFTs and integral images on a grayscale copy reduced by
+LOCATOR_SCALE. The result is a tap point in device pixels plus a score in
+[-1, 1].
+"""
+import os
+
+import numpy as np
+
+from screenshots import Frame, decode_png, grab_adb_raw
+
+# --- Configuration ---
+TEMPLATE_DIR = "templates"
+LOCATOR_SCALE = 4               # match on every 4th pixel in both directions
+MATCH_THRESHOLD = 0.8
+
+
+class Match:
+    __slots__ = ("name", "x", "y", "confidence")
+
+    def __init__(self, name, x, y, confidence):
+        self.name = name
+        self.x = x
+        self.y = y
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"Match({self.name!r}, x={self.x}, y={self.y}, confidence={self.confidence:.3f})"
+
+
+def frame_to_array(frame):
+    """
+    View a Frame as an (h, w, channels) uint8 array without copying.
+    """
+    return np.frombuffer(frame.data, dtype=np.uint8).reshape(frame.height, frame.width, frame.channels)
+
+
+def to_gray(pixels, scale):
+    """
+    Subsample first, then convert to float32 luma, so only the reduced
+    image is touched in floating point.
+    """
+    small = pixels[::scale, ::scale, :3].astype(np.float32)
+    return small @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _window_sums(img, h, w):
+    """
+    Sum of every h x w window (valid positions only) via an integral image.
+    """
+    s = np.zeros((img.shape[0] + 1, img.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(img, axis=0), axis=1, out=s[1:, 1:])
+    return s[h:, w:] - s[:-h, w:] - s[h:, :-w] + s[:-h, :-w]
+
+
+def ncc(image, template):
+    """
+    Normalised cross-correlation of `template` over every valid position of
+    `image`; returns an array of shape (H - h + 1, W - w + 1).
+    """
+    H, W = image.shape
+    h, w = template.shape
+    t0 = template - template.mean()
+    t_norm = np.sqrt((t0 * t0).sum())
+    if t_norm == 0:
+        return np.zeros((H - h + 1, W - w + 1), dtype=np.float32)
+
+    # t0 sums to zero, so sum(f * t0) equals sum((f - mean_f) * t0)
+    corr = np.fft.irfft2(np.fft.rfft2(image) * np.conj(np.fft.rfft2(t0, s=(H, W))), s=(H, W))
+    corr = corr[:H - h + 1, :W - w + 1]
+
+    n = h * w
+    sums = _window_sums(image, h, w)
+    sq_sums = _window_sums(image.astype(np.float64) ** 2, h, w)
+    var = np.maximum(sq_sums - sums * sums / n, 0.0)
+    denom = np.sqrt(var) * t_norm
+    out = np.zeros_like(corr, dtype=np.float32)
+    np.divide(corr, denom, out=out, where=denom > 1e-6)
+    return np.clip(out, -1.0, 1.0, out=out)
+
+
+class TemplateLocator:
+    """
+    Keeps reduced templates in memory and finds them in frames.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR, scale=LOCATOR_SCALE, threshold=MATCH_THRESHOLD):
+        self.template_dir = template_dir
+        self.scale = scale
+        self.threshold = threshold
+        self._templates = {}
+
+    def add_template(self, name, pixels):
+        """
+        Registers an (h, w, channels) uint8 crop under `name`.
+        """
+        self._templates[name] = to_gray(pixels, self.scale)
+
+    def has_template(self, name):
+        return name in self._templates or any(
+            os.path.exists(os.path.join(self.template_dir, name + ext)) for ext in (".npy", ".png"))
+
+    def template(self, name):
+        if name not in self._templates:
+            npy = os.path.join(self.template_dir, name + ".npy")
+            if os.path.exists(npy):
+                pixels = np.load(npy)
+            else:
+                with open(os.path.join(self.template_dir, name + ".png"), "rb") as f:
+                    frame = decode_png(f.read())
+                if frame is None:
+                    raise RuntimeError(f"template '{name}' is a PNG; install Pillow or save it as .npy")
+                pixels = frame_to_array(frame)
+            self.add_template(name, pixels)
+        return self._templates[name]
+
+    def match(self, frame, name, threshold=None):
+        """
+        Best match of template `name` in `frame` (a Frame or an (h, w, c)
+        array). Returns None when the score is below the threshold.
+        """
+        pixels = frame_to_array(frame) if isinstance(frame, Frame) else frame
+        image = to_gray(pixels, self.scale)
+        tmpl = self.template(name)
+        if tmpl.shape[0] > image.shape[0] or tmpl.shape[1] > image.shape[1]:
+            return None
+        scores = ncc(image, tmpl)
+        y, x = np.unravel_index(int(np.argmax(scores)), scores.shape)
+        confidence = float(scores[y, x])
+        if confidence < (self.threshold if threshold is None else threshold):
+            return None
+        th, tw = tmpl.shape
+        return Match(name, int((x + tw / 2) * self.scale), int((y + th / 2) * self.scale), confidence)
+
+    def locate(self, udid, name, driver=None):
+        """
+        Grabs the current screen of `udid` (adb raw, or Appium PNG via
+        `driver`) and matches `name` in it.
+        """
+        try:
+            frame = grab_adb_raw(udid)
+        except Exception:
+            if driver is None:
+                raise
+            frame = decode_png(driver.get_screenshot_as_png())
+        return self.match(frame, name)
+
+    def tap(self, driver, udid, name):
+        """
+        Taps the matched template centre. Returns the Match, or None if the
+        template was not on screen.
+        """
+        m = self.locate(udid, name, driver)
+        if m is not None:
+            driver.execute_script("mobile: clickGesture", {"x": m.x, "y": m.y})
+        return m
+
+
+def save_template(frame, left, top, width, height, name, template_dir=TEMPLATE_DIR):
+    """
+    Crops a reference image out of a captured frame and stores it as .npy.
+    """
+    os.makedirs(template_dir, exist_ok=True)
+    pixels = frame_to_array(frame) if isinstance(frame, Frame) else frame
+    crop = np.ascontiguousarray(pixels[top:top + height, left:left + width])
+    np.save(os.path.join(template_dir, name + ".npy"), crop)
+    return crop
@@ -0,0 +1,58 @@
+from appium import webdriver
+from appium.options.android import UiAutomator2Options
+from appium.webdriver.common.appiumby import AppiumBy
+
+import fake_appium_server
+import uia2_direct
+
+
+def _recording(fake, log, reject=False):
+    handle = fake.handle
+
+    def wrapped(method, path, body):
+        log.append((method, path, body))
+        if reject and path.endswith("/elements"):
+            return 400, {"error": "invalid argument", "message": "strategy", "stacktrace": ""}
+        return handle(method, path, body)
+    fake.handle = wrapped
+
+
+def _driver(reject=False):
+    appium, appium_fake = fake_appium_server.serve(0, background=True)
+    uia2, uia2_fake = fake_appium_server.serve(0, background=True)
+    uia2_fake.handle("POST", "/session", {})      # the session Appium would have started
+    direct_log, appium_log = [], []
+    _recording(uia2_fake, direct_log, reject)
+    _recording(appium_fake, appium_log)
+    opts = UiAutomator2Options()
+    opts.udid = "test"
+    executor = uia2_direct.connect(f"http://127.0.0.1:{appium.server_address[1]}", uia2.server_address[1])
+    driver = webdriver.Remote(command_executor=executor, options=opts)
+    executor._last_appium = float("inf")
+    return driver, executor, direct_log, appium_log, (appium, uia2)
+
+
+def test_find_body_is_translated():
+    driver, executor, direct_log, appium_log, servers = _driver()
+    try:
+        executor.route = "direct"
+        assert len(driver.find_elements(AppiumBy.ID, "pkg:id/play")) == 3
+        finds = [entry for entry in direct_log if entry[1].endswith("/elements")]
+        assert finds[0][2] == {"strategy": "id", "selector": "pkg:id/play", "context": ""}
+        assert not any(path.endswith("/elements") for _, path, _ in appium_log)
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+def test_rejected_find_goes_through_appium():
+    driver, executor, direct_log, appium_log, servers = _driver(reject=True)
+    try:
+        executor.route = "direct"
+        assert len(driver.find_elements(AppiumBy.ID, "pkg:id/play")) == 3
+        assert any(path.endswith("/elements") for _, path, _ in direct_log)
+        assert appium_log[-1][1].endswith("/elements")
+        assert appium_log[-1][2] == {"using": "id", "value": "pkg:id/play"}
+    finally:
+        for server in servers:
+            server.shutdown()
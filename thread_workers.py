@@ -0,0 +1,120 @@
+"""
+Thread-based worker mode.
+
+run_loop_on is almost entirely waiting on HTTP, so several devices can
+share one interpreter. spawn_workers() packs devices into processes of
+`devices_per_process` threads each; each device thread is supervised on
+its own, so an exception in one device's loop restarts that device only.
+A hard crash of the process (segfault, OOM kill) still takes down the
+devices it hosts; the parent sees the exit code and respawns the group.
+A worker that keeps dying soon after it starts (e.g. its Appium server
+is down, so every session start fails) is respawned with exponential
+backoff, up to RESPAWN_MAX seconds between attempts.
+"""
+import multiprocessing
+import threading
+import time
+import traceback
+
+# --- Configuration ---
+DEVICES_PER_PROCESS = 8
+RESTART_BACKOFF = (1, 2, 5, 10, 30)     # seconds before each restart of a crashed device
+RESPAWN_BASE = 5                # seconds before respawning after a second quick exit in a row
+RESPAWN_MAX = 300
+QUICK_EXIT = 60                 # a process that lived less than this counts as a repeated failure
+
+
+def _supervise(target, args, name):
+    """
+    Runs target(*args) until it returns normally; restarts it with backoff
+    when it raises.
+    """
+    failures = 0
+    while True:
+        try:
+            target(*args)
+            return
+        except Exception:
+            delay = RESTART_BACKOFF[min(failures, len(RESTART_BACKOFF) - 1)]
+            failures += 1
+            print(f"[{name}] worker thread crashed (#{failures}), restarting in {delay}s:\n"
+                  f"{traceback.format_exc()}")
+            time.sleep(delay)
+
+
+def _thread_host(target, group):
+    """
+    Body of one worker process: a thread per (name, args) in `group`.
+    """
+    threads = []
+    for name, args in group:
+        t = threading.Thread(target=_supervise, args=(target, args, name), name=name, daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+
+def spawn_workers(target, jobs, mode="process", devices_per_process=DEVICES_PER_PROCESS, context=None):
+    """
+    Starts workers for `jobs`, a list of (name, args) pairs, and returns the
+    Process objects. mode="process" keeps the original one process per
+    device; mode="thread" groups devices as threads. `context` is a
+    multiprocessing context (see worker_factory); default start method if
+    omitted.
+    """
+    ctx = context or multiprocessing
+    if mode == "process":
+        groups = [[job] for job in jobs]
+        runner = None
+    elif mode == "thread":
+        groups = [jobs[i:i + devices_per_process] for i in range(0, len(jobs), devices_per_process)]
+        runner = _thread_host
+    else:
+        raise ValueError(f"unknown worker mode: {mode}")
+
+    procs = []
+    for group in groups:
+        if runner is None:
+            name, args = group[0]
+            p = ctx.Process(target=target, args=args, name=name, daemon=True)
+        else:
+            p = ctx.Process(target=runner, args=(target, group),
+                            name="+".join(n for n, _ in group), daemon=True)
+        p.start()
+        p.group = group
+        p.started = time.time()
+        p.failures = 0
+        procs.append(p)
+    return procs
+
+
+def respawn_dead(target, procs, mode="process", context=None):
+    """
+    Replaces worker processes that died with a non-zero exit code (in thread
+    mode that is a whole group). A dead process stays in the list until its
+    backoff has passed. Returns the updated list.
+    """
+    alive = []
+    now = time.time()
+    for p in procs:
+        if p.is_alive() or p.exitcode == 0:
+            alive.append(p)
+            continue
+        if not hasattr(p, "retry_at"):
+            p.failures = p.failures + 1 if now - p.started < QUICK_EXIT else 1
+            delay = min(RESPAWN_MAX, RESPAWN_BASE * 2 ** (p.failures - 2)) if p.failures > 1 else 0
+            p.retry_at = now + delay
+            print(f"Worker {p.name} exited with {p.exitcode}; "
+                  + (f"respawning in {delay}s ({p.failures} quick exits in a row)" if delay else "respawning"))
+        if now < p.retry_at:
+            alive.append(p)
+            continue
+        if mode == "thread":
+            spawned = spawn_workers(target, p.group, "thread", len(p.group), context)
+        else:
+            spawned = spawn_workers(target, p.group, "process", context=context)
+        for q in spawned:
+            q.failures = p.failures
+        alive += spawned
+    return alive
@@ -0,0 +1,235 @@
+"""
+Direct UiAutomator2 channel for the hot-path commands.
+
+Every command normally goes Python → Appium (Node) → the UiAutomator2
+server on the phone, which Appium reaches through `adb forward` on the
+session's systemPort. Appium only proxies the commands that dominate the
+loops: find element(s), element click, W3C actions, mobile:
+clickGesture and page source. DirectConnection sends those straight to
+127.0.0.1:<systemPort>/wd/hub under the UiAutomator2 server's own
+session id (from GET /sessions); element ids are the same on both routes.
+Find commands are sent in the server's own form ({strategy, selector,
+context}), which Appium otherwise translates them to. Everything else
+goes through Appium. So does a hot command when the forwarded port
+refuses connections, and then the direct route stays off for
+DIRECT_RETRY seconds, and a command the server answers with an error
+other than a missing or stale element is sent again through Appium.
+
+Appium's newCommandTimeout only counts commands it sees, so a hot command
+also goes through Appium when Appium has been idle for APPIUM_KEEPALIVE
+seconds, and every COMPARE_EVERY-th hot command does anyway. Both routes
+are recorded per command in the run's latency histograms ("findElements
+via direct" / "findElements via appium"), so
+`python latency_histogram.py` compares them from the loops.
+
+`id` locators without a package prefix are completed by Appium, not by
+the server, so they stay on the Appium route.
+
+    python uia2_direct.py <appium_port> <system_port> <udid> [n]
+        times each hot command n times over both routes on a live device
+"""
+import sys
+import time
+
+import urllib3
+from selenium.webdriver.remote import utils
+
+from http_transport import COMMAND_TIMEOUTS, TunedConnection, client_config, command_class, tracked_pool
+
+# --- Configuration ---
+APPIUM_KEEPALIVE = 20           # seconds; well under Appium's default newCommandTimeout (60)
+COMPARE_EVERY = 25              # every n-th hot command goes through Appium for comparison
+DIRECT_RETRY = 60               # seconds before trying the direct route again after a failure
+COMPARE_COMMANDS = 200
+
+HOT_COMMANDS = {"findElement", "findElements", "findChildElement", "findChildElements",
+                "clickElement", "actions", "getPageSource"}
+DIRECT_SCRIPTS = {"mobile: clickGesture": "/appium/gestures/click"}
+FIND_COMMANDS = {"findElement": "/element", "findElements": "/elements",
+                 "findChildElement": "/element", "findChildElements": "/elements"}
+ANSWERS = ("no such element", "stale element reference")   # errors that are the command's real result
+
+
+class DirectRejected(Exception):
+    """
+    The UiAutomator2 server answered a direct command with an error; the
+    command is sent again through Appium.
+    """
+
+
+def _direct_locator(params):
+    return params.get("using") != "id" or ":" in str(params.get("value", ""))
+
+
+class DirectConnection(TunedConnection):
+    def __init__(self, client_config, system_port):
+        super().__init__(client_config)
+        self.system_port = system_port
+        self._direct = tracked_pool(self.sockets)("127.0.0.1", system_port, maxsize=2,
+                                                   block=False, retries=False)
+        self._uia2_session = None
+        self._disabled_until = 0.0
+        self._last_appium = time.time()
+        self._hot = 0
+        self._rejected = set()      # commands already reported as rejected on the direct route
+        self.route = None           # "direct" / "appium" forces a route (compare())
+        self.histograms = None      # HistogramSet to record per-route latencies into
+        self.label = None
+
+    def _discover(self):
+        response = self._direct.urlopen("GET", "/wd/hub/sessions", headers=self._headers,
+                                        timeout=urllib3.Timeout(connect=2, read=5),
+                                        retries=False, redirect=False)
+        sessions = (self._parse(response).get("value") or [])
+        if not sessions:
+            raise ConnectionError("no UiAutomator2 session on the forwarded port")
+        self._uia2_session = sessions[0]["id"]
+
+    def _direct_request(self, command, params):
+        """
+        (method, path, body) on the UiAutomator2 server, or None when the
+        command has to go through Appium.
+        """
+        if command == "w3cExecuteScript":
+            path = DIRECT_SCRIPTS.get(params.get("script"))
+            if path is None:
+                return None
+            args = (params.get("args") or [{}])[0]
+            origin = args.get("elementId")
+            body = {"offset": {"x": args["x"], "y": args["y"]}} if "x" in args else {}
+            if origin:
+                body["origin"] = {"ELEMENT": origin, "element-6066-11e4-a52e-4f735466cecf": origin}
+            return "POST", path, body
+        if command not in HOT_COMMANDS:
+            return None
+        if command in FIND_COMMANDS:
+            if not _direct_locator(params):
+                return None
+            # the server takes Appium's internal form, not the W3C using/value
+            body = {"strategy": params["using"], "selector": params["value"],
+                    "context": params.get("id", "")}
+            return "POST", FIND_COMMANDS[command], body
+        body = dict(params)
+        method, path = self._path(command, body)
+        # /session/<appium session>/<rest>
+        return method, path.split("/", 3)[3], body
+
+    def _choose(self, command, params):
+        if self.route is not None:
+            return self.route
+        if time.time() < self._disabled_until:
+            return "appium"
+        self._hot += 1
+        if self._hot % COMPARE_EVERY == 0 or time.time() - self._last_appium > APPIUM_KEEPALIVE:
+            return "appium"
+        return "direct"
+
+    def execute(self, command, params):
+        request = None
+        if command in HOT_COMMANDS or command == "w3cExecuteScript":
+            request = self._direct_request(command, params)
+        route = "appium" if request is None else self._choose(command, params)
+        t0 = time.perf_counter()
+        if route == "direct":
+            try:
+                result = self._send_direct(command, params, *request)
+            except (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError,
+                    ConnectionError) as e:
+                print(f"[{self.label}] direct UiAutomator2 route off for {DIRECT_RETRY}s: {e}")
+                self._disabled_until = time.time() + DIRECT_RETRY
+                self._uia2_session = None
+                route = "appium"
+            except DirectRejected as e:
+                if command not in self._rejected:
+                    print(f"[{self.label}] direct {command} rejected ({e}); sending it through Appium")
+                    self._rejected.add(command)
+                route = "appium"
+            else:
+                self._record(command, route, t0)
+                return result
+        result = super().execute(command, params)
+        self._last_appium = time.time()
+        if request is not None:
+            self._record(command, route, t0)
+        return result
+
+    def _send_direct(self, command, params, method, path, body):
+        if self._uia2_session is None:
+            self._discover()
+        connect, read = COMMAND_TIMEOUTS[command_class(command, params)]
+        cap = self._client_config.timeout
+        if isinstance(cap, (int, float)):
+            read = min(read, cap)
+        url = f"/wd/hub/session/{self._uia2_session}/{path.lstrip('/')}".rstrip("/")
+        response = self._direct.urlopen(method, url, body=utils.dump_json(body) if method == "POST" else None,
+                                        headers=self._headers,
+                                        timeout=urllib3.Timeout(connect=connect, read=read),
+                                        retries=False, redirect=False)
+        result = self._parse(response)
+        if result.get("status") == 404 and "invalid session id" in str(result.get("value")):
+            # the server restarted under Appium; look the session up next time
+            self._uia2_session = None
+            raise ConnectionError("UiAutomator2 session changed")
+        if not 200 <= response.status < 300 and not any(a in str(result.get("value")) for a in ANSWERS):
+            raise DirectRejected(f"HTTP {response.status}")
+        return result
+
+    def _record(self, command, route, t0):
+        name = command if command != "w3cExecuteScript" else "clickGesture"
+        if self.histograms is not None:
+            self.histograms.record(self.label, f"{name} via {route}", time.perf_counter() - t0)
+
+    def close(self):
+        self._direct.close()
+        super().close()
+
+
+def connect(server_url, system_port, timeout=None):
+    """
+    A DirectConnection for webdriver.Remote(command_executor=...).
+    """
+    return DirectConnection(client_config(server_url, timeout), system_port)
+
+
+def compare(appium_port, system_port, udid, n=COMPARE_COMMANDS):
+    """
+    Starts a session on a live device and times each hot command n times
+    through Appium and straight to the UiAutomator2 server.
+    """
+    from appium import webdriver
+    from appium.options.android import UiAutomator2Options
+    from appium.webdriver.common.appiumby import AppiumBy
+    from latency_histogram import HistogramSet, format_rows
+
+    opts = UiAutomator2Options()
+    opts.udid = udid
+    opts.set_capability("systemPort", system_port)
+    executor = connect(f"http://127.0.0.1:{appium_port}", system_port)
+    driver = webdriver.Remote(executor, options=opts)
+    executor.histograms, executor.label = HistogramSet(), udid
+    x = driver.get_window_size()["width"] // 2
+    commands = {
+        "findElements": lambda: driver.find_elements(AppiumBy.CLASS_NAME, "android.widget.FrameLayout"),
+        "findElement": lambda: driver.find_element(AppiumBy.ANDROID_UIAUTOMATOR, "new UiSelector().index(0)"),
+        "getPageSource": lambda: driver.page_source,
+        # a tap on the status bar, which the app under test ignores
+        "clickGesture": lambda: driver.execute_script("mobile: clickGesture", {"x": x, "y": 10}),
+    }
+    try:
+        for route in ("appium", "direct"):
+            executor.route = route
+            for call in commands.values():
+                for _ in range(n):
+                    call()
+    finally:
+        executor.route = None
+        driver.quit()
+    return format_rows(sorted(executor.histograms.by_step().items()))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+    print(compare(int(sys.argv[1]), int(sys.argv[2]), sys.argv[3],
+                  int(sys.argv[4]) if len(sys.argv) > 4 else COMPARE_COMMANDS))
@@ -0,0 +1,167 @@
+"""
+UiAutomator2 settings profiles, switched per step.
+
+Before every lookup and click UiAutomator2 waits for the UI to go idle
+(up to waitForIdleTimeout, 10 s by default), and after an action it waits
+for the accessibility event that acknowledges it (actionAcknowledgment-
+Timeout, 3 s). The game screen animates continuously and never goes idle,
+so steps on it run both waits to their limit: most of the time the Quit
+lookup and the `Return to Menu` scroll take is spent there.
+
+A scenario defines named profiles and picks one per step; `profile:` at
+the top is the default for steps without one:
+
+    settings_profiles:
+      menu: {}
+      gameplay: {waitForIdleTimeout: 0, actionAcknowledgmentTimeout: 0}
+    profile: menu
+    loop:
+      - step: quit
+        profile: gameplay
+
+A profile lists only what it changes; every other setting a profile of
+the scenario uses is at its server default (DEFAULTS), so switching back
+restores them. ProfileSwitcher sends only the settings whose values
+differ from what the session has, in one request, and nothing when
+consecutive steps share a profile.
+
+    python uia2_settings.py <appium_port> <system_port> <udid> [scenario] [iterations]
+        step latency on a live device under each profile, and per step
+"""
+import copy
+import sys
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+# --- Configuration ---
+DEFAULTS = {                    # UiAutomator2 server defaults
+    "waitForIdleTimeout": 10000,
+    "waitForSelectorTimeout": 10000,
+    "actionAcknowledgmentTimeout": 3000,
+    "scrollAcknowledgmentTimeout": 200,
+    "keyInjectionDelay": 0,
+    "ignoreUnimportantViews": False,
+    "allowInvisibleElements": False,
+}
+DEFAULT_PROFILE = "defaults"    # the server defaults, always available
+BENCH_ITERATIONS = 10
+BENCH_DIR = "settings_bench"    # telemetry and histograms of benchmark runs, apart from the fleet's
+
+
+def check_profiles(profiles):
+    """
+    {name: {setting: value}} with every setting any profile uses filled in
+    from DEFAULTS; raises ValueError for an unknown setting.
+    """
+    profiles = dict(profiles or {})
+    used = set()
+    for name, values in profiles.items():
+        if not isinstance(values, dict):
+            raise ValueError(f"settings profile {name}: expected a mapping, got {values!r}")
+        unknown = set(values) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"settings profile {name}: unknown setting(s) {sorted(unknown)}")
+        used |= set(values)
+    profiles.setdefault(DEFAULT_PROFILE, {})
+    return {name: {key: values.get(key, DEFAULTS[key]) for key in sorted(used)}
+            for name, values in profiles.items()}
+
+
+class ProfileSwitcher:
+    """
+    Keeps one session on the profile of the current step. The session's
+    settings are read once, so a reattached session that was left on
+    another profile is switched correctly too.
+    """
+
+    def __init__(self, driver, profiles, udid=None):
+        self.driver = driver
+        self.profiles = profiles
+        self.udid = udid
+        self.current = None
+        self.switches = 0
+        try:
+            self.sent = dict(driver.get_settings() or {})
+        except WebDriverException:
+            self.sent = {}
+
+    def use(self, name):
+        if name is None:
+            name = DEFAULT_PROFILE
+        if name == self.current:
+            return
+        self.current = name
+        changes = {key: value for key, value in self.profiles[name].items()
+                   if self.sent.get(key, DEFAULTS[key]) != value}
+        if not changes:
+            return
+        try:
+            self.driver.update_settings(changes)
+        except WebDriverException as e:
+            print(f"[{self.udid}] WARNING: settings profile {name} not applied: {e}")
+            return
+        self.sent.update(changes)
+        self.switches += 1
+
+
+# -- benchmark ----------------------------------------------------------
+
+def _forced(plan, name):
+    """
+    A copy of `plan` with every step on profile `name`.
+    """
+    import scenario_engine
+    forced = copy.deepcopy(plan)
+    forced.profile = name
+    for op in forced.setup + forced.loop:
+        for part in scenario_engine._parts(op):
+            part.profile = name
+    return forced
+
+
+def benchmark(appium_port, system_port, udid, scenario="play", iterations=BENCH_ITERATIONS):
+    """
+    Runs `scenario` on a live device under each of its profiles forced on
+    every step, then with the profiles as written, and returns the step
+    latencies side by side.
+    """
+    from appium.options.android import UiAutomator2Options
+    import scenario_engine
+    from latency_histogram import HistogramSet, format_rows
+
+    plan = scenario_engine.compile_scenario(scenario_engine.load_scenario(scenario))
+    opts = UiAutomator2Options()
+    opts.udid = udid
+    opts.app_package = plan.package
+    opts.app_activity = plan.activity
+    opts.set_capability("systemPort", system_port)
+    driver = scenario_engine._connect(f"http://127.0.0.1:{appium_port}", system_port, opts)
+    results = HistogramSet()
+    summary = []
+    variants = [(name, _forced(plan, name)) for name in plan.settings_profiles] + [("per step", plan)]
+    try:
+        for name, variant in variants:
+            run = scenario_engine.ScenarioRun(variant, udid, driver, 0, out_dir=BENCH_DIR)
+            t0 = time.perf_counter()
+            try:
+                run.run(max_iterations=iterations)
+            finally:
+                run.watchdog.stop()
+                run.telemetry.close()
+            summary.append(f"{name}: {iterations} iterations in {time.perf_counter() - t0:.1f}s, "
+                           f"{run.profiles.switches if run.profiles else 0} settings update(s)")
+            for step, h in run.histograms.by_step().items():
+                results.histograms[(udid, f"{step} [{name}]")] = h
+    finally:
+        driver.quit()
+    return "\n".join(summary + [format_rows(sorted(results.by_step().items()))])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+    print(benchmark(int(sys.argv[1]), int(sys.argv[2]), sys.argv[3],
+                    sys.argv[4] if len(sys.argv) > 4 else "play",
+                    int(sys.argv[5]) if len(sys.argv) > 5 else BENCH_ITERATIONS))
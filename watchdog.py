@@ -0,0 +1,199 @@
+"""
+Per-step deadlines and a hung-call watchdog.
+
+webdriver.Remote has no request timeout of its own, so a wedged
+UiAutomator2 server or a USB stall can block terminate_app or
+find_elements forever while the worker process still looks alive. Two
+layers deal with that:
+
+In the worker, StepWatchdog is armed by ScenarioRun for every step with
+that step's deadline (`deadline:` in the scenario, else STEP_DEADLINES
+by kind). While armed, every HTTP call of the driver gets the deadline
+as its read timeout, and a monitor thread shuts down the driver's sockets
+once the step overruns, so the blocked call raises and the step's normal
+failure path runs. The step is recorded with the HUNG outcome. After
+HANGS_BEFORE_RESTART hung steps without a clean iteration in between,
+SessionHung ends the session and run_scenario starts a new one.
+
+In the orchestrator, terminate_stalled() stops worker processes whose
+devices have put nothing in the run ledger for STALL_TIMEOUT seconds
+(stuck outside HTTP, e.g. in adb); respawn_dead() then restarts them.
+
+    python watchdog.py [telemetry_dir]     hangs and time lost per device
+"""
+import socket
+import sys
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from http_transport import tracked_pool
+from telemetry_store import (TELEMETRY_DIR, HUNG, STEPS, STEP_NAMES, column, load)
+
+# --- Configuration ---
+STEP_DEADLINES = {              # seconds, on top of the step's own waits and pauses
+    "click": 20,
+    "tap_chain": 20,
+    "gesture": 30,
+    "relaunch": 60,
+    "hook": 30,
+    "webview_ad": 60,
+    "sleep": 10,
+}
+SESSION_DEADLINE = 180          # creating a session (installs the server on first use)
+IDLE_TIMEOUT = 120              # HTTP read timeout while no step is armed
+QUIT_DEADLINE = 20
+CHECK_INTERVAL = 1.0            # how often the monitor looks at the armed step
+HANGS_BEFORE_RESTART = 3        # hung steps without a clean iteration before a new session
+STALL_TIMEOUT = 600             # orchestrator: seconds without a ledger row before a kill
+
+
+class SessionHung(Exception):
+    """
+    The session keeps hanging; run_scenario replaces it.
+    """
+
+
+class StepWatchdog:
+    """
+    One per ScenarioRun. arm(step, deadline) before a step, disarm() after;
+    disarm() returns True when the step hung. iteration_done() after each
+    iteration.
+    """
+
+    def __init__(self, driver, udid, clock=None):
+        self.udid = udid
+        self.clock = clock
+        self.hangs = 0
+        self.consecutive = 0
+        self.lost = 0.0
+        self._clean = True
+        self._executor = driver.command_executor
+        # http_transport.TunedConnection keeps its own; for the stock one new
+        # pools record their connections so a blocked read can be cut
+        self._sockets = getattr(self._executor, "sockets", None)
+        if self._sockets is None:
+            self._sockets = weakref.WeakSet()
+            pool_manager = self._executor._conn
+            pool_manager.pool_classes_by_scheme = dict(pool_manager.pool_classes_by_scheme,
+                                                       http=tracked_pool(self._sockets))
+            pool_manager.clear()
+        self._lock = threading.Lock()
+        self._step = None
+        self._deadline = 0.0
+        self._t0 = 0.0
+        self._hung = False
+        self._stopped = threading.Event()
+        self._set_timeout(IDLE_TIMEOUT)
+        threading.Thread(target=self._monitor, name=f"watchdog-{udid}", daemon=True).start()
+
+    def _set_timeout(self, seconds):
+        self._executor._client_config.timeout = seconds
+
+    def arm(self, step, deadline):
+        with self._lock:
+            self._step, self._deadline, self._t0, self._hung = step, deadline, time.time(), False
+        # the monitor cancels first and marks the step; the read timeout is the backstop
+        self._set_timeout(deadline + 2 * CHECK_INTERVAL)
+
+    def disarm(self):
+        with self._lock:
+            step, hung, elapsed = self._step, self._hung, time.time() - self._t0
+            self._step = None
+        self._set_timeout(IDLE_TIMEOUT)
+        if not hung:
+            return False
+        self._clean = False
+        self.hangs += 1
+        self.consecutive += 1
+        self.lost += elapsed
+        print(f"[{self.udid}] HUNG: '{step}' cancelled after {elapsed:.1f}s "
+              f"({self.hangs} hangs, {self.lost:.0f}s lost so far)")
+        if self.consecutive >= HANGS_BEFORE_RESTART:
+            raise SessionHung(f"{self.consecutive} hung steps without a clean iteration")
+        return True
+
+    def iteration_done(self):
+        if self._clean:
+            self.consecutive = 0
+        self._clean = True
+
+    def cancel(self):
+        """
+        Shuts down every socket of the driver; a blocked read returns at once.
+        Idle pooled connections are reopened on their next use.
+        """
+        for conn in list(self._sockets):
+            sock = getattr(conn, "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _monitor(self):
+        while not self._stopped.wait(CHECK_INTERVAL):
+            with self._lock:
+                overdue = self._step is not None and time.time() - self._t0 > self._deadline
+                if overdue and not self._hung:
+                    self._hung = True
+                    if self.clock is not None:
+                        self.clock.override = HUNG
+                    print(f"[{self.udid}] WARNING: '{self._step}' passed its {self._deadline:.0f}s deadline")
+            if overdue:
+                # again on every tick: a retried request opens a new connection
+                self.cancel()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def terminate_stalled(procs, last_progress, timeout=STALL_TIMEOUT):
+    """
+    Terminates worker processes (see thread_workers) that host a device
+    with no ledger row for `timeout` seconds. `last_progress` is
+    RunLedger.last_progress. A thread-mode group goes down as a whole.
+    """
+    now = time.time()
+    for p in procs:
+        if not p.is_alive():
+            continue
+        for udid, _args in p.group:
+            idle = now - max(last_progress.get(udid, 0.0), p.started)
+            if idle > timeout:
+                print(f"Worker {p.name}: no progress from {udid} for {idle:.0f}s; terminating")
+                p.terminate()
+                break
+
+
+def report(directory=TELEMETRY_DIR):
+    segments = load(directory)
+    if not segments:
+        print(f"No telemetry in {directory}")
+        return
+    steps = column(segments, "step")
+    devices = column(segments, "device")
+    outcomes = column(segments, "outcome")
+    durations = column(segments, "duration")
+    starts = column(segments, "start")
+    hung = outcomes == HUNG
+    print(f"{'device':<8} {'hangs':>6} {'lost s':>9} {'lost %':>7}  worst step")
+    for dev in np.unique(devices):
+        mask = devices == dev
+        dev_hung = mask & hung
+        lost = float(durations[dev_hung].sum())
+        span = max(1e-9, float(starts[mask].max() - starts[mask].min()))
+        worst = ""
+        if dev_hung.any():
+            ids, counts = np.unique(steps[dev_hung], return_counts=True)
+            worst = STEP_NAMES.get(int(ids[counts.argmax()]), "?")
+        print(f"{int(dev):<8} {int(dev_hung.sum()):>6} {lost:>9.1f} {100 * lost / span:>7.2f}  {worst}")
+    total_hung = int(hung.sum())
+    iterations = int(np.count_nonzero(steps == STEPS["iteration"]))
+    print(f"{total_hung} hung steps, {float(durations[hung].sum()):.0f}s lost, over {iterations} iterations")
+
+
+if __name__ == "__main__":
+    report(sys.argv[1] if len(sys.argv) > 1 else TELEMETRY_DIR)
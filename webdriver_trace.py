@@ -0,0 +1,354 @@
+"""
+Record and replay WebDriver traffic.
+
+record: a proxy in front of an Appium server logs every request and
+response with its latency to a gzip'd JSON-lines trace; point a worker
+at the proxy port instead of the server. The scripts do this themselves
+with RECORD_TRACES = True (proxy on the odd port next to each server).
+
+replay: a server that answers from a trace with the recorded responses
+and latencies (optionally scaled). Requests are matched by method, path
+and body; if the loop now sends something the trace does not have, the
+closest recorded command (same method and path shape) answers, else a
+response that fits the command (no such element for a lookup, an empty
+page source, a phone-sized window, an empty success
+otherwise), and the miss is counted.
+
+check: replays a trace against a scenario for N iterations and prints
+step latencies, so changes to the loop, finder or waits can be compared
+offline on real-world timings. Its telemetry and histograms go under
+CHECK_DIR, apart from the fleet's.
+
+    python webdriver_trace.py record <listen_port> <appium_port> <trace>
+    python webdriver_trace.py replay <trace> [port] [scale]
+    python webdriver_trace.py info <trace>
+    python webdriver_trace.py check <trace> <scenario> [iterations] [scale]
+"""
+import collections
+import gzip
+import http.client
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+TRACE_DIR = "traces"
+REPLAY_PORT = 4799
+CHECK_SLEEP_SCALE = 0.02        # scenario sleeps are scaled by this in `check`
+CHECK_DIR = "trace_checks"      # telemetry and histograms of `check` runs
+MISS_WINDOW = {"x": 0, "y": 0, "width": 1080, "height": 2340}     # window rect when the trace has none
+
+_SESSION_RE = re.compile(r"^/session/([^/]+)")
+_ELEMENT_RE = re.compile(r"/element/[^/]+")
+
+
+def trace_path(udid):
+    return os.path.join(TRACE_DIR, f"{udid}-{time.strftime('%Y%m%d-%H%M%S')}.trace.gz")
+
+
+def _decode(raw):
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw.decode("utf-8", "replace")
+
+
+# -- recording ----------------------------------------------------------
+
+class TraceWriter:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._t0 = time.time()
+        self.count = 0
+
+    def write(self, started, latency, method, path, request, status, response):
+        row = {"t": round(started - self._t0, 4), "ms": round(latency * 1000, 2), "m": method,
+               "p": path, "q": request, "s": status, "r": response}
+        line = json.dumps(row, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _proxy_handler(upstream_port, writer):
+    local = threading.local()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True      # headers and body go out in separate writes
+
+        def _forward(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            conn = getattr(local, "conn", None)
+            if conn is None:
+                conn = local.conn = http.client.HTTPConnection("127.0.0.1", upstream_port, timeout=600)
+            started = time.time()
+            t0 = time.perf_counter()
+            try:
+                conn.request(method, self.path, body=body or None,
+                             headers={"Content-Type": "application/json; charset=utf-8"})
+                resp = conn.getresponse()
+                payload = resp.read()
+                status = resp.status
+            except (OSError, http.client.HTTPException) as e:
+                local.conn = None
+                payload = json.dumps({"value": {"error": "unknown error", "message": f"proxy: {e}",
+                                                "stacktrace": ""}}).encode()
+                status = 500
+            latency = time.perf_counter() - t0
+            writer.write(started, latency, method, self.path, _decode(body), status, _decode(payload))
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._forward("GET")
+
+        def do_POST(self):
+            self._forward("POST")
+
+        def do_DELETE(self):
+            self._forward("DELETE")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_recorder(listen_port, upstream_port, path):
+    """
+    Starts a recording proxy on a daemon thread; returns (server, writer).
+    Call writer.close() after server.shutdown() to finish the file.
+    """
+    writer = TraceWriter(path)
+    server = ThreadingHTTPServer(("127.0.0.1", listen_port), _proxy_handler(upstream_port, writer))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Recording :{listen_port} → :{upstream_port} into {path}")
+    return server, writer
+
+
+# -- replay -------------------------------------------------------------
+
+def load_trace(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _normalise(path):
+    path = path.split("?", 1)[0].rstrip("/")
+    if path.startswith("/wd/hub"):
+        path = path[len("/wd/hub"):]
+    return _SESSION_RE.sub("/session/{session}", path)
+
+
+def _shape(path):
+    return _ELEMENT_RE.sub("/element/{element}", path)
+
+
+def _canonical(body):
+    return json.dumps(body, sort_keys=True) if body not in (None, "", {}) else ""
+
+
+def _miss(method, path):
+    """
+    (status, response) for a request the trace has nothing for.
+    """
+    if method == "POST" and path.endswith("/element"):
+        return 404, {"value": {"error": "no such element", "message": "not in the trace", "stacktrace": ""}}
+    if method == "POST" and path.endswith("/elements"):
+        return 200, {"value": []}
+    if method == "GET" and path.endswith("/source"):
+        return 200, {"value": ""}
+    if method == "GET" and path.endswith(("/window/rect", "/window/size")):
+        return 200, {"value": MISS_WINDOW}
+    return 200, {"value": None}
+
+
+class Replay:
+    """
+    Recorded responses indexed by exact request and by command shape, each
+    served in recorded order and cycled when the loop runs longer than the
+    recording did.
+    """
+
+    def __init__(self, rows, scale=1.0):
+        self.scale = scale
+        self.exact = collections.defaultdict(list)
+        self.shape = collections.defaultdict(list)
+        for row in rows:
+            path = _normalise(row["p"])
+            entry = (row["ms"] / 1000.0, row["s"], row["r"])
+            self.exact[(row["m"], path, _canonical(row["q"]))].append(entry)
+            self.shape[(row["m"], _shape(path))].append(entry)
+        self._cursor = collections.Counter()
+        self._lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def _next(self, index, key):
+        entries = index.get(key)
+        if not entries:
+            return None
+        with self._lock:
+            i = self._cursor[(id(index), key)]
+            self._cursor[(id(index), key)] = i + 1
+        return entries[i % len(entries)]
+
+    def answer(self, method, path, body):
+        path = _normalise(path)
+        entry = self._next(self.exact, (method, path, _canonical(body)))
+        kind = "exact"
+        if entry is None:
+            entry, kind = self._next(self.shape, (method, _shape(path))), "shape"
+        if entry is None:
+            entry, kind = (0.0, *_miss(method, path)), "miss"
+        self.stats[kind] += 1
+        latency, status, response = entry
+        if self.scale:
+            time.sleep(latency * self.scale)
+        return status, response
+
+
+def _replay_handler(replay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True      # headers and body go out in separate writes
+
+        def _reply(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = _decode(self.rfile.read(length)) if length else None
+            status, response = replay.answer(method, self.path, body)
+            payload = (json.dumps(response) if not isinstance(response, str) else response).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._reply("GET")
+
+        def do_POST(self):
+            self._reply("POST")
+
+        def do_DELETE(self):
+            self._reply("DELETE")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve_replay(path, port=REPLAY_PORT, scale=1.0, background=False):
+    replay = Replay(load_trace(path), scale)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _replay_handler(replay))
+    server.daemon_threads = True
+    print(f"Replaying {path} on :{port} (latency x{scale})")
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, replay
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(dict(replay.stats))
+
+
+# -- reports ------------------------------------------------------------
+
+def info(path):
+    rows = load_trace(path)
+    by_command = collections.defaultdict(list)
+    for row in rows:
+        by_command[(row["m"], _shape(_normalise(row["p"])))].append(row["ms"])
+    span = rows[-1]["t"] - rows[0]["t"] if rows else 0
+    lines = [f"{len(rows)} requests over {span:.0f}s",
+             f"{'command':<52} {'n':>6} {'p50 ms':>8} {'p90 ms':>8} {'max ms':>8}"]
+    for (method, path), ms in sorted(by_command.items(), key=lambda kv: -sum(kv[1])):
+        ms.sort()
+        lines.append(f"{method + ' ' + path:<52} {len(ms):>6} {ms[len(ms) // 2]:>8.1f} "
+                     f"{ms[int(len(ms) * 0.9)]:>8.1f} {ms[-1]:>8.1f}")
+    return "\n".join(lines)
+
+
+def check(path, scenario, iterations=5, scale=1.0, port=REPLAY_PORT):
+    """
+    Runs `scenario` against a replay of `path` for a number of iterations
+    and returns the per-step latency table. Sleeps in the scenario are
+    scaled by CHECK_SLEEP_SCALE; app relaunches go through WebDriver.
+    """
+    from appium import webdriver
+    from appium.options.android import UiAutomator2Options
+    import scenario_engine
+    from latency_histogram import format_rows
+
+    server, replay = serve_replay(path, port, scale, background=True)
+    plan = scenario_engine.compile_scenario(scenario_engine.load_scenario(scenario))
+    plan.startup_mode = None
+    plan.app_metrics = False
+    for op in plan.setup + plan.loop:
+        for sleep in ([op.pause] if isinstance(op, scenario_engine.TapChain) else [op]):
+            if isinstance(sleep, scenario_engine.Sleep):
+                sleep.low *= CHECK_SLEEP_SCALE
+                sleep.high *= CHECK_SLEEP_SCALE
+        if isinstance(op, scenario_engine.Relaunch):
+            op.pause *= CHECK_SLEEP_SCALE
+
+    opts = UiAutomator2Options()
+    opts.udid = "replay"
+    driver = webdriver.Remote(f"http://127.0.0.1:{port}", options=opts)
+    run = scenario_engine.ScenarioRun(plan, "replay", driver, 0, out_dir=CHECK_DIR)
+    t0 = time.perf_counter()
+    try:
+        run.run(max_iterations=iterations)
+    finally:
+        elapsed = time.perf_counter() - t0
+        run.telemetry.close()
+        server.shutdown()
+    table = format_rows(sorted(run.histograms.by_step().items()))
+    return (f"{iterations} iterations in {elapsed:.2f}s, requests {dict(replay.stats)}\n{table}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    command = sys.argv[1]
+    if command == "record":
+        server, writer = start_recorder(int(sys.argv[2]), int(sys.argv[3]), sys.argv[4])
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.shutdown()
+            writer.close()
+            print(f"{writer.count} requests recorded")
+    elif command == "replay":
+        serve_replay(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else REPLAY_PORT,
+                     float(sys.argv[4]) if len(sys.argv) > 4 else 1.0)
+    elif command == "info":
+        print(info(sys.argv[2]))
+    elif command == "check":
+        print(check(sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 5,
+                    float(sys.argv[5]) if len(sys.argv) > 5 else 1.0))
+    else:
+        print(__doc__)
+        sys.exit(1)
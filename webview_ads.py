@@ -0,0 +1,205 @@
+"""
+WebView ad locator.
+
+All candidate selectors are checked in one execute_script round trip inside
+the page; the first one that resolves to a visible, unobstructed element is
+returned and clicked. Selectors are tried in order of their hit rate for
+the app, and the WEBVIEW context name is cached per device instead of
+asking for driver.contexts every iteration.
+"""
+import contextlib
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:             # Windows
+    fcntl = None
+    import msvcrt
+
+from selenium.common.exceptions import WebDriverException
+
+# --- Configuration ---
+AD_STATS_DIR = "ad_stats"
+AD_SELECTORS = [
+    ("css", "ins.adsbygoogle"),
+    ("css", "iframe[src*='ad']"),
+    ("css", "div[class*='ad']"),
+    ("xpath", "//iframe"),
+    ("xpath", "//*[contains(@class,'ad')]"),
+]
+
+# arguments[0] = [[kind, selector], ...]; returns [index, element] or null
+PROBE_SCRIPT = """
+var candidates = arguments[0];
+function visible(el) {
+  var r = el.getBoundingClientRect();
+  if (r.width <= 0 || r.height <= 0) return false;
+  if (r.bottom < 0 || r.right < 0 || r.top > window.innerHeight || r.left > window.innerWidth) return false;
+  var s = window.getComputedStyle(el);
+  if (s.visibility === 'hidden' || s.display === 'none' || parseFloat(s.opacity) === 0) return false;
+  var cx = Math.min(Math.max(r.left + r.width / 2, 0), window.innerWidth - 1);
+  var cy = Math.min(Math.max(r.top + r.height / 2, 0), window.innerHeight - 1);
+  var hit = document.elementFromPoint(cx, cy);
+  return hit === el || el.contains(hit) || (hit && hit.contains(el));
+}
+for (var i = 0; i < candidates.length; i++) {
+  var kind = candidates[i][0], sel = candidates[i][1], nodes = [];
+  try {
+    if (kind === 'css') {
+      nodes = document.querySelectorAll(sel);
+    } else {
+      var it = document.evaluate(sel, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+      for (var k = 0; k < it.snapshotLength; k++) nodes.push(it.snapshotItem(k));
+    }
+  } catch (e) { continue; }
+  for (var j = 0; j < nodes.length; j++) {
+    if (nodes[j].nodeType === 1 && visible(nodes[j])) return [i, nodes[j]];
+  }
+}
+return null;
+"""
+
+
+_save_lock = threading.Lock()  # device threads of one process (thread worker mode)
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """
+    Holds an exclusive lock on `path` (created if missing) against other
+    worker processes.
+    """
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class AdSelectorStats:
+    """
+    Hit/try counts per selector for one app package. save() merges our
+    deltas into whatever other workers have written meanwhile, under a
+    lock, since every device running the package shares the file.
+    """
+
+    def __init__(self, package, stats_dir=AD_STATS_DIR, selectors=AD_SELECTORS):
+        self.path = os.path.join(stats_dir, f"{package}.json")
+        self.selectors = [tuple(s) for s in selectors]
+        self.counts = self._load()
+        self._delta = {}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return {k: list(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(selector):
+        return f"{selector[0]}:{selector[1]}"
+
+    def ordered(self):
+        """
+        Selectors by Laplace-smoothed hit rate, best first; ties keep the
+        configured order.
+        """
+        def rate(sel):
+            hits, tries = self.counts.get(self.key(sel), (0, 0))
+            return (hits + 1) / (tries + 2)
+        return sorted(self.selectors, key=rate, reverse=True)
+
+    def record(self, tried, hit_index):
+        """
+        `tried` is the order the probe used; everything before `hit_index`
+        missed. hit_index None means nothing matched.
+        """
+        upto = len(tried) if hit_index is None else hit_index + 1
+        for i, sel in enumerate(tried[:upto]):
+            k = self.key(sel)
+            for table in (self.counts, self._delta):
+                row = table.setdefault(k, [0, 0])
+                row[1] += 1
+                if i == hit_index:
+                    row[0] += 1
+
+    def save(self):
+        if not self._delta:
+            return
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with _save_lock, _file_lock(self.path + ".lock"):
+            merged = self._load()
+            for k, (hits, tries) in self._delta.items():
+                row = merged.setdefault(k, [0, 0])
+                row[0] += hits
+                row[1] += tries
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(merged, f, indent=1)
+            os.replace(tmp, self.path)
+        self.counts, self._delta = merged, {}
+
+
+class WebViewAdLocator:
+    """
+    One per device session.
+    """
+
+    def __init__(self, driver, udid, stats):
+        self.driver = driver
+        self.udid = udid
+        self.stats = stats
+        self._webview = None
+
+    def _switch_to_webview(self):
+        if self._webview is not None:
+            try:
+                self.driver.switch_to.context(self._webview)
+                return True
+            except WebDriverException:
+                self._webview = None  # app restarted with a new WebView pid
+        contexts = self.driver.contexts
+        webview = next((c for c in contexts if "WEBVIEW" in c), None)
+        if webview is None:
+            print(f"[{self.udid}] !! no WEBVIEW context found (contexts = {contexts})")
+            return False
+        self.driver.switch_to.context(webview)
+        self._webview = webview
+        print(f"[{self.udid}] → cached WEBVIEW context {webview}")
+        return True
+
+    def click_ad(self):
+        """
+        Switches into the WebView, probes every selector in one script call,
+        clicks the first visible match and switches back to NATIVE_APP.
+        Returns the selector that was clicked, or None.
+        """
+        if not self._switch_to_webview():
+            return None
+        try:
+            order = self.stats.ordered()
+            found = self.driver.execute_script(PROBE_SCRIPT, [list(s) for s in order])
+            hit_index = found[0] if found else None
+            self.stats.record(order, hit_index)
+            if found is None:
+                print(f"[{self.udid}] !! no ad element matched any selector")
+                return None
+            found[1].click()
+            print(f"[{self.udid}] → clicked ad with {order[hit_index][0]}={order[hit_index][1]}")
+            return order[hit_index]
+        finally:
+            self.driver.switch_to.context("NATIVE_APP")
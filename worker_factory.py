@@ -0,0 +1,58 @@
+"""
+Worker factory: which start method new device workers use.
+
+With "forkserver" a template process is started once, imports
+PRELOAD_MODULES (the Appium/Selenium stack every worker needs) and then
+forks each new or restarted worker from itself, so a worker starts with
+those modules already loaded instead of importing them again. It also
+avoids forking the orchestrator itself, which by then runs the ledger
+writer thread. "fork" and "spawn" are the plain multiprocessing methods;
+None keeps the platform default.
+"""
+import multiprocessing
+import time
+
+# --- Configuration ---
+START_METHOD = "forkserver"
+PRELOAD_MODULES = [
+    "__main__",
+    "appium.webdriver",
+    "appium.options.android",
+    "appium.webdriver.common.appiumby",
+    "selenium.webdriver.support.ui",
+    "selenium.webdriver.support.expected_conditions",
+    "numpy",
+]
+
+
+def worker_context(start_method=START_METHOD, preload=PRELOAD_MODULES):
+    """
+    multiprocessing context for device workers. Falls back to the platform
+    default when `start_method` is not available here (no forkserver on
+    Windows).
+    """
+    if start_method is None:
+        return multiprocessing.get_context()
+    if start_method not in multiprocessing.get_all_start_methods():
+        print(f"Start method {start_method!r} not available, using "
+              f"{multiprocessing.get_start_method()!r}")
+        return multiprocessing.get_context()
+    ctx = multiprocessing.get_context(start_method)
+    if start_method == "forkserver" and preload:
+        ctx.set_forkserver_preload(list(preload))
+    return ctx
+
+
+def warm(ctx):
+    """
+    Starts the forkserver template now (it otherwise starts on the first
+    Process.start()) and returns how long it took, in seconds, until the
+    preloaded modules were imported: a no-op worker is forked and joined.
+    """
+    if ctx.get_start_method() != "forkserver":
+        return 0.0
+    t0 = time.perf_counter()
+    p = ctx.Process(target=time.sleep, args=(0,), daemon=True)
+    p.start()
+    p.join()
+    return time.perf_counter() - t0